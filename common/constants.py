@@ -33,5 +33,20 @@ MIN_EVALUATION_PERIOD = datetime.timedelta(minutes=60)
 # Miner compressed index cache freshness.
 MINER_CACHE_FRESHNESS = datetime.timedelta(minutes=20)
 
+# Oldest persisted compressed index snapshot the miner will serve after a restart while it rebuilds the index.
+MINER_INDEX_SNAPSHOT_MAX_AGE = datetime.timedelta(hours=2)
+
+# How often the validator snapshots its miner indexes to disk, so a restart does not have to re-query every miner.
+VALIDATOR_INDEX_SNAPSHOT_PERIOD = datetime.timedelta(minutes=15)
+
+# Miner indexes last updated longer ago than this are not restored from a validator index snapshot.
+VALIDATOR_INDEX_SNAPSHOT_MAX_MINER_AGE = datetime.timedelta(hours=4)
+
+# How often the miner recomputes its running total of stored content size to correct any drift.
+MINER_CONTENT_SIZE_RECONCILIATION_PERIOD = datetime.timedelta(hours=6)
+
+# How many recently stored URIs the miner remembers in order to skip rewriting unchanged re-scraped entities.
+MINER_KNOWN_URI_FILTER_CAPACITY = 200_000
+
 # Date after which only x.com URLs are accepted
 NO_TWITTER_URLS_DATE = datetime.datetime(2024, 12, 28, tzinfo=datetime.timezone.utc)  # December 28, 2024 UTC
\ No newline at end of file
@@ -38,6 +38,20 @@ def datetime_from_hours_since_epoch(hours: int) -> dt.datetime:
     return dt.datetime.fromtimestamp(hours * 3600, tz=dt.timezone.utc)
 
 
+_EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+_MICROSECOND = dt.timedelta(microseconds=1)
+
+
+def datetime_to_epoch_micros(datetime: dt.datetime) -> int:
+    """Returns the microseconds since epoch of the provided datetime, treating naive datetimes as local time like TimeBucket."""
+    return (datetime.astimezone(tz=dt.timezone.utc) - _EPOCH) // _MICROSECOND
+
+
+def datetime_from_epoch_micros(micros: int) -> dt.datetime:
+    """Returns a UTC datetime object from the provided microseconds since epoch."""
+    return _EPOCH + dt.timedelta(microseconds=micros)
+
+
 def is_miner(uid: int, metagraph: bt.metagraph) -> bool:
     """Checks if a UID on the subnet is a miner."""
     # Assume everyone who isn't a validator is a miner.
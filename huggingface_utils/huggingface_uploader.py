@@ -20,6 +20,14 @@ from huggingface_utils.encoding_system import EncodingKeyManager
 from common.data import HuggingFaceMetadata, DataSource
 from typing import List, Dict, Union, Any
 from huggingface_utils.dataset_card import DatasetCardGenerator, NumpyEncoder
+from common import utils
+from storage.miner.content_compression import load_content_compressor
+from storage.miner.sqlite_connection_pool import SCAN_PRAGMAS, apply_pragmas
+from storage.miner.storage_metadata import (
+    DATETIME_FORMAT_EPOCH_MICROS,
+    get_datetime_format,
+    is_datetime_migration_complete,
+)
 from requests.exceptions import RequestException
 from functools import wraps
 
@@ -66,13 +74,8 @@ class HuggingFaceUploader:
     def get_db_connection(self):
         conn = sqlite3.connect(self.db_path, timeout=60.0)  # Added timeout
         try:
-            # Enhanced optimization settings
-            conn.execute("PRAGMA journal_mode=WAL")
-            conn.execute("PRAGMA synchronous=NORMAL")
-            conn.execute("PRAGMA temp_store=MEMORY")
-            conn.execute("PRAGMA cache_size=-2000000")  # Increased to 2GB
-            conn.execute("PRAGMA page_size=16384")  # Optimized page size
-            conn.execute("PRAGMA mmap_size=30000000000")  # 30GB memory mapping
+            # Read-only with a small cache of its own, so export scans don't evict the pages the miner serves from.
+            apply_pragmas(conn, SCAN_PRAGMAS)
             yield conn
         finally:
             conn.close()
@@ -140,7 +143,8 @@ class HuggingFaceUploader:
         if last_upload is None:
             query = """
                 SELECT datetime, label, content
-                FROM DataEntity
+                FROM DataEntityWithContent
+                JOIN Label USING (labelId)
                 WHERE source = ?
                 ORDER BY datetime ASC
                 LIMIT 400000000
@@ -149,7 +153,8 @@ class HuggingFaceUploader:
         else:
             query = """
                 SELECT datetime, label, content
-                FROM DataEntity
+                FROM DataEntityWithContent
+                JOIN Label USING (labelId)
                 WHERE source = ?
                 AND datetime > ?
                 ORDER BY datetime ASC
@@ -157,15 +162,44 @@ class HuggingFaceUploader:
             params = [source, last_upload]
 
         with self.get_db_connection() as conn:
+            # Text and integer datetimes do not compare with each other, so only read once every row has one format.
+            if not is_datetime_migration_complete(conn):
+                return
+            # Content may be stored zstd compressed by the miner storage.
+            content_compressor = load_content_compressor(conn)
+            # Datetimes may be stored as integer microseconds since epoch by the miner storage.
+            datetime_format = get_datetime_format(conn)
+            if datetime_format == DATETIME_FORMAT_EPOCH_MICROS:
+                parse_dates = {'datetime': {'unit': 'us', 'utc': True}}
+            else:
+                # Text datetimes only include fractional seconds when they are non zero.
+                parse_dates = {'datetime': {'format': 'ISO8601', 'utc': True}}
+            if last_upload is not None:
+                params = [source, self.to_datetime_param(last_upload, datetime_format)]
             for chunk in pd.read_sql_query(
                     sql=query,
                     con=conn,
                     params=params,
                     chunksize=self.chunk_size,
-                    parse_dates=['datetime']
+                    parse_dates=parse_dates
             ):
+                chunk['content'] = chunk['content'].map(content_compressor.decompress)
                 yield chunk
 
+    def to_datetime_param(self, value: dt.datetime, datetime_format: str) -> Union[int, str]:
+        """Converts a datetime to the value stored in the DataEntity datetime column in the given format.
+
+        Naive datetimes, like the ones in the upload state, are treated as UTC.
+        """
+        value = pd.Timestamp(value)
+        if value.tzinfo is None:
+            value = value.tz_localize('UTC')
+        value = value.tz_convert('UTC').to_pydatetime()
+        if datetime_format == DATETIME_FORMAT_EPOCH_MICROS:
+            return utils.datetime_to_epoch_micros(value)
+        # Matches the text sqlite3 stores for timezone aware datetimes.
+        return value.isoformat(" ")
+
     def preprocess_data(self, df, source):
         if source == DataSource.REDDIT.value:
             return preprocess_reddit_df(df, self.encoding_key_manager, self.private_encoding_key_manager)
@@ -206,6 +240,15 @@ class HuggingFaceUploader:
             bt.logging.error("Hugging Face token not found. Please check your environment variables.")
             return []
 
+        # Text and integer datetimes neither compare nor parse alike, so wait for the whole table to be migrated.
+        with self.get_db_connection() as conn:
+            if not is_datetime_migration_complete(conn):
+                bt.logging.warning(
+                    "Skipping the HuggingFace upload until the migration to integer timestamps completes. "
+                    + "If it was interrupted, run scripts/migrate_miner_integer_timestamps.py again."
+                )
+                return []
+
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
@@ -138,6 +138,13 @@ def add_args(neuron_type: NeuronType, parser):
             default=False
         )
 
+        parser.add_argument(
+            "--neuron.numpy_validator_storage",
+            action="store_true",
+            help="Keep miner indexes in NumPy columns instead of an in-memory SQLite database. Index snapshots are not shared between the two.",
+            default=False,
+        )
+
     elif neuron_type == NeuronType.MINER:
         parser.add_argument(
             "--neuron.database_name",
@@ -155,6 +162,44 @@ def add_args(neuron_type: NeuronType, parser):
             default=250,
         )
 
+        parser.add_argument(
+            "--neuron.shard_database_by_day",
+            action="store_true",
+            help="Store data in one database file per UTC day inside a directory named after --neuron.database_name. "
+            + "Old data is dropped by deleting whole files. Not compatible with --huggingface.",
+            default=False,
+        )
+
+        parser.add_argument(
+            "--neuron.storage_reader_workers",
+            type=int,
+            help="The number of threads serving storage reads for validator requests.",
+            default=4,
+        )
+
+        parser.add_argument(
+            "--neuron.compress_content",
+            action="store_true",
+            help="Store new content zstd compressed using per source dictionaries. "
+            + "Use scripts/migrate_miner_content_compression.py to train dictionaries and compress existing content.",
+            default=False,
+        )
+
+        parser.add_argument(
+            "--neuron.integer_timestamps",
+            action="store_true",
+            help="Store DataEntity datetimes as integer microseconds since epoch when creating a new database. "
+            + "Use scripts/migrate_miner_integer_timestamps.py to migrate an existing database.",
+            default=False,
+        )
+
+        parser.add_argument(
+            "--neuron.split_content",
+            action="store_true",
+            help="Store content in a separate table from the DataEntity metadata when creating a new database.",
+            default=False,
+        )
+
         root_dir = Path(os.path.dirname(__file__)).parent
         default_file = os.path.join(
             os.path.join(root_dir, "scraping/config/scraping_config.json"),
@@ -25,7 +25,7 @@ import typing
 import bittensor as bt
 import datetime as dt
 from common import constants, utils
-from common.data import CompressedMinerIndex, TimeBucket
+from common.data import TimeBucket
 from common.protocol import (
     GetDataEntityBucket,
     GetMinerIndex,
@@ -38,6 +38,8 @@ from neurons.config import NeuronType
 from scraping.config.config_reader import ConfigReader
 from scraping.coordinator import ScraperCoordinator
 from scraping.provider import ScraperProvider
+from storage.miner.async_miner_storage import AsyncMinerStorage
+from storage.miner.sharded_sqlite_miner_storage import ShardedSqliteMinerStorage
 from storage.miner.sqlite_miner_storage import SqliteMinerStorage
 from neurons.config import NeuronType, check_config, create_config
 from huggingface_utils.huggingface_uploader import HuggingFaceUploader
@@ -59,6 +61,10 @@ class Miner:
         bt.logging(config=self.config, logging_dir=self.config.full_path)
         bt.logging.info(self.config)
         self.use_hf_uploader = self.config.huggingface
+        if self.use_hf_uploader and self.config.neuron.shard_database_by_day:
+            raise ValueError(
+                "--neuron.shard_database_by_day is not supported with --huggingface. The uploader reads a single database file."
+            )
         self.use_gravity_retrieval = self.config.gravity
 
         if self.config.offline:
@@ -148,15 +154,32 @@ class Miner:
             )
 
         # Instantiate storage.
-        self.storage = SqliteMinerStorage(
-            self.config.neuron.database_name,
-            self.config.neuron.max_database_size_gb_hint,
-        )
+        if self.config.neuron.shard_database_by_day:
+            self.storage = ShardedSqliteMinerStorage(
+                self.config.neuron.database_name,
+                self.config.neuron.max_database_size_gb_hint,
+                compress_content=self.config.neuron.compress_content,
+                integer_timestamps=self.config.neuron.integer_timestamps,
+                split_content=self.config.neuron.split_content,
+            )
+        else:
+            self.storage = SqliteMinerStorage(
+                self.config.neuron.database_name,
+                self.config.neuron.max_database_size_gb_hint,
+                compress_content=self.config.neuron.compress_content,
+                integer_timestamps=self.config.neuron.integer_timestamps,
+                split_content=self.config.neuron.split_content,
+            )
 
         bt.logging.success(
             f"Successfully connected to miner storage: {self.config.neuron.database_name}."
         )
 
+        # Serve validator requests from dedicated threads so reads never block the axon's event loop.
+        self.async_storage = AsyncMinerStorage(
+            self.storage, max_workers=self.config.neuron.storage_reader_workers
+        )
+
         # Configure the ScraperCoordinator
         bt.logging.info(
             f"Loading scraping config from {self.config.neuron.scraping_config_file}."
@@ -181,6 +204,8 @@ class Miner:
         """
         Refreshes the cached compressed miner index periodically off the hot path of GetMinerIndex requests.
         """
+        # Start from min so the running content size total is reconciled once on startup.
+        last_content_size_reconciliation = dt.datetime.min
         while not self.should_exit:
             try:
                 # Refresh the index if it hasn't been refreshed in the configured time period.
@@ -188,6 +213,14 @@ class Miner:
                     time_delta=constants.MINER_CACHE_FRESHNESS
                 )
                 bt.logging.trace("Refresh index thread finished refreshing the index.")
+
+                # Periodically correct any drift in the running total used for capacity checks.
+                if (
+                    dt.datetime.now() - last_content_size_reconciliation
+                    >= constants.MINER_CONTENT_SIZE_RECONCILIATION_PERIOD
+                ):
+                    self.storage.reconcile_content_size()
+                    last_content_size_reconciliation = dt.datetime.now()
                 # Wait freshness period + 1 minute to try refreshing again.
                 # Wait the additional minute to ensure that the next refresh sees a 'stale' index.
                 time.sleep(
@@ -352,6 +385,7 @@ class Miner:
             self.should_exit = True
             self.thread.join(5)
             self.compressed_index_refresh_thread.join(5)
+            self.async_storage.shutdown(wait=False)
             self.is_running = False
             bt.logging.debug("Stopped")
 
@@ -409,6 +443,17 @@ class Miner:
             f"Emission:{self.metagraph.E[self.uid]}"
         )
         bt.logging.info(log)
+        bt.logging.debug(
+            f"Storage connection pool: {self.storage.get_connection_pool_stats()}"
+        )
+        bt.logging.debug(f"Async storage: {self.async_storage.get_stats()}")
+        disk_usage = self.storage.get_disk_usage()
+        bt.logging.debug(
+            f"Storage disk usage: {disk_usage}, overhead ratio {disk_usage.overhead_ratio:.2f}"
+        )
+        bt.logging.debug(
+            f"Storage ingest: {self.scraping_coordinator.get_ingest_stats()}"
+        )
 
     async def get_index(self, synapse: GetMinerIndex) -> GetMinerIndex:
         """Runs after the GetMinerIndex synapse has been deserialized (i.e. after synapse.data is available)."""
@@ -421,14 +466,14 @@ class Miner:
             bt.logging.error(f"Unsupported protocol version: {synapse.version}.")
             return synapse
 
-        # Return the appropriate amount of max buckets based on protocol of the requesting validator.
-        compressed_index = self.storage.get_compressed_index(
-            bucket_count_limit=constants.DATA_ENTITY_BUCKET_COUNT_LIMIT_PER_MINER_INDEX_PROTOCOL_4
+        # The index is serialized once per refresh so every request shares the same payload.
+        serialized_index = await self.async_storage.get_serialized_compressed_index()
+        synapse.compressed_index_serialized = (
+            serialized_index.compressed_index_serialized
         )
-        synapse.compressed_index_serialized = compressed_index.model_dump_json()
         bt.logging.success(
-            f"Returning compressed miner index of {CompressedMinerIndex.size_bytes(compressed_index)} bytes "
-            + f"across {CompressedMinerIndex.bucket_count(compressed_index)} buckets to {synapse.dendrite.hotkey}."
+            f"Returning compressed miner index of {serialized_index.size_bytes} bytes "
+            + f"across {serialized_index.bucket_count} buckets to {synapse.dendrite.hotkey}."
         )
 
         synapse.version = constants.PROTOCOL_VERSION
@@ -452,8 +497,10 @@ class Miner:
         )
 
         # List all the data entities that this miner has for the requested DataEntityBucket.
-        synapse.data_entities = self.storage.list_data_entities_in_data_entity_bucket(
-            synapse.data_entity_bucket_id
+        synapse.data_entities = (
+            await self.async_storage.list_data_entities_in_data_entity_bucket(
+                synapse.data_entity_bucket_id
+            )
         )
         synapse.version = constants.PROTOCOL_VERSION
 
@@ -467,7 +514,7 @@ class Miner:
         bt.logging.info(f"Got a GetHuggingFaceMetadata request from {synapse.dendrite.hotkey}.")
 
         # Query the HuggingFace metadata from the database
-        synapse.metadata = self.storage.get_hf_metadata(unique_id=self.hf_uploader.unique_id)
+        synapse.metadata = await self.async_storage.get_hf_metadata(unique_id=self.hf_uploader.unique_id)
 
         if not synapse.metadata:
             bt.logging.info(f"No HuggingFace metadata available. Returning empty list to {synapse.dendrite.hotkey}.")
@@ -533,8 +580,10 @@ class Miner:
             return synapse
 
         # Get a dict of all the contents by DataEntityBucketId for the requested Buckets.
-        buckets_to_contents = self.storage.list_contents_in_data_entity_buckets(
-            synapse.data_entity_bucket_ids
+        buckets_to_contents = (
+            await self.async_storage.list_contents_in_data_entity_buckets(
+                synapse.data_entity_bucket_ids
+            )
         )
         synapse.bucket_ids_to_contents = [
             (k, v) for k, v in buckets_to_contents.items()
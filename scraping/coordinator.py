@@ -12,6 +12,7 @@ from pydantic import Field, PositiveInt, ConfigDict
 from common.data import DataLabel, DataSource, StrictBaseModel, TimeBucket
 from scraping.provider import ScraperProvider
 from scraping.scraper import ScrapeConfig, ScraperId
+from storage.miner.ingest_writer import IngestStats, IngestWriter
 from storage.miner.miner_storage import MinerStorage
 
 
@@ -155,6 +156,9 @@ class ScraperCoordinator:
         self.is_running = False
         self.queue = asyncio.Queue()
 
+        # Workers hand scraped entities to a single writer so they never block on storage themselves.
+        self.ingest_writer = IngestWriter(miner_storage)
+
     def run_in_background_thread(self):
         """
         Runs the Coordinator on a background thread. The coordinator will run until the process dies.
@@ -168,12 +172,21 @@ class ScraperCoordinator:
 
     def run(self):
         """Blocking call to run the Coordinator, indefinitely."""
-        asyncio.run(self._start())
+        self.ingest_writer.start()
+        try:
+            asyncio.run(self._start())
+        finally:
+            # Write everything the workers already scraped before exiting.
+            self.ingest_writer.stop()
 
     def stop(self):
         bt.logging.info("Stopping the ScrapingCoordinator.")
         self.is_running = False
 
+    def get_ingest_stats(self) -> IngestStats:
+        """Returns the counters of the stage writing scraped entities to storage."""
+        return self.ingest_writer.get_stats()
+
     async def _start(self):
         workers = []
         for i in range(self.max_workers):
@@ -205,7 +218,9 @@ class ScraperCoordinator:
                     # now rather than being lazily evaluated (if a lambda was used).
                     # https://pylint.readthedocs.io/en/latest/user_guide/messages/warning/cell-var-from-loop.html#cell-var-from-loop-w0640
                     bt.logging.trace(f"Adding scrape task for {scraper_id}: {config}.")
-                    self.queue.put_nowait(functools.partial(scraper.scrape, config))
+                    self.queue.put_nowait(
+                        (scraper_id, functools.partial(scraper.scrape, config))
+                    )
 
                 self.tracker.on_scrape_scheduled(scraper_id, now)
 
@@ -218,11 +233,12 @@ class ScraperCoordinator:
         while self.is_running:
             try:
                 # Wait for a scraping task to be added to the queue.
-                scrape_fn = await self.queue.get()
+                scraper_id, scrape_fn = await self.queue.get()
 
                 # Perform the scrape
                 data_entities = await scrape_fn()
-                self.storage.store_data_entities(data_entities)
+                # Waits only if the writer has fallen behind, applying backpressure to scraping.
+                await self.ingest_writer.submit_async(data_entities, scraper_id)
                 self.queue.task_done()
             except Exception as e:
                 bt.logging.error("Worker " + name + ": " + traceback.format_exc())
@@ -0,0 +1,99 @@
+"""
+Benchmarks reading a single large DataEntityBucket, comparing validated DataEntity construction (the previous
+read path) with the unvalidated read path used by SqliteMinerStorage.
+
+Run from the repository root:
+    python -m scripts.benchmarks.benchmark_bucket_read --entity_count 100000
+"""
+import argparse
+
+from common import constants
+from common.data import DataEntity, DataEntityBucketId, DataLabel, DataSource
+from common.protocol import GetDataEntityBucket
+from scripts.benchmarks.benchmark_utils import (
+    generate_entities,
+    remove_database,
+    store_in_batches,
+    time_it,
+)
+from storage.miner.sqlite_miner_storage import SqliteMinerStorage
+
+
+def list_validated(storage: SqliteMinerStorage, bucket_id: DataEntityBucketId):
+    """The previous read path, which validates a DataEntity, DataSource and DataLabel per row."""
+    label = "NULL" if bucket_id.label is None else bucket_id.label.value
+    with storage.connection_pool.reader() as connection:
+        cursor = connection.execute(
+            """SELECT * FROM DataEntity JOIN Label USING (labelId)
+                WHERE timeBucketId = ? AND source = ? AND label = ?""",
+            [bucket_id.time_bucket.id, bucket_id.source, label],
+        )
+        data_entities = []
+        running_size = 0
+        for row in cursor:
+            if running_size >= constants.DATA_ENTITY_BUCKET_SIZE_LIMIT_BYTES:
+                break
+            data_entities.append(
+                DataEntity(
+                    uri=row["uri"],
+                    datetime=row["datetime"],
+                    source=DataSource(row["source"]),
+                    content=storage.content_compressor.decompress(row["content"]),
+                    content_size_bytes=row["contentSizeBytes"],
+                    label=(
+                        DataLabel(value=row["label"]) if row["label"] != "NULL" else None
+                    ),
+                )
+            )
+            running_size += row["contentSizeBytes"]
+        cursor.close()
+        return data_entities
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entity_count", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    database = "BenchmarkBucketRead.sqlite"
+    remove_database(database)
+    storage = SqliteMinerStorage(database)
+    try:
+        # Put every entity into one hour with a single label so the buckets are as large as realistic buckets.
+        store_in_batches(
+            storage,
+            generate_entities(args.entity_count, hours=1, labels=["benchmark"]),
+        )
+        bucket = max(storage.list_data_entity_buckets(), key=lambda b: b.size_bytes)
+        bucket_id = bucket.id
+        print(f"Reading bucket {bucket_id} of {bucket.size_bytes / 2**20:.1f} MiB.")
+
+        paths = {
+            "validated": lambda: list_validated(storage, bucket_id),
+            "unvalidated": lambda: storage.list_data_entities_in_data_entity_bucket(
+                bucket_id
+            ),
+        }
+
+        print(f"{'path':<12} {'rows':>8} {'read rows/s':>12} {'read+serialize rows/s':>22}")
+        for name, read in paths.items():
+            rows = len(read())
+            read_seconds = time_it(read, args.repeat)
+
+            def read_and_serialize():
+                GetDataEntityBucket(
+                    data_entity_bucket_id=bucket_id, data_entities=read()
+                ).model_dump_json()
+
+            total_seconds = time_it(read_and_serialize, args.repeat)
+            print(
+                f"{name:<12} {rows:>8} {rows / read_seconds:>12,.0f} {rows / total_seconds:>22,.0f}"
+            )
+    finally:
+        storage.close()
+        remove_database(database)
+
+
+if __name__ == "__main__":
+    main()
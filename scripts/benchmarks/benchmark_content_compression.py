@@ -0,0 +1,77 @@
+"""
+Benchmarks bytes on disk and read throughput of miner storage with and without zstd content compression.
+
+Run from the repository root:
+    python -m scripts.benchmarks.benchmark_content_compression --entity_count 200000
+"""
+import argparse
+import random
+
+from scripts.benchmarks.benchmark_utils import (
+    database_size_bytes,
+    generate_entities,
+    remove_database,
+    store_in_batches,
+    time_it,
+)
+from storage.miner.sqlite_miner_storage import SqliteMinerStorage
+
+
+def benchmark(entities, compress: bool, bucket_sample_count: int):
+    database = f"BenchmarkContentCompression{'Zstd' if compress else 'Raw'}.sqlite"
+    remove_database(database)
+    storage = SqliteMinerStorage(database, compress_content=compress)
+    try:
+        store_in_batches(storage, entities)
+        if compress:
+            # Follow the migration path an existing miner would use.
+            storage.train_content_dictionaries()
+            storage.migrate_content_compression()
+
+        with storage.connection_pool.writer() as connection:
+            connection.execute("VACUUM")
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        size = database_size_bytes(database)
+
+        buckets = [bucket.id for bucket in storage.list_data_entity_buckets()]
+        buckets = random.Random(0).sample(buckets, min(bucket_sample_count, len(buckets)))
+
+        def read_buckets():
+            return sum(
+                entity.content_size_bytes
+                for bucket in buckets
+                for entity in storage.list_data_entities_in_data_entity_bucket(bucket)
+            )
+
+        read_bytes = read_buckets()
+        seconds = time_it(read_buckets)
+        return size, read_bytes / seconds
+    finally:
+        storage.close()
+        remove_database(database)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entity_count", type=int, default=100_000)
+    parser.add_argument("--bucket_sample_count", type=int, default=200)
+    args = parser.parse_args()
+
+    entities = generate_entities(args.entity_count)
+    content_bytes = sum(entity.content_size_bytes for entity in entities)
+    print(f"Generated {len(entities)} entities with {content_bytes / 2**20:.1f} MiB of content.")
+
+    results = {}
+    for compress in [False, True]:
+        results[compress] = benchmark(entities, compress, args.bucket_sample_count)
+
+    print(f"{'storage':<8} {'MiB on disk':>12} {'vs raw':>8} {'read MiB/s':>11}")
+    for compress, (size, throughput) in results.items():
+        print(
+            f"{'zstd' if compress else 'raw':<8} {size / 2**20:>12.1f} "
+            + f"{size / results[False][0]:>8.2f} {throughput / 2**20:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmarks GetContentsByBuckets lookups of 1, 10 and 100 buckets, comparing the previous dynamic OR query with the
+join against the requested buckets used by SqliteMinerStorage.
+
+Run from the repository root:
+    python -m scripts.benchmarks.benchmark_contents_by_buckets --entity_count 200000
+"""
+import argparse
+import random
+from collections import defaultdict
+
+from common import constants
+from scripts.benchmarks.benchmark_utils import (
+    LABELS,
+    generate_entities,
+    remove_database,
+    store_in_batches,
+    time_it,
+)
+from storage.miner.sqlite_miner_storage import SqliteMinerStorage
+
+
+def list_contents_or_query(storage: SqliteMinerStorage, bucket_ids):
+    """The previous lookup, which ORs together a clause per bucket and ignores the source."""
+    params = []
+    for bucket_id in bucket_ids:
+        params.append(bucket_id.time_bucket.id)
+        params.append("NULL" if bucket_id.label is None else bucket_id.label.value)
+
+    with storage.connection_pool.reader() as connection:
+        cursor = connection.execute(
+            f"""SELECT timeBucketId, source, label, content, contentSizeBytes FROM DataEntity
+                JOIN Label USING (labelId)
+                WHERE timeBucketId = ? AND label = ?
+                {"OR timeBucketId = ? AND label = ?" * (len(bucket_ids) - 1)}
+                LIMIT ?""",
+            params + [constants.BULK_CONTENTS_COUNT_LIMIT],
+        )
+        contents = defaultdict(list)
+        running_size = 0
+        for row in cursor:
+            if running_size >= constants.BULK_CONTENTS_SIZE_LIMIT_BYTES:
+                break
+            contents[(row["timeBucketId"], row["label"])].append(row["content"])
+            running_size += row["contentSizeBytes"]
+        cursor.close()
+        return contents
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entity_count", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    database = "BenchmarkContentsByBuckets.sqlite"
+    remove_database(database)
+    storage = SqliteMinerStorage(database)
+    try:
+        store_in_batches(
+            storage,
+            generate_entities(args.entity_count, hours=24 * 7, labels=LABELS[:20]),
+        )
+        buckets = [bucket.id for bucket in storage.list_data_entity_buckets()]
+        print(f"Stored {args.entity_count} entities in {len(buckets)} buckets.")
+
+        print(
+            f"{'buckets':>8} {'contents':>9} {'OR query ms':>12} {'join ms':>8} {'speedup':>8}"
+        )
+        for bucket_count in [1, 10, 100]:
+            bucket_ids = random.Random(bucket_count).sample(buckets, bucket_count)
+
+            contents = storage.list_contents_in_data_entity_buckets(bucket_ids)
+            or_seconds = time_it(
+                lambda: list_contents_or_query(storage, bucket_ids), args.repeat
+            )
+            join_seconds = time_it(
+                lambda: storage.list_contents_in_data_entity_buckets(bucket_ids),
+                args.repeat,
+            )
+            print(
+                f"{bucket_count:>8} {sum(len(c) for c in contents.values()):>9} "
+                + f"{or_seconds * 1000:>12.1f} {join_seconds * 1000:>8.1f} {or_seconds / join_seconds:>8.2f}"
+            )
+    finally:
+        storage.close()
+        remove_database(database)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Measures the on-disk size of DataEntity and its bucket index with labels stored inline as text, as in previous
+versions, against labels interned into integer labelIds. Also times the startup migration between the two.
+
+Run from the repository root:
+    python -m scripts.benchmarks.benchmark_label_ids --entity_count 200000
+"""
+import argparse
+import contextlib
+import sqlite3
+import time
+
+from common.data import TimeBucket
+from scripts.benchmarks.benchmark_utils import generate_entities, remove_database
+from storage.miner.sqlite_miner_storage import SqliteMinerStorage
+
+# A few thousand labels of a realistic length, such as "r/CryptoCurrency" or "#bittensor".
+LABELS = [f"community_{i}" for i in range(3_000)]
+
+# The schema of previous versions, which repeated the label in every row and index entry.
+LEGACY_DATA_ENTITY_TABLE_CREATE = """CREATE TABLE DataEntity (
+                                uri                 TEXT            PRIMARY KEY,
+                                datetime            TIMESTAMP(6)    NOT NULL,
+                                timeBucketId        INTEGER         NOT NULL,
+                                source              INTEGER         NOT NULL,
+                                label               CHAR(32)                ,
+                                content             BLOB            NOT NULL,
+                                contentSizeBytes    INTEGER         NOT NULL
+                                ) WITHOUT ROWID"""
+
+LEGACY_DATA_ENTITY_TABLE_INDEX = """CREATE INDEX data_entity_bucket_index2
+                                ON DataEntity (timeBucketId, source, label, contentSizeBytes)"""
+
+
+def object_sizes(database: str):
+    """Returns the bytes used by each table and index after a vacuum."""
+    with contextlib.closing(sqlite3.connect(database)) as connection:
+        connection.execute("VACUUM")
+        return dict(
+            connection.execute(
+                "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"
+            ).fetchall()
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entity_count", type=int, default=100_000)
+    args = parser.parse_args()
+
+    database = "BenchmarkLabelIds.sqlite"
+    remove_database(database)
+    try:
+        with contextlib.closing(sqlite3.connect(database)) as connection:
+            connection.execute(LEGACY_DATA_ENTITY_TABLE_CREATE)
+            connection.execute(LEGACY_DATA_ENTITY_TABLE_INDEX)
+            connection.executemany(
+                "INSERT INTO DataEntity VALUES (?,?,?,?,?,?,?)",
+                [
+                    [
+                        entity.uri,
+                        entity.datetime,
+                        TimeBucket.from_datetime(entity.datetime).id,
+                        entity.source,
+                        entity.label.value if entity.label else "NULL",
+                        entity.content,
+                        entity.content_size_bytes,
+                    ]
+                    for entity in generate_entities(args.entity_count, labels=LABELS)
+                ],
+            )
+            connection.commit()
+        text_sizes = object_sizes(database)
+
+        start = time.perf_counter()
+        SqliteMinerStorage(database).close()
+        migration_seconds = time.perf_counter() - start
+        label_id_sizes = object_sizes(database)
+
+        print(f"Migrated {args.entity_count} entities in {migration_seconds:.2f}s.")
+        print(f"{'object':<12} {'text MiB':>9} {'labelId MiB':>12} {'ratio':>6}")
+        for name, text_name, label_id_name in [
+            ("DataEntity", "DataEntity", "DataEntity"),
+            ("bucket index", "data_entity_bucket_index2", "data_entity_bucket_index3"),
+        ]:
+            text_size = text_sizes[text_name]
+            label_id_size = label_id_sizes[label_id_name]
+            print(
+                f"{name:<12} {text_size / 2**20:>9.2f} {label_id_size / 2**20:>12.2f} "
+                + f"{label_id_size / text_size:>6.2f}"
+            )
+    finally:
+        remove_database(database)
+
+
+if __name__ == "__main__":
+    main()
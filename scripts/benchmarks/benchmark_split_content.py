@@ -0,0 +1,91 @@
+"""
+Compares storing content inline in DataEntity against the split content layout, where DataEntity only holds the
+narrow metadata of each row and content lives in DataEntityContent. Measures ingest, bucket reads, eviction and the
+on-disk size of DataEntity itself.
+
+Run from the repository root:
+    python -m scripts.benchmarks.benchmark_split_content --entity_count 200000
+"""
+import argparse
+import contextlib
+import sqlite3
+import time
+
+from scripts.benchmarks.benchmark_utils import (
+    generate_entities,
+    remove_database,
+    store_in_batches,
+    time_it,
+)
+from storage.miner.sqlite_miner_storage import SqliteMinerStorage
+
+
+def data_entity_size_bytes(database: str) -> int:
+    """Returns the bytes used by the DataEntity table itself, excluding its indexes and any content table."""
+    with contextlib.closing(sqlite3.connect(database)) as connection:
+        return connection.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name = 'DataEntity'"
+        ).fetchone()[0]
+
+
+def run(entities, split_content: bool, repeat: int):
+    database = "BenchmarkSplitContent.sqlite"
+    remove_database(database)
+    storage = SqliteMinerStorage(database, split_content=split_content)
+    try:
+        start = time.perf_counter()
+        store_in_batches(storage, entities)
+        ingest_seconds = time.perf_counter() - start
+
+        # Overwrite a tenth of the entities, as happens when scrapers revisit recent data.
+        start = time.perf_counter()
+        store_in_batches(storage, entities[: len(entities) // 10])
+        replace_seconds = time.perf_counter() - start
+
+        bucket_id = max(
+            storage.list_data_entity_buckets(), key=lambda b: b.size_bytes
+        ).id
+        bucket_rows = len(storage.list_data_entities_in_data_entity_bucket(bucket_id))
+        read_seconds = time_it(
+            lambda: storage.list_data_entities_in_data_entity_bucket(bucket_id), repeat
+        )
+
+        start = time.perf_counter()
+        eviction = storage.clear_content_from_oldest(
+            storage.get_content_size_bytes() // 2
+        )
+        eviction_seconds = time.perf_counter() - start
+    finally:
+        storage.close()
+
+    data_entity_bytes = data_entity_size_bytes(database)
+    remove_database(database)
+    return {
+        "ingest rows/s": len(entities) / ingest_seconds,
+        "replace rows/s": (len(entities) // 10) / replace_seconds,
+        "bucket read rows/s": bucket_rows / read_seconds,
+        "eviction rows/s": eviction.rows_cleared / eviction_seconds,
+        "DataEntity MiB": data_entity_bytes / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entity_count", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    entities = generate_entities(args.entity_count, hours=24)
+    inline = run(entities, split_content=False, repeat=args.repeat)
+    split = run(entities, split_content=True, repeat=args.repeat)
+
+    print(f"{'metric':<20} {'inline':>12} {'split':>12} {'ratio':>6}")
+    for metric in inline:
+        print(
+            f"{metric:<20} {inline[metric]:>12,.2f} {split[metric]:>12,.2f} "
+            + f"{split[metric] / inline[metric]:>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Benchmarks SqliteMinerStorage at production scale and writes the results as JSON, so that runs against different
+versions can be compared.
+
+Generates a stream of synthetic X and Reddit DataEntities spread over realistic buckets, then measures insert
+throughput, refresh_compressed_index latency, list_data_entities_in_data_entity_bucket and
+list_contents_in_data_entity_buckets latency, and the time to evict the oldest tenth of the content.
+
+Run from the repository root:
+    python -m scripts.benchmarks.benchmark_storage_scale --entity_count 10000000 --output results.json
+Compare against the results of a previous version:
+    python -m scripts.benchmarks.benchmark_storage_scale --compare baseline.json --output results.json
+"""
+import argparse
+import dataclasses
+import datetime as dt
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import time
+from typing import Callable, Dict, List
+
+from scripts.benchmarks.benchmark_utils import (
+    database_size_bytes,
+    generate_entity_batches,
+    remove_database,
+)
+from storage.miner.sqlite_miner_storage import SqliteMinerStorage
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """Returns the count, mean and percentiles in milliseconds of latencies in seconds."""
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": percentile(0.5),
+        "p90_ms": percentile(0.9),
+        "p99_ms": percentile(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def measure(func: Callable[[], object], repeat: int) -> List[float]:
+    """Returns the wall clock time in seconds of each call to func."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def benchmark_insert(storage: SqliteMinerStorage, args) -> Dict[str, float]:
+    batch_latencies = []
+    start = time.perf_counter()
+    generation_seconds = 0.0
+    batches = generate_entity_batches(
+        args.entity_count, args.days, args.label_count, args.batch_size, args.seed
+    )
+    while True:
+        generation_start = time.perf_counter()
+        batch = next(batches, None)
+        generation_seconds += time.perf_counter() - generation_start
+        if batch is None:
+            break
+
+        batch_start = time.perf_counter()
+        storage.store_data_entities(batch)
+        batch_latencies.append(time.perf_counter() - batch_start)
+
+        stored = len(batch_latencies) * args.batch_size
+        if len(batch_latencies) % 1_000 == 0:
+            print(
+                f"Stored {stored:,} entities in {time.perf_counter() - start:.0f}s.",
+                flush=True,
+            )
+
+    store_seconds = sum(batch_latencies)
+    return {
+        "rows_per_second": args.entity_count / store_seconds,
+        "store_seconds": store_seconds,
+        "generation_seconds": generation_seconds,
+        "batch": summarize(batch_latencies),
+    }
+
+
+def run(args) -> Dict:
+    remove_database(args.database)
+    storage = SqliteMinerStorage(
+        args.database,
+        max_database_size_gb_hint=args.max_database_size_gb_hint,
+        compress_content=args.compress_content,
+        integer_timestamps=args.integer_timestamps,
+        split_content=args.split_content,
+    )
+    results = {}
+    try:
+        results["insert"] = benchmark_insert(storage, args)
+        results["content_size_bytes"] = storage.get_content_size_bytes()
+        results["database_size_bytes"] = database_size_bytes(args.database)
+        disk_usage = storage.get_disk_usage()
+        results["disk_usage"] = dataclasses.asdict(disk_usage)
+        results["disk_usage"]["overhead_ratio"] = disk_usage.overhead_ratio
+
+        # A zero freshness period forces every call to rebuild the index.
+        results["refresh_compressed_index"] = summarize(
+            measure(
+                lambda: storage.refresh_compressed_index(dt.timedelta(0)),
+                args.repeat,
+            )
+        )
+        results["bucket_count"] = storage.get_serialized_compressed_index().bucket_count
+
+        # Validators choose buckets to verify across the whole index, so sample uniformly.
+        rng = random.Random(args.seed)
+        buckets = [bucket.id for bucket in storage.list_data_entity_buckets()]
+        bucket_sample = rng.sample(buckets, min(args.bucket_sample_count, len(buckets)))
+        results["list_data_entities_in_data_entity_bucket"] = summarize(
+            [
+                latency
+                for bucket_id in bucket_sample
+                for latency in measure(
+                    lambda: storage.list_data_entities_in_data_entity_bucket(bucket_id),
+                    1,
+                )
+            ]
+        )
+
+        for bucket_count in [1, 10, 100]:
+            results[f"list_contents_in_data_entity_buckets_{bucket_count}"] = summarize(
+                [
+                    latency
+                    for _ in range(args.repeat)
+                    for latency in measure(
+                        lambda: storage.list_contents_in_data_entity_buckets(
+                            rng.sample(buckets, min(bucket_count, len(buckets)))
+                        ),
+                        1,
+                    )
+                ]
+            )
+
+        eviction = storage.clear_content_from_oldest(
+            results["content_size_bytes"] // 10
+        )
+        results["eviction"] = {
+            "seconds": eviction.duration_seconds,
+            "rows_cleared": eviction.rows_cleared,
+            "bytes_cleared": eviction.bytes_cleared,
+            "rows_per_second": eviction.rows_cleared / eviction.duration_seconds,
+        }
+    finally:
+        storage.close()
+        if not args.keep_database:
+            remove_database(args.database)
+    return results
+
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    """Flattens nested results into dotted metric names."""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def print_comparison(baseline: Dict, current: Dict):
+    baseline_metrics = flatten(baseline["results"])
+    current_metrics = flatten(current["results"])
+    print(
+        f"Comparing {current['environment']['git_commit'][:10]} "
+        + f"against {baseline['environment']['git_commit'][:10]}."
+    )
+    print(f"{'metric':<60} {'baseline':>14} {'current':>14} {'ratio':>7}")
+    for metric, value in current_metrics.items():
+        baseline_value = baseline_metrics.get(metric)
+        ratio = f"{value / baseline_value:>7.2f}" if baseline_value else f"{'':>7}"
+        baseline_text = (
+            f"{baseline_value:>14,.2f}" if baseline_value is not None else f"{'':>14}"
+        )
+        print(f"{metric:<60} {baseline_text} {value:>14,.2f} {ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entity_count", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--label_count", type=int, default=2_000)
+    parser.add_argument("--batch_size", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--bucket_sample_count", type=int, default=200)
+    parser.add_argument("--max_database_size_gb_hint", type=int, default=250)
+    parser.add_argument("--compress_content", action="store_true")
+    parser.add_argument("--integer_timestamps", action="store_true")
+    parser.add_argument("--split_content", action="store_true")
+    parser.add_argument("--database", default="BenchmarkStorageScale.sqlite")
+    parser.add_argument(
+        "--keep_database",
+        action="store_true",
+        help="Keep the generated database for further investigation.",
+    )
+    parser.add_argument("--output", default="benchmark_storage_scale.json")
+    parser.add_argument(
+        "--compare", help="Results of a previous run to compare these results against."
+    )
+    args = parser.parse_args()
+
+    report = {
+        "environment": {
+            "git_commit": git_commit(),
+            "started_at": dt.datetime.now(tz=dt.timezone.utc).isoformat(),
+            "python_version": platform.python_version(),
+            "sqlite_version": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "parameters": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "compare", "keep_database")
+        },
+    }
+    report["results"] = run(args)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"Wrote results to {args.output}.")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmarks reading DataEntity datetimes stored as text, parsed by the timestamp converter, against datetimes stored
+as integer microseconds since epoch.
+
+Run from the repository root:
+    python -m scripts.benchmarks.benchmark_timestamps --entity_count 100000
+"""
+import argparse
+
+from scripts.benchmarks.benchmark_utils import (
+    generate_entities,
+    remove_database,
+    store_in_batches,
+    time_it,
+)
+from storage.miner.sqlite_miner_storage import SqliteMinerStorage
+
+
+def scan_datetimes(storage: SqliteMinerStorage) -> int:
+    """Reads every datetime through the timestamp converter, as queries selecting the column directly do."""
+    with storage.connection_pool.reader() as connection:
+        cursor = connection.cursor()
+        cursor.row_factory = None
+        count = sum(1 for _ in cursor.execute("SELECT datetime FROM DataEntity"))
+        cursor.close()
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entity_count", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # Put every entity into one hour with a single label so the bucket is as large as realistic buckets.
+    entities = generate_entities(args.entity_count, hours=1, labels=["benchmark"])
+
+    print(f"{'format':<12} {'scan rows/s':>12} {'bucket read rows/s':>19}")
+    for integer_timestamps in [False, True]:
+        database = "BenchmarkTimestamps.sqlite"
+        remove_database(database)
+        storage = SqliteMinerStorage(database, integer_timestamps=integer_timestamps)
+        try:
+            store_in_batches(storage, entities)
+            bucket_id = max(
+                storage.list_data_entity_buckets(), key=lambda b: b.size_bytes
+            ).id
+
+            rows = scan_datetimes(storage)
+            scan_seconds = time_it(lambda: scan_datetimes(storage), args.repeat)
+            read_rows = len(storage.list_data_entities_in_data_entity_bucket(bucket_id))
+            read_seconds = time_it(
+                lambda: storage.list_data_entities_in_data_entity_bucket(bucket_id),
+                args.repeat,
+            )
+            print(
+                f"{storage.get_datetime_format():<12} {rows / scan_seconds:>12,.0f} "
+                + f"{read_rows / read_seconds:>19,.0f}"
+            )
+        finally:
+            storage.close()
+            remove_database(database)
+
+
+if __name__ == "__main__":
+    main()
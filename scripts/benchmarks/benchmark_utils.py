@@ -0,0 +1,136 @@
+"""Shared helpers to generate realistic synthetic miner data for the storage benchmarks."""
+import datetime as dt
+import itertools
+import os
+import random
+import string
+import time
+from typing import Callable, Iterator, List
+
+from common.data import DataEntity
+from scraping.reddit.model import RedditContent, RedditDataType
+from scraping.x.model import XContent
+
+_WORDS_RNG = random.Random(0)
+WORDS = [
+    "".join(_WORDS_RNG.choices(string.ascii_lowercase, k=_WORDS_RNG.randint(2, 9)))
+    for _ in range(2_000)
+]
+LABELS = [f"label{i}" for i in range(200)]
+
+
+def _text(rng: random.Random, word_count: int) -> str:
+    return " ".join(rng.choices(WORDS, k=word_count))
+
+
+def generate_x_entity(
+    rng: random.Random, index: int, datetime: dt.datetime, labels: List[str] = LABELS
+) -> DataEntity:
+    """Generates a DataEntity holding a tweet in the format produced by the X scrapers."""
+    username = f"user{rng.randint(0, 100_000)}"
+    content = XContent(
+        username=f"@{username}",
+        text=_text(rng, rng.randint(5, 50)),
+        url=f"https://x.com/{username}/status/{1_800_000_000_000_000_000 + index}",
+        timestamp=datetime,
+        tweet_hashtags=[
+            f"#{label}" for label in rng.sample(labels, rng.randint(0, min(3, len(labels))))
+        ],
+    )
+    return XContent.to_data_entity(content)
+
+
+def generate_reddit_entity(
+    rng: random.Random, index: int, datetime: dt.datetime, labels: List[str] = LABELS
+) -> DataEntity:
+    """Generates a DataEntity holding a post or comment in the format produced by the Reddit scrapers."""
+    is_post = rng.random() < 0.3
+    community = rng.choice(labels)
+    content = RedditContent(
+        id=f"t{1 if is_post else 3}_{index:x}",
+        url=f"https://www.reddit.com/r/{community}/comments/{index:x}/{_text(rng, 3).replace(' ', '_')}/",
+        username=f"user{rng.randint(0, 100_000)}",
+        communityName=f"r/{community}",
+        body=_text(rng, rng.randint(10, 150)),
+        createdAt=datetime,
+        dataType=RedditDataType.POST if is_post else RedditDataType.COMMENT,
+        title=_text(rng, rng.randint(3, 15)) if is_post else None,
+        parentId=None if is_post else f"t1_{rng.randint(0, index + 1):x}",
+    )
+    return RedditContent.to_data_entity(content)
+
+
+def generate_entities(
+    count: int, hours: int = 24 * 7, seed: int = 0, labels: List[str] = LABELS
+) -> List[DataEntity]:
+    """Generates a mix of X and Reddit DataEntities spread evenly over the last provided hours."""
+    rng = random.Random(seed)
+    now = dt.datetime.now(tz=dt.timezone.utc)
+    entities = []
+    for index in range(count):
+        datetime = now - dt.timedelta(hours=hours * index / count)
+        generate = generate_x_entity if index % 2 == 0 else generate_reddit_entity
+        entities.append(generate(rng, index, datetime, labels))
+    return entities
+
+
+def generate_entity_batches(
+    count: int,
+    days: int = 30,
+    label_count: int = 2_000,
+    batch_size: int = 1_000,
+    seed: int = 0,
+) -> Iterator[List[DataEntity]]:
+    """Lazily generates batches of X and Reddit DataEntities with a realistic bucket distribution.
+
+    Datetimes are skewed towards the most recent days and labels follow a Zipf distribution, so a few labels hold
+    large buckets while most hold small ones. Only one batch is held in memory at a time.
+    """
+    rng = random.Random(seed)
+    now = dt.datetime.now(tz=dt.timezone.utc)
+    max_age_hours = days * 24
+    labels = [f"label{i}" for i in range(label_count)]
+    label_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(label_count)))
+
+    for start in range(0, count, batch_size):
+        batch = []
+        for index in range(start, min(start + batch_size, count)):
+            # Exponentially fewer entities per hour going back in time, with a mean age of a sixth of the window.
+            age_hours = min(rng.expovariate(6 / max_age_hours), max_age_hours - 1)
+            datetime = now - dt.timedelta(hours=age_hours)
+            label = rng.choices(labels, cum_weights=label_weights)[0]
+            generate = generate_x_entity if index % 2 == 0 else generate_reddit_entity
+            batch.append(generate(rng, index, datetime, [label]))
+        yield batch
+
+
+def store_in_batches(storage, entities: List[DataEntity], batch_size: int = 1_000):
+    """Stores the entities in batches of the size the ScraperCoordinator typically produces."""
+    for start in range(0, len(entities), batch_size):
+        storage.store_data_entities(entities[start : start + batch_size])
+
+
+def database_size_bytes(database: str) -> int:
+    """Returns the size of the database file and its WAL."""
+    return sum(
+        os.path.getsize(database + suffix)
+        for suffix in ["", "-wal"]
+        if os.path.exists(database + suffix)
+    )
+
+
+def remove_database(database: str):
+    """Removes the database file along with its WAL, shared memory and index snapshot files."""
+    for suffix in ["", "-wal", "-shm", ".index_snapshot.json"]:
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+
+
+def time_it(func: Callable[[], object], repeat: int = 5) -> float:
+    """Returns the best wall clock time in seconds of calling func."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
@@ -0,0 +1,109 @@
+"""
+Compares the NumPy columnar validator storage against the SQLite in-memory validator storage. Measures upsert and
+read_miner_index latency and the memory used per stored bucket, for many miners with overlapping indexes.
+
+Run from the repository root:
+    python -m scripts.benchmarks.benchmark_validator_storage --miner_count 250 --bucket_count 20000
+"""
+import argparse
+import random
+import time
+from typing import Dict, List
+
+from common.data import CompressedEntityBucket, CompressedMinerIndex, DataSource
+from storage.validator.numpy_validator_storage import NumpyValidatorStorage
+from storage.validator.sqlite_memory_validator_storage import (
+    SqliteMemoryValidatorStorage,
+)
+from storage.validator.validator_storage import ValidatorStorage
+
+
+def generate_index(
+    rng: random.Random, bucket_count: int, label_count: int, time_bucket_count: int
+) -> CompressedMinerIndex:
+    """Returns an index of bucket_count buckets drawn from labels shared by every miner."""
+    buckets_per_label = min(time_bucket_count, 100)
+    first_time_bucket_id = 480_000
+    sources = {DataSource.REDDIT.value: [], DataSource.X.value: []}
+    for _ in range(bucket_count // buckets_per_label):
+        sources[rng.choice(list(sources))].append(
+            CompressedEntityBucket(
+                label=f"label_{rng.randrange(label_count)}",
+                time_bucket_ids=rng.sample(
+                    range(first_time_bucket_id, first_time_bucket_id + time_bucket_count),
+                    buckets_per_label,
+                ),
+                sizes_bytes=[rng.randint(1, 1_000_000) for _ in range(buckets_per_label)],
+            )
+        )
+    return CompressedMinerIndex(sources=sources)
+
+
+def memory_usage_bytes(storage: ValidatorStorage) -> int:
+    if isinstance(storage, NumpyValidatorStorage):
+        return storage.get_memory_usage_bytes()
+    page_size = storage.connection.execute("PRAGMA page_size").fetchone()[0]
+    page_count = storage.connection.execute("PRAGMA page_count").fetchone()[0]
+    return page_size * page_count
+
+
+def percentile_ms(latencies: List[float], p: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+
+def run(storage: ValidatorStorage, indexes: List[CompressedMinerIndex], args) -> Dict[str, float]:
+    rng = random.Random(args.seed)
+    upsert_latencies = []
+    for miner, index in enumerate(indexes):
+        start = time.perf_counter()
+        storage.upsert_compressed_miner_index(index, f"hotkey{miner}", rng.random())
+        upsert_latencies.append(time.perf_counter() - start)
+
+    read_latencies = []
+    row_count = 0
+    for miner in rng.sample(range(len(indexes)), min(args.read_count, len(indexes))):
+        start = time.perf_counter()
+        row_count = len(storage.read_miner_index(f"hotkey{miner}").scorable_data_entity_buckets)
+        read_latencies.append(time.perf_counter() - start)
+
+    total_rows = sum(CompressedMinerIndex.bucket_count(index) for index in indexes)
+    return {
+        "upsert p50 ms": percentile_ms(upsert_latencies, 0.5),
+        "upsert p99 ms": percentile_ms(upsert_latencies, 0.99),
+        "read p50 ms": percentile_ms(read_latencies, 0.5),
+        "read p99 ms": percentile_ms(read_latencies, 0.99),
+        "read rows": row_count,
+        "bytes per row": memory_usage_bytes(storage) / total_rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--miner_count", type=int, default=100)
+    parser.add_argument("--bucket_count", type=int, default=20_000)
+    parser.add_argument("--label_count", type=int, default=2_000)
+    parser.add_argument("--time_bucket_count", type=int, default=720)
+    parser.add_argument("--read_count", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    indexes = [
+        generate_index(rng, args.bucket_count, args.label_count, args.time_bucket_count)
+        for _ in range(args.miner_count)
+    ]
+
+    sqlite = run(SqliteMemoryValidatorStorage(), indexes, args)
+    numpy = run(NumpyValidatorStorage(), indexes, args)
+
+    print(f"{'metric':<16} {'sqlite':>12} {'numpy':>12} {'ratio':>6}")
+    for metric in sqlite:
+        print(
+            f"{metric:<16} {sqlite[metric]:>12,.2f} {numpy[metric]:>12,.2f} "
+            + f"{numpy[metric] / sqlite[metric]:>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
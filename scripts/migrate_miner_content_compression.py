@@ -0,0 +1,94 @@
+"""
+This script trains a zstd dictionary per DataSource from a miner database and rewrites the stored content to use it.
+
+Run it from the repository root while the miner is stopped, or while it is running since each batch is committed
+separately:
+    python -m scripts.migrate_miner_content_compression --database SqliteMinerStorage.sqlite
+
+Then start the miner with --neuron.compress_content so new content is compressed too.
+
+To undo the migration and store all content raw again:
+    python -m scripts.migrate_miner_content_compression --database SqliteMinerStorage.sqlite --decompress
+
+Rewriting content leaves free pages behind. Pass --vacuum to return them to the filesystem afterwards.
+"""
+import argparse
+import contextlib
+import os
+import time
+
+from storage.miner.content_compression import (
+    CONTENT_DICTIONARY_SAMPLE_COUNT,
+    DEFAULT_DICTIONARY_SIZE_BYTES,
+)
+from storage.miner.sharded_sqlite_miner_storage import ShardedSqliteMinerStorage
+from storage.miner.sqlite_miner_storage import SqliteMinerStorage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--database",
+        type=str,
+        default="SqliteMinerStorage.sqlite",
+        help="The miner database file, or the shard directory if the miner runs with --neuron.shard_database_by_day.",
+    )
+    parser.add_argument(
+        "--decompress",
+        action="store_true",
+        help="Rewrite all content uncompressed instead of compressing it.",
+    )
+    parser.add_argument(
+        "--sample_count",
+        type=int,
+        default=CONTENT_DICTIONARY_SAMPLE_COUNT,
+        help="The number of recent contents per source used to train each dictionary.",
+    )
+    parser.add_argument(
+        "--dictionary_size_bytes",
+        type=int,
+        default=DEFAULT_DICTIONARY_SIZE_BYTES,
+        help="The target size of each trained dictionary.",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=SqliteMinerStorage.EVICTION_BATCH_SIZE,
+        help="The number of rows rewritten per transaction.",
+    )
+    parser.add_argument(
+        "--vacuum",
+        action="store_true",
+        help="Vacuum single file databases afterwards to return the freed space to the filesystem.",
+    )
+    args = parser.parse_args()
+
+    if os.path.isdir(args.database):
+        storage = ShardedSqliteMinerStorage(args.database)
+    else:
+        storage = SqliteMinerStorage(args.database)
+
+    start = time.perf_counter()
+    with contextlib.closing(storage):
+        if not args.decompress:
+            dict_ids = storage.train_content_dictionaries(
+                sample_count=args.sample_count,
+                dictionary_size_bytes=args.dictionary_size_bytes,
+            )
+            print(f"Trained dictionaries: {dict_ids}")
+
+        rows_rewritten = storage.migrate_content_compression(
+            compress=not args.decompress, batch_size=args.batch_size
+        )
+        print(
+            f"Rewrote {rows_rewritten} rows in {time.perf_counter() - start:.2f}s."
+        )
+
+        if args.vacuum and isinstance(storage, SqliteMinerStorage):
+            with storage.connection_pool.writer() as connection:
+                connection.execute("VACUUM")
+            print("Vacuumed the database.")
+
+
+if __name__ == "__main__":
+    main()
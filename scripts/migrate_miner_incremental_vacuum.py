@@ -0,0 +1,47 @@
+"""
+This script switches a miner database to incremental auto-vacuum, so that space cleared when the database is full is
+handed back to the filesystem instead of staying allocated to the database file.
+
+Run it from the repository root while the miner is stopped. It rebuilds the whole database, which needs free disk
+space for a second copy of it:
+    python -m scripts.migrate_miner_incremental_vacuum --database SqliteMinerStorage.sqlite
+
+Databases created by this version of the miner already use incremental auto-vacuum.
+"""
+import argparse
+import contextlib
+import os
+import time
+
+from storage.miner.sharded_sqlite_miner_storage import ShardedSqliteMinerStorage
+from storage.miner.sqlite_miner_storage import SqliteMinerStorage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--database",
+        type=str,
+        default="SqliteMinerStorage.sqlite",
+        help="The miner database file, or the shard directory if the miner runs with --neuron.shard_database_by_day.",
+    )
+    args = parser.parse_args()
+
+    if os.path.isdir(args.database):
+        storage = ShardedSqliteMinerStorage(args.database)
+    else:
+        storage = SqliteMinerStorage(args.database)
+
+    start = time.perf_counter()
+    with contextlib.closing(storage):
+        before = storage.get_disk_usage()
+        storage.enable_incremental_vacuum()
+        after = storage.get_disk_usage()
+        print(
+            f"Enabled incremental auto-vacuum in {time.perf_counter() - start:.2f}s. "
+            + f"Database size went from {before.database_size_bytes} to {after.database_size_bytes} bytes."
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+This script converts the DataEntity datetimes of a miner database from text to integer microseconds since epoch.
+
+Run it from the repository root while the miner is stopped, or while it is running since each batch is committed
+separately and rows are readable in either format throughout:
+    python -m scripts.migrate_miner_integer_timestamps --database SqliteMinerStorage.sqlite
+
+New rows are stored as integers as soon as the migration starts, regardless of --neuron.integer_timestamps.
+HuggingFace uploads are skipped until the migration completes. If it is interrupted, run it again to finish it.
+"""
+import argparse
+import contextlib
+import os
+import time
+
+from storage.miner.sharded_sqlite_miner_storage import ShardedSqliteMinerStorage
+from storage.miner.sqlite_miner_storage import SqliteMinerStorage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--database",
+        type=str,
+        default="SqliteMinerStorage.sqlite",
+        help="The miner database file, or the shard directory if the miner runs with --neuron.shard_database_by_day.",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=SqliteMinerStorage.EVICTION_BATCH_SIZE,
+        help="The number of rows converted per transaction.",
+    )
+    args = parser.parse_args()
+
+    if os.path.isdir(args.database):
+        storage = ShardedSqliteMinerStorage(args.database)
+    else:
+        storage = SqliteMinerStorage(args.database)
+
+    start = time.perf_counter()
+    with contextlib.closing(storage):
+        rows_converted = storage.migrate_integer_timestamps(batch_size=args.batch_size)
+        print(
+            f"Converted {rows_converted} rows in {time.perf_counter() - start:.2f}s."
+        )
+
+
+if __name__ == "__main__":
+    main()
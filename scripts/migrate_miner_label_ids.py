@@ -0,0 +1,53 @@
+"""
+This script moves a miner database written by previous versions over to interned labels, keying DataEntity by labelId.
+
+The miner migrates such a database when it starts, before serving any requests. Running this script ahead of the upgrade
+avoids that startup delay. Run it from the repository root while the miner is stopped:
+    python -m scripts.migrate_miner_label_ids --database SqliteMinerStorage.sqlite
+
+Rows are moved in batches, each committed separately, so it only needs free disk space for about one batch and the WAL
+stays small. If it is interrupted, run it again to resume where it stopped.
+"""
+import argparse
+import os
+import time
+
+from storage.miner.sharded_sqlite_miner_storage import ShardedSqliteMinerStorage
+from storage.miner.sqlite_miner_storage import SqliteMinerStorage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--database",
+        type=str,
+        default="SqliteMinerStorage.sqlite",
+        help="The miner database file, or the shard directory if the miner runs with --neuron.shard_database_by_day.",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=SqliteMinerStorage.EVICTION_BATCH_SIZE,
+        help="The number of rows moved per transaction.",
+    )
+    args = parser.parse_args()
+
+    if os.path.isdir(args.database):
+        databases = [
+            os.path.join(args.database, file_name)
+            for file_name in sorted(os.listdir(args.database))
+            if file_name.endswith(ShardedSqliteMinerStorage.SHARD_FILE_SUFFIX)
+        ]
+    else:
+        databases = [args.database]
+
+    start = time.perf_counter()
+    rows_migrated = sum(
+        SqliteMinerStorage.migrate_label_ids(database, batch_size=args.batch_size)
+        for database in databases
+    )
+    print(f"Migrated {rows_migrated} rows in {time.perf_counter() - start:.2f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import asyncio
+import concurrent.futures
+import dataclasses
+import functools
+import threading
+import time
+from typing import Callable, Dict, List, TypeVar
+
+from common import constants
+from common.data import (
+    CompressedMinerIndex,
+    DataEntity,
+    DataEntityBucketId,
+    HuggingFaceMetadata,
+)
+from storage.miner.miner_storage import MinerStorage, SerializedMinerIndex
+
+T = TypeVar("T")
+
+
+@dataclasses.dataclass
+class AsyncStorageStats:
+    """Counters describing how long axon requests waited for a storage worker."""
+
+    # Requests waiting for a worker or running right now.
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    completed: int = 0
+    failed: int = 0
+    # Time between a request being submitted and a worker starting it.
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    # Time a worker spent running requests.
+    total_run_seconds: float = 0.0
+
+
+class AsyncMinerStorage:
+    """Async facade over a MinerStorage for the miner's axon handlers.
+
+    Every query runs on a dedicated, bounded pool of worker threads so that reading a large DataEntityBucket never
+    blocks the axon's event loop. The pool is separate from the threads scrapers use to write, so validator requests
+    only ever queue behind other validator requests.
+    """
+
+    def __init__(self, storage: MinerStorage, max_workers: int = 4):
+        self.storage = storage
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="MinerStorageReader"
+        )
+
+        self.stats_lock = threading.Lock()
+        self.stats = AsyncStorageStats()
+
+    def _run(self, func: Callable[[], T], submitted: float) -> T:
+        started = time.perf_counter()
+        wait_seconds = started - submitted
+        with self.stats_lock:
+            self.stats.total_wait_seconds += wait_seconds
+            self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, wait_seconds)
+
+        try:
+            result = func()
+        except BaseException:
+            with self.stats_lock:
+                self.stats.failed += 1
+            raise
+        finally:
+            with self.stats_lock:
+                self.stats.queue_depth -= 1
+                self.stats.total_run_seconds += time.perf_counter() - started
+
+        with self.stats_lock:
+            self.stats.completed += 1
+        return result
+
+    async def _submit(self, func: Callable[[], T]) -> T:
+        with self.stats_lock:
+            self.stats.queue_depth += 1
+            self.stats.max_queue_depth = max(
+                self.stats.max_queue_depth, self.stats.queue_depth
+            )
+
+        submitted = time.perf_counter()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, self._run, func, submitted
+            )
+        except RuntimeError:
+            # The executor has been shut down so the request never reached a worker.
+            with self.stats_lock:
+                self.stats.queue_depth -= 1
+                self.stats.failed += 1
+            raise
+        return await future
+
+    def get_stats(self) -> AsyncStorageStats:
+        """Returns a snapshot of the counters."""
+        with self.stats_lock:
+            return dataclasses.replace(self.stats)
+
+    def shutdown(self, wait: bool = True):
+        """Stops accepting new requests and, if wait is set, waits for the running ones to finish."""
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+    async def get_compressed_index(
+        self,
+        bucket_count_limit=constants.DATA_ENTITY_BUCKET_COUNT_LIMIT_PER_MINER_INDEX_PROTOCOL_4,
+    ) -> CompressedMinerIndex:
+        """See MinerStorage.get_compressed_index."""
+        return await self._submit(
+            functools.partial(
+                self.storage.get_compressed_index, bucket_count_limit=bucket_count_limit
+            )
+        )
+
+    async def get_serialized_compressed_index(self) -> SerializedMinerIndex:
+        """See MinerStorage.get_serialized_compressed_index."""
+        return await self._submit(self.storage.get_serialized_compressed_index)
+
+    async def list_data_entities_in_data_entity_bucket(
+        self, data_entity_bucket_id: DataEntityBucketId
+    ) -> List[DataEntity]:
+        """See MinerStorage.list_data_entities_in_data_entity_bucket."""
+        return await self._submit(
+            functools.partial(
+                self.storage.list_data_entities_in_data_entity_bucket,
+                data_entity_bucket_id,
+            )
+        )
+
+    async def list_contents_in_data_entity_buckets(
+        self, data_entity_bucket_ids: List[DataEntityBucketId]
+    ) -> Dict[DataEntityBucketId, List[bytes]]:
+        """See MinerStorage.list_contents_in_data_entity_buckets."""
+        return await self._submit(
+            functools.partial(
+                self.storage.list_contents_in_data_entity_buckets,
+                data_entity_bucket_ids,
+            )
+        )
+
+    async def get_hf_metadata(self, unique_id: str) -> List[HuggingFaceMetadata]:
+        """Returns the HuggingFace metadata stored for the unique id."""
+        return await self._submit(
+            functools.partial(self.storage.get_hf_metadata, unique_id)
+        )
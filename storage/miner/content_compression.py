@@ -0,0 +1,191 @@
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import zstandard
+
+
+# Every zstd frame starts with these bytes. Raw content is JSON, so it can never start with them.
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# The zstd CLI default. Large enough to capture the repeated field names and URL prefixes of each source.
+DEFAULT_DICTIONARY_SIZE_BYTES = 112 * 1024
+
+# The number of recent contents per source used to train a dictionary.
+CONTENT_DICTIONARY_SAMPLE_COUNT = 10_000
+
+CONTENT_DICTIONARY_TABLE_CREATE = """CREATE TABLE IF NOT EXISTS ContentDictionary (
+                            id                  INTEGER         PRIMARY KEY,
+                            dictId              INTEGER         NOT NULL UNIQUE,
+                            source              INTEGER         NOT NULL,
+                            dictionary          BLOB            NOT NULL
+                            )"""
+
+
+def is_compressed(content: bytes) -> bool:
+    """Returns whether the content is a zstd frame rather than raw content."""
+    return content[:4] == ZSTD_MAGIC
+
+
+def train_dictionary(
+    samples: List[bytes], dictionary_size_bytes=DEFAULT_DICTIONARY_SIZE_BYTES
+) -> bytes:
+    """Trains a zstd dictionary from sample contents of a single DataSource."""
+    return zstandard.train_dictionary(dictionary_size_bytes, samples).as_bytes()
+
+
+class ContentCompressor:
+    """Compresses DataEntity content with zstd, using the most recently added dictionary for each DataSource.
+
+    Decompression selects the dictionary from the id recorded in the zstd frame, so content compressed with an older
+    dictionary (or without one) stays readable as long as its dictionary is still registered. When a dictionaries_loader
+    is provided, content compressed with an unknown dictionary reloads the dictionaries first, so content rewritten by a
+    migration running alongside stays readable.
+
+    zstd contexts can not be used concurrently, so each thread lazily creates its own.
+    """
+
+    def __init__(
+        self,
+        level: int = 3,
+        dictionaries_loader: Optional[Callable[[], List[Tuple[int, bytes]]]] = None,
+    ):
+        self.level = level
+        # Returns the (source, dictionary) of every stored dictionary, oldest first.
+        self.dictionaries_loader = dictionaries_loader
+
+        self.lock = threading.Lock()
+        # Serializes reloads, so concurrent reads of newly migrated content only reload once.
+        self.reload_lock = threading.Lock()
+        # Dictionaries by dictionary id.
+        self.dictionaries: Dict[int, zstandard.ZstdCompressionDict] = {}
+        # The dictionary id used to compress new content for each source.
+        self.source_dict_ids: Dict[int, int] = {}
+
+        self.thread_local = threading.local()
+
+    def add_dictionary(self, source: int, dictionary: bytes) -> int:
+        """Registers a dictionary and uses it to compress new content for the source. Returns the dictionary id."""
+        compression_dict = zstandard.ZstdCompressionDict(dictionary)
+        # Precompute once so every compressor created from this dictionary is cheap.
+        compression_dict.precompute_compress(level=self.level)
+        dict_id = compression_dict.dict_id()
+
+        with self.lock:
+            self.dictionaries[dict_id] = compression_dict
+            self.source_dict_ids[source] = dict_id
+        return dict_id
+
+    def _reload_dictionary(self, dict_id: int) -> Optional[zstandard.ZstdCompressionDict]:
+        """Reloads the dictionaries if dict_id is still unknown, returning its dictionary if it is now registered."""
+        if self.dictionaries_loader is None:
+            return None
+
+        with self.reload_lock:
+            with self.lock:
+                compression_dict = self.dictionaries.get(dict_id)
+            if compression_dict is not None:
+                return compression_dict
+
+            for source, dictionary in self.dictionaries_loader():
+                # Re-adding every dictionary in order keeps the latest dictionary of each source current.
+                self.add_dictionary(source, dictionary)
+
+            with self.lock:
+                return self.dictionaries.get(dict_id)
+
+    def _get_contexts(self):
+        contexts = getattr(self.thread_local, "contexts", None)
+        if contexts is None:
+            contexts = self.thread_local.contexts = ({}, {})
+        return contexts
+
+    def _get_compressor(self, dict_id: int) -> zstandard.ZstdCompressor:
+        compressors, _ = self._get_contexts()
+        compressor = compressors.get(dict_id)
+        if compressor is None:
+            if dict_id == 0:
+                compressor = zstandard.ZstdCompressor(level=self.level)
+            else:
+                with self.lock:
+                    compression_dict = self.dictionaries[dict_id]
+                compressor = zstandard.ZstdCompressor(
+                    level=self.level, dict_data=compression_dict
+                )
+            compressors[dict_id] = compressor
+        return compressor
+
+    def _get_decompressor(self, dict_id: int) -> zstandard.ZstdDecompressor:
+        _, decompressors = self._get_contexts()
+        decompressor = decompressors.get(dict_id)
+        if decompressor is None:
+            if dict_id == 0:
+                decompressor = zstandard.ZstdDecompressor()
+            else:
+                with self.lock:
+                    compression_dict = self.dictionaries.get(dict_id)
+                if compression_dict is None:
+                    compression_dict = self._reload_dictionary(dict_id)
+                if compression_dict is None:
+                    raise ValueError(
+                        f"Content was compressed with unknown dictionary {dict_id}."
+                    )
+                decompressor = zstandard.ZstdDecompressor(dict_data=compression_dict)
+            decompressors[dict_id] = decompressor
+        return decompressor
+
+    def compress(self, source: int, content: bytes) -> bytes:
+        """Compresses the content using the current dictionary of its source, if any."""
+        with self.lock:
+            dict_id = self.source_dict_ids.get(source, 0)
+        return self._get_compressor(dict_id).compress(content)
+
+    def is_compressed_with_current_dictionary(self, source: int, content: bytes) -> bool:
+        """Returns whether the content is already compressed with the current dictionary of its source."""
+        if not is_compressed(content):
+            return False
+        with self.lock:
+            dict_id = self.source_dict_ids.get(source, 0)
+        return zstandard.get_frame_parameters(content).dict_id == dict_id
+
+    def decompress(self, content: bytes) -> bytes:
+        """Returns the raw content, decompressing it if necessary."""
+        if not is_compressed(content):
+            return content
+        dict_id = zstandard.get_frame_parameters(content).dict_id
+        return self._get_decompressor(dict_id).decompress(content)
+
+
+def read_content_dictionaries(connection: sqlite3.Connection) -> List[Tuple[int, bytes]]:
+    """Returns the (source, dictionary) of every dictionary stored in the database, oldest first."""
+    table_exists = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ContentDictionary'"
+    ).fetchone()
+    if not table_exists:
+        return []
+    return [
+        (source, dictionary)
+        for source, dictionary in connection.execute(
+            "SELECT source, dictionary FROM ContentDictionary ORDER BY id ASC"
+        ).fetchall()
+    ]
+
+
+def load_content_compressor(
+    connection: sqlite3.Connection,
+    dictionaries_loader: Optional[Callable[[], List[Tuple[int, bytes]]]] = None,
+) -> ContentCompressor:
+    """Creates a ContentCompressor with every dictionary stored in the database.
+
+    Dictionaries are reloaded with dictionaries_loader when content compressed with an unknown one is read. Defaults to
+    reading them again from connection.
+    """
+    if dictionaries_loader is None:
+        dictionaries_loader = lambda: read_content_dictionaries(connection)
+    compressor = ContentCompressor(dictionaries_loader=dictionaries_loader)
+
+    # Oldest first so that the latest dictionary of each source is used for compression.
+    for source, dictionary in read_content_dictionaries(connection):
+        compressor.add_dictionary(source, dictionary)
+
+    return compressor
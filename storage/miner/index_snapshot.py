@@ -0,0 +1,108 @@
+import dataclasses
+import datetime as dt
+import json
+import os
+import time
+from typing import Optional
+
+import bittensor as bt
+
+from common.data import CompressedMinerIndex
+from storage.miner.miner_storage import SerializedMinerIndex
+
+
+@dataclasses.dataclass
+class IndexSnapshot:
+    """A compressed index persisted to disk so that it can be served immediately after a restart."""
+
+    generation: str
+    content_size_bytes: int
+    built_at: dt.datetime
+    compressed_index: CompressedMinerIndex
+    serialized_index: SerializedMinerIndex
+
+
+def write_index_snapshot(
+    path: str,
+    generation: str,
+    content_size_bytes: int,
+    built_at: dt.datetime,
+    serialized_index: SerializedMinerIndex,
+):
+    """Atomically replaces the snapshot at path.
+
+    content_size_bytes must be read in the same transaction as the buckets the index was built from.
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(
+            {
+                "generation": generation,
+                "content_size_bytes": content_size_bytes,
+                "built_at": built_at.isoformat(),
+                "size_bytes": serialized_index.size_bytes,
+                "bucket_count": serialized_index.bucket_count,
+                "compressed_index_serialized": serialized_index.compressed_index_serialized,
+            },
+            f,
+        )
+    os.replace(temp_path, path)
+
+
+def read_index_snapshot(
+    path: str, generation: str, content_size_bytes: int, max_age: dt.timedelta
+) -> Optional[IndexSnapshot]:
+    """Reads the snapshot at path, returning None if it is missing, unreadable, too old or for another database.
+
+    Snapshots built before the content last changed, e.g. by a later write or eviction, are also rejected.
+    """
+    if not os.path.exists(path):
+        return None
+
+    start = time.perf_counter()
+    try:
+        with open(path, "r") as f:
+            snapshot = json.load(f)
+
+        if snapshot["generation"] != generation:
+            bt.logging.info(
+                f"Ignoring index snapshot {path} since it was built for a different database."
+            )
+            return None
+
+        if snapshot["content_size_bytes"] != content_size_bytes:
+            bt.logging.info(
+                f"Ignoring index snapshot {path} since the content changed after it was built."
+            )
+            return None
+
+        built_at = dt.datetime.fromisoformat(snapshot["built_at"])
+        if dt.datetime.now() - built_at > max_age:
+            bt.logging.info(
+                f"Ignoring index snapshot {path} since it was built at {built_at}."
+            )
+            return None
+
+        serialized_index = SerializedMinerIndex(
+            compressed_index_serialized=snapshot["compressed_index_serialized"],
+            size_bytes=snapshot["size_bytes"],
+            bucket_count=snapshot["bucket_count"],
+        )
+        compressed_index = CompressedMinerIndex.model_validate_json(
+            serialized_index.compressed_index_serialized
+        )
+    except Exception:
+        bt.logging.warning(f"Ignoring unreadable index snapshot {path}.")
+        return None
+
+    bt.logging.info(
+        f"Loaded index snapshot of {serialized_index.bucket_count} buckets built at {built_at} "
+        + f"in {time.perf_counter() - start:.3f}s."
+    )
+    return IndexSnapshot(
+        generation=generation,
+        content_size_bytes=content_size_bytes,
+        built_at=built_at,
+        compressed_index=compressed_index,
+        serialized_index=serialized_index,
+    )
@@ -0,0 +1,203 @@
+import asyncio
+import dataclasses
+import queue
+import threading
+import time
+import traceback
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import bittensor as bt
+
+from common.data import DataEntity
+from storage.miner.miner_storage import MinerStorage
+
+
+@dataclasses.dataclass
+class IngestStats:
+    """Counters describing the batches flowing through the IngestWriter."""
+
+    # Scraped batches waiting to be written right now.
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    submitted_batches: int = 0
+    submitted_entities: int = 0
+    # How often, and for how long, scrapers waited because the queue was full.
+    backpressure_waits: int = 0
+    backpressure_wait_seconds: float = 0.0
+    commits: int = 0
+    failed_commits: int = 0
+    committed_entities: int = 0
+    # Entities already stored unchanged, which were dropped instead of being rewritten.
+    skipped_unchanged_entities: int = 0
+    skipped_unchanged_entities_by_scraper: Dict[str, int] = dataclasses.field(
+        default_factory=dict
+    )
+    max_commit_entities: int = 0
+    total_commit_seconds: float = 0.0
+    max_commit_seconds: float = 0.0
+
+
+class IngestWriter:
+    """Single writer that coalesces scraped batches of DataEntities into large MinerStorage writes.
+
+    Scrapers submit batches onto a bounded queue. One writer thread drains the queue, combining batches until either
+    the size thresholds are reached or the oldest batch has waited max_delay_seconds, and then stores them in one call.
+    When the queue is full, submitters block until the writer catches up. Entities the storage already holds unchanged
+    are dropped before the write and counted per scraper.
+    """
+
+    def __init__(
+        self,
+        storage: MinerStorage,
+        max_queue_batches: int = 64,
+        max_commit_entities: int = 50_000,
+        max_commit_bytes: int = 64 * 1024 * 1024,
+        max_delay_seconds: float = 1.0,
+    ):
+        self.storage = storage
+        self.max_commit_entities = max_commit_entities
+        self.max_commit_bytes = max_commit_bytes
+        self.max_delay_seconds = max_delay_seconds
+
+        self.queue = queue.Queue(maxsize=max_queue_batches)
+
+        self.stats_lock = threading.Lock()
+        self.stats = IngestStats()
+
+        self.is_running = False
+        self.thread = None
+
+    def start(self):
+        """Starts the writer thread."""
+        assert not self.is_running, "IngestWriter already running"
+        self.is_running = True
+        self.thread = threading.Thread(
+            target=self._run, name="IngestWriter", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self, timeout: float = 30):
+        """Writes everything already submitted and stops the writer thread."""
+        if not self.is_running:
+            return
+        self.is_running = False
+        self.thread.join(timeout)
+
+    def submit(self, data_entities: List[DataEntity], scraper_id: Optional[str] = None):
+        """Queues a batch for writing, blocking while the queue is full."""
+        if not data_entities:
+            return
+
+        try:
+            self.queue.put_nowait((scraper_id, data_entities))
+        except queue.Full:
+            start = time.perf_counter()
+            self.queue.put((scraper_id, data_entities))
+            with self.stats_lock:
+                self.stats.backpressure_waits += 1
+                self.stats.backpressure_wait_seconds += time.perf_counter() - start
+
+        with self.stats_lock:
+            self.stats.submitted_batches += 1
+            self.stats.submitted_entities += len(data_entities)
+            self.stats.max_queue_depth = max(
+                self.stats.max_queue_depth, self.queue.qsize()
+            )
+
+    async def submit_async(
+        self, data_entities: List[DataEntity], scraper_id: Optional[str] = None
+    ):
+        """Queues a batch for writing without blocking the event loop while the queue is full."""
+        await asyncio.to_thread(self.submit, data_entities, scraper_id)
+
+    def flush(self):
+        """Blocks until every batch submitted so far has been written."""
+        self.queue.join()
+
+    def get_stats(self) -> IngestStats:
+        """Returns a snapshot of the counters."""
+        with self.stats_lock:
+            stats = dataclasses.replace(
+                self.stats,
+                skipped_unchanged_entities_by_scraper=dict(
+                    self.stats.skipped_unchanged_entities_by_scraper
+                ),
+            )
+        stats.queue_depth = self.queue.qsize()
+        return stats
+
+    def _run(self):
+        # Keep draining after stop() until everything submitted has been written.
+        while self.is_running or not self.queue.empty():
+            try:
+                first_batch = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            batches = [first_batch]
+            entity_count = len(first_batch[1])
+            byte_count = sum(entity.content_size_bytes for entity in first_batch[1])
+            deadline = time.monotonic() + self.max_delay_seconds
+
+            # Coalesce further batches until a threshold is reached or the first batch has waited long enough.
+            while (
+                entity_count < self.max_commit_entities
+                and byte_count < self.max_commit_bytes
+            ):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batches.append(batch)
+                entity_count += len(batch[1])
+                byte_count += sum(entity.content_size_bytes for entity in batch[1])
+
+            self._commit(batches)
+
+    def _commit(self, batches: List[Tuple[Optional[str], List[DataEntity]]]):
+        start = time.perf_counter()
+        data_entities = []
+        skipped_by_scraper = defaultdict(int)
+        try:
+            for scraper_id, batch in batches:
+                changed = self.storage.filter_unchanged_data_entities(batch)
+                skipped_by_scraper[scraper_id] += len(batch) - len(changed)
+                data_entities.extend(changed)
+            if data_entities:
+                self.storage.store_data_entities(data_entities)
+            failed = False
+        except Exception:
+            failed = True
+            bt.logging.error(
+                f"IngestWriter failed to store {len(data_entities)} entities: {traceback.format_exc()}"
+            )
+        finally:
+            for _ in batches:
+                self.queue.task_done()
+
+        commit_seconds = time.perf_counter() - start
+        with self.stats_lock:
+            if failed:
+                self.stats.failed_commits += 1
+                return
+            for scraper_id, skipped in skipped_by_scraper.items():
+                self.stats.skipped_unchanged_entities += skipped
+                if scraper_id is not None and skipped:
+                    by_scraper = self.stats.skipped_unchanged_entities_by_scraper
+                    by_scraper[scraper_id] = by_scraper.get(scraper_id, 0) + skipped
+            if not data_entities:
+                return
+            entity_count = len(data_entities)
+            self.stats.commits += 1
+            self.stats.committed_entities += entity_count
+            self.stats.max_commit_entities = max(
+                self.stats.max_commit_entities, entity_count
+            )
+            self.stats.total_commit_seconds += commit_seconds
+            self.stats.max_commit_seconds = max(
+                self.stats.max_commit_seconds, commit_seconds
+            )
@@ -0,0 +1,123 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Tuple
+
+from common import utils
+from common.data import DataEntity
+
+
+def _hash(*parts: bytes) -> int:
+    hasher = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        hasher.update(part)
+    return int.from_bytes(hasher.digest(), "little")
+
+
+class KnownUriFilter:
+    """LRU of recently stored URIs mapped to a digest of what was stored for each.
+
+    Used to skip rewriting re-scraped DataEntities that are already stored unchanged. Both keys and digests are 64 bit
+    hashes, so it stays small enough to hold the last few hundred thousand entities. Entries must only be added once
+    their write has committed, and must be forgotten once deleted. Each entry keeps the time bucket it was stored in,
+    so clearing the oldest time buckets only forgets their entities.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        # Maps each uri key to the (digest, time bucket id) of the entity stored for it.
+        self.digests: OrderedDict[int, Tuple[int, int]] = OrderedDict()
+
+    @staticmethod
+    def digest(
+        uri: str,
+        datetime,
+        source: int,
+        label: str,
+        content: bytes,
+        content_size_bytes: int,
+    ) -> Tuple[int, Tuple[int, int]]:
+        """Returns the (uri key, (digest, time bucket id)) of an entity.
+
+        The digest covers every column that REPLACE INTO would rewrite.
+        """
+        fields = f"{uri}\0{utils.datetime_to_epoch_micros(datetime)}\0{int(source)}\0{label}\0{content_size_bytes}\0"
+        return KnownUriFilter.uri_key(uri), (
+            _hash(fields.encode(), content),
+            utils.time_bucket_id_from_datetime(datetime),
+        )
+
+    @staticmethod
+    def uri_key(uri: str) -> int:
+        """Returns the key an entity with the provided URI is remembered by."""
+        return _hash(uri.encode())
+
+    @staticmethod
+    def digest_data_entity(data_entity: DataEntity) -> Tuple[int, Tuple[int, int]]:
+        """Returns the (uri key, (digest, time bucket id)) of a DataEntity."""
+        return KnownUriFilter.digest(
+            data_entity.uri,
+            data_entity.datetime,
+            data_entity.source,
+            "NULL" if data_entity.label is None else data_entity.label.value,
+            data_entity.content,
+            data_entity.content_size_bytes,
+        )
+
+    def filter_unchanged(self, data_entities: List[DataEntity]) -> List[DataEntity]:
+        """Returns the DataEntities that are not known to be stored exactly as provided, in order."""
+        changed = []
+        with self.lock:
+            for data_entity in data_entities:
+                key, digest = KnownUriFilter.digest_data_entity(data_entity)
+                if self.digests.get(key) != digest:
+                    changed.append(data_entity)
+        return changed
+
+    def remember(self, digests: Iterable[Tuple[int, Tuple[int, int]]]):
+        """Records the (uri key, (digest, time bucket id)) of committed entities as the most recently stored."""
+        with self.lock:
+            for key, digest in digests:
+                self.digests[key] = digest
+                self.digests.move_to_end(key)
+            while len(self.digests) > self.capacity:
+                self.digests.popitem(last=False)
+
+    def seed(self, digests: Iterable[Tuple[int, Tuple[int, int]]]) -> int:
+        """Adds older entities, newest first, behind everything already remembered until the filter is full.
+
+        Returns:
+            int: The number of entities added.
+        """
+        added = 0
+        with self.lock:
+            for key, digest in digests:
+                if len(self.digests) >= self.capacity:
+                    break
+                if key in self.digests:
+                    continue
+                self.digests[key] = digest
+                self.digests.move_to_end(key, last=False)
+                added += 1
+        return added
+
+    def forget(self, keys: Iterable[int]):
+        """Forgets the entities with the provided uri keys, e.g. after they have been deleted."""
+        with self.lock:
+            for key in keys:
+                self.digests.pop(key, None)
+
+    def forget_time_buckets(self, first_time_bucket_id: int, last_time_bucket_id: int):
+        """Forgets the entities stored in any time bucket from first_time_bucket_id to last_time_bucket_id inclusive."""
+        with self.lock:
+            forgotten_keys = [
+                key
+                for key, (_, time_bucket_id) in self.digests.items()
+                if first_time_bucket_id <= time_bucket_id <= last_time_bucket_id
+            ]
+            for key in forgotten_keys:
+                del self.digests[key]
+
+    def __len__(self) -> int:
+        return len(self.digests)
@@ -0,0 +1,68 @@
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional
+
+# Interns each DataEntity label, including the "NULL" label, into a small integer labelId.
+LABEL_TABLE_CREATE = """CREATE TABLE IF NOT EXISTS Label (
+                            labelId             INTEGER         PRIMARY KEY,
+                            label               TEXT            NOT NULL    UNIQUE
+                            )"""
+
+
+class LabelCache:
+    """In-process cache of the Label table mapping each label to its labelId.
+
+    Labels are never removed or renumbered, so a cached labelId never goes stale. Labels added through another
+    connection or process are looked up in the database on a cache miss.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.label_ids: Dict[str, int] = {}
+
+    def load(self, connection: sqlite3.Connection):
+        """Caches every label already in the Label table."""
+        rows = connection.execute("SELECT label, labelId FROM Label").fetchall()
+        with self.lock:
+            self.label_ids.update((row[0], row[1]) for row in rows)
+
+    def get_id(self, connection: sqlite3.Connection, label: str) -> Optional[int]:
+        """Returns the labelId of the label, or None if no DataEntity has ever been stored with it."""
+        label_id = self.label_ids.get(label)
+        if label_id is not None:
+            return label_id
+
+        row = connection.execute(
+            "SELECT labelId FROM Label WHERE label = ?", [label]
+        ).fetchone()
+        if row is None:
+            return None
+        with self.lock:
+            self.label_ids[label] = row[0]
+        return row[0]
+
+    def get_or_insert_ids(
+        self, connection: sqlite3.Connection, labels: Iterable[str]
+    ) -> Dict[str, int]:
+        """Returns the labelId of every label, inserting any new labels.
+
+        Must be called within the write transaction that uses the ids. New ids are only cached once that transaction
+        has been committed, by passing the result to remember().
+        """
+        label_ids = {}
+        for label in set(labels):
+            label_id = self.label_ids.get(label)
+            if label_id is None:
+                connection.execute(
+                    "INSERT OR IGNORE INTO Label (label) VALUES (?)", [label]
+                )
+                label_id = connection.execute(
+                    "SELECT labelId FROM Label WHERE label = ?", [label]
+                ).fetchone()[0]
+            label_ids[label] = label_id
+        return label_ids
+
+    def remember(self, label_ids: Dict[str, int]):
+        """Caches labelIds whose insertion has been committed."""
+        with self.lock:
+            self.label_ids.update(label_ids)
@@ -1,13 +1,47 @@
 from abc import ABC, abstractmethod
+import dataclasses
 from common.data import (
     CompressedMinerIndex,
     DataEntity,
     DataEntityBucketId,
 )
-from typing import Dict, List
+from typing import Dict, List, Optional
 import datetime as dt
 
 
+@dataclasses.dataclass(frozen=True)
+class SerializedMinerIndex:
+    """A CompressedMinerIndex serialized once for every GetMinerIndex request, along with its summary stats."""
+
+    compressed_index_serialized: str
+    size_bytes: int
+    bucket_count: int
+
+    @classmethod
+    def from_compressed_index(
+        cls, index: CompressedMinerIndex
+    ) -> "SerializedMinerIndex":
+        return cls(
+            compressed_index_serialized=index.model_dump_json(),
+            size_bytes=CompressedMinerIndex.size_bytes(index),
+            bucket_count=CompressedMinerIndex.bucket_count(index),
+        )
+
+
+@dataclasses.dataclass
+class LabelStats:
+    """Totals of the DataEntities stored for one source and label."""
+
+    source: int
+    label: Optional[str]
+    row_count: int
+    size_bytes: int
+    # May be earlier than the earliest entity still stored, if the earliest one was overwritten with a later datetime.
+    earliest_datetime: Optional[dt.datetime]
+    # May be later than the latest entity still stored, if the latest one was overwritten with an earlier datetime.
+    latest_datetime: Optional[dt.datetime]
+
+
 class MinerStorage(ABC):
     """An abstract class which defines the contract that all implementations of MinerStorage must fulfill."""
 
@@ -16,6 +50,16 @@ class MinerStorage(ABC):
         """Stores any number of DataEntities, making space if necessary."""
         raise NotImplemented
 
+    def filter_unchanged_data_entities(
+        self, data_entities: List[DataEntity]
+    ) -> List[DataEntity]:
+        """Returns the DataEntities that are not already stored exactly as provided, in order.
+
+        Storing only the returned DataEntities has the same effect as storing all of them. By default every DataEntity
+        is returned.
+        """
+        return data_entities
+
     @abstractmethod
     def list_data_entities_in_data_entity_bucket(
         self, data_entity_bucket_id: DataEntityBucketId
@@ -28,11 +72,21 @@ class MinerStorage(ABC):
         """Gets the compressed MinedIndex, which is a summary of all of the DataEntities that this MinerStorage is currently serving."""
         raise NotImplemented
 
+    @abstractmethod
+    def get_serialized_compressed_index(self) -> SerializedMinerIndex:
+        """Gets the compressed MinerIndex already serialized for GetMinerIndex responses."""
+        raise NotImplemented
+
     @abstractmethod
     def refresh_compressed_index(self, date_time: dt.timedelta):
         """Refreshes the compressed MinerIndex."""
         raise NotImplemented
 
+    @abstractmethod
+    def list_label_stats(self) -> List[LabelStats]:
+        """Lists the row count, size and datetime range of the DataEntities stored for each source and label."""
+        raise NotImplemented
+
     @abstractmethod
     def list_contents_in_data_entity_buckets(
         self, data_entity_bucket_ids: List[DataEntityBucketId]
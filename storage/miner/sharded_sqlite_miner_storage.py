@@ -0,0 +1,745 @@
+from collections import defaultdict
+import contextlib
+import dataclasses
+import datetime as dt
+import os
+import threading
+import time
+import traceback
+from typing import Dict, Iterator, List, Optional, Set
+
+import bittensor as bt
+
+from common import constants, utils
+from common.data import (
+    CompressedMinerIndex,
+    DataEntity,
+    DataEntityBucketId,
+    HuggingFaceMetadata,
+    TimeBucket,
+)
+from storage.miner.index_snapshot import read_index_snapshot, write_index_snapshot
+from storage.miner.known_uri_filter import KnownUriFilter
+from storage.miner.miner_storage import (
+    LabelStats,
+    MinerStorage,
+    SerializedMinerIndex,
+)
+from storage.miner.sqlite_connection_pool import ConnectionPoolStats
+from storage.miner.storage_metadata import DATETIME_FORMAT_EPOCH_MICROS
+from storage.miner.sqlite_miner_storage import (
+    DiskUsage,
+    EvictionResult,
+    SqliteMinerStorage,
+    build_compressed_index,
+    get_content_bytes_to_clear,
+)
+
+
+class ShardedSqliteMinerStorage(MinerStorage):
+    """MinerStorage that partitions DataEntities into one SqliteMinerStorage file per UTC day.
+
+    Every DataEntityBucket falls entirely within one shard, so bucket reads only touch a small file and the index is
+    built by concatenating the per shard bucket aggregates. Expiring data past DATA_ENTITY_BUCKET_AGE_LIMIT_DAYS, or
+    clearing the oldest data when full, unlinks whole shard files instead of running large DELETEs.
+
+    HuggingFace metadata is kept in a separate metadata database inside the shard directory.
+
+    Each URI is only stored in one shard. Storing a DataEntity deletes its URI from every other shard, so one whose
+    datetime moved to another UTC day is not counted twice.
+
+    Shards are leased for the duration of every operation, so a shard is only closed and deleted once its last user
+    is done with it. The known URI filter is shared by all shards and each shard opens at most
+    MAX_SHARD_READER_CONNECTION_COUNT readers, so memory and file descriptors do not grow with the retained days.
+    """
+
+    SHARD_FILE_PREFIX = "DataEntity_"
+    SHARD_FILE_SUFFIX = ".sqlite"
+    SHARD_DATE_FORMAT = "%Y-%m-%d"
+    METADATA_FILE = "Metadata.sqlite"
+    INDEX_SNAPSHOT_FILE = "IndexSnapshot.json"
+    MAX_SHARD_READER_CONNECTION_COUNT = 2
+
+    def __init__(
+        self,
+        directory="SqliteMinerStorage.shards",
+        max_database_size_gb_hint=250,
+        reader_connection_count=2,
+        compress_content=False,
+        integer_timestamps=False,
+        split_content=False,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.reader_connection_count = reader_connection_count
+        self.compress_content = compress_content
+        # Only applies to newly created shards. Existing shards keep the layout they were created with.
+        self.split_content = split_content
+
+        self.database_max_content_size_bytes = utils.gb_to_bytes(
+            max_database_size_gb_hint
+        )
+        self.database_max_size_bytes = utils.gb_to_bytes(max_database_size_gb_hint)
+
+        # Holds the HFMetaData table and the content dictionaries copied into new shards. No DataEntities are stored here.
+        self.metadata_storage = SqliteMinerStorage(
+            os.path.join(directory, ShardedSqliteMinerStorage.METADATA_FILE),
+            max_database_size_gb_hint,
+            reader_connection_count=1,
+            integer_timestamps=integer_timestamps,
+        )
+        # New shards store datetimes as integers once the shard directory has been created with or migrated to them.
+        self.integer_timestamps = (
+            self.metadata_storage.get_datetime_format()
+            == DATETIME_FORMAT_EPOCH_MICROS
+        )
+
+        # Recently stored entities across all shards. Entity datetimes are part of the digest, so entries never clash.
+        self.known_uri_filter = KnownUriFilter(constants.MINER_KNOWN_URI_FILTER_CAPACITY)
+
+        # Lock around opening, creating, leasing and dropping shards. Guards everything below.
+        self.shards_lock = threading.RLock()
+        # Notified whenever a shard is released or finishes being dropped.
+        self.shards_changed = threading.Condition(self.shards_lock)
+        self.shards: Dict[int, SqliteMinerStorage] = {}
+        # Number of operations currently using each shard.
+        self.shard_users: Dict[int, int] = defaultdict(int)
+        # Shards waiting for their last user before being deleted. They cannot be reopened until deleted.
+        self.dropping_shard_ids: Set[int] = set()
+        for file_name in os.listdir(directory):
+            shard_id = ShardedSqliteMinerStorage._parse_shard_id(file_name)
+            if shard_id is not None:
+                self._open_shard(shard_id)
+
+        # Lock to avoid concurrency issues on clearing space when full.
+        self.clearing_space_lock = threading.Lock()
+
+        # Lock around the refresh for the index.
+        self.cached_index_refresh_lock = threading.Lock()
+
+        # Lock around the cached get miner index.
+        self.cached_index_lock = threading.Lock()
+        self.cached_index_4 = None
+        self.cached_index_serialized = None
+        self.cached_index_updated = dt.datetime.min
+
+        # Serve the index persisted before the last restart until the refresh thread builds a new one.
+        # Snapshots are tied to the generation of the metadata database, which lives as long as the shard directory,
+        # and to the total content size across the shards when the index was built.
+        self.index_snapshot_path = os.path.join(
+            directory, ShardedSqliteMinerStorage.INDEX_SNAPSHOT_FILE
+        )
+        snapshot = read_index_snapshot(
+            self.index_snapshot_path,
+            self.metadata_storage.generation,
+            self.get_content_size_bytes(),
+            constants.MINER_INDEX_SNAPSHOT_MAX_AGE,
+        )
+        if snapshot is not None:
+            self.cached_index_4 = snapshot.compressed_index
+            self.cached_index_serialized = snapshot.serialized_index
+            self.cached_index_updated = snapshot.built_at
+
+    @staticmethod
+    def _shard_id_for_time_bucket(time_bucket_id: int) -> int:
+        """Returns the shard (days since epoch) holding the provided time bucket (hours since epoch)."""
+        return time_bucket_id // 24
+
+    @staticmethod
+    def _shard_file_name(shard_id: int) -> str:
+        date = utils.datetime_from_hours_since_epoch(shard_id * 24)
+        return (
+            ShardedSqliteMinerStorage.SHARD_FILE_PREFIX
+            + date.strftime(ShardedSqliteMinerStorage.SHARD_DATE_FORMAT)
+            + ShardedSqliteMinerStorage.SHARD_FILE_SUFFIX
+        )
+
+    @staticmethod
+    def _parse_shard_id(file_name: str):
+        """Returns the shard id for a shard file name or None if the file is not a shard."""
+        if not (
+            file_name.startswith(ShardedSqliteMinerStorage.SHARD_FILE_PREFIX)
+            and file_name.endswith(ShardedSqliteMinerStorage.SHARD_FILE_SUFFIX)
+        ):
+            return None
+
+        date_part = file_name[
+            len(ShardedSqliteMinerStorage.SHARD_FILE_PREFIX) : -len(
+                ShardedSqliteMinerStorage.SHARD_FILE_SUFFIX
+            )
+        ]
+        try:
+            date = dt.datetime.strptime(
+                date_part, ShardedSqliteMinerStorage.SHARD_DATE_FORMAT
+            ).replace(tzinfo=dt.timezone.utc)
+        except ValueError:
+            return None
+        return int(date.timestamp()) // (24 * 3600)
+
+    def _open_shard(self, shard_id: int) -> SqliteMinerStorage:
+        with self.shards_lock:
+            if shard_id not in self.shards:
+                shard = SqliteMinerStorage(
+                    os.path.join(
+                        self.directory,
+                        ShardedSqliteMinerStorage._shard_file_name(shard_id),
+                    ),
+                    reader_connection_count=min(
+                        self.reader_connection_count,
+                        ShardedSqliteMinerStorage.MAX_SHARD_READER_CONNECTION_COUNT,
+                    ),
+                    compress_content=self.compress_content,
+                    integer_timestamps=self.integer_timestamps,
+                    split_content=self.split_content,
+                    known_uri_filter=self.known_uri_filter,
+                )
+                # New shards compress with the same dictionaries as the rest of the store.
+                if not shard.get_content_dictionaries():
+                    for source, dictionary in self.metadata_storage.get_content_dictionaries():
+                        shard.add_content_dictionary(source, dictionary)
+                # Space is managed across all shards, so never let a shard clear space on its own.
+                shard.database_max_content_size_bytes = (
+                    self.database_max_content_size_bytes
+                )
+                shard.database_max_size_bytes = self.database_max_size_bytes
+                self.shards[shard_id] = shard
+            return self.shards[shard_id]
+
+    def _release_shard(self, shard_id: int):
+        with self.shards_lock:
+            self.shard_users[shard_id] -= 1
+            if self.shard_users[shard_id] == 0:
+                del self.shard_users[shard_id]
+                self.shards_changed.notify_all()
+
+    @contextlib.contextmanager
+    def _lease_shard(
+        self, shard_id: int, create: bool = False
+    ) -> Iterator[Optional[SqliteMinerStorage]]:
+        """Leases the shard for the duration of the context, creating it if requested. Yields None if it does not exist."""
+        with self.shards_lock:
+            # Never reopen the files of a shard that is about to be deleted.
+            self.shards_changed.wait_for(lambda: shard_id not in self.dropping_shard_ids)
+            if create:
+                shard = self._open_shard(shard_id)
+            else:
+                shard = self.shards.get(shard_id, None)
+            if shard is not None:
+                self.shard_users[shard_id] += 1
+
+        if shard is None:
+            yield None
+            return
+        try:
+            yield shard
+        finally:
+            self._release_shard(shard_id)
+
+    @contextlib.contextmanager
+    def _lease_shards(self) -> Iterator[List[SqliteMinerStorage]]:
+        """Leases every open shard, oldest first, for the duration of the context."""
+        with self.shards_lock:
+            shard_ids = sorted(self.shards)
+            for shard_id in shard_ids:
+                self.shard_users[shard_id] += 1
+            shards = [self.shards[shard_id] for shard_id in shard_ids]
+
+        try:
+            yield shards
+        finally:
+            for shard_id in shard_ids:
+                self._release_shard(shard_id)
+
+    def _drop_shard(self, shard_id: int):
+        """Closes the shard and deletes its files once its last user has released it.
+
+        Must not be called while holding a lease on the shard.
+        """
+        with self.shards_lock:
+            shard = self.shards.pop(shard_id)
+            self.dropping_shard_ids.add(shard_id)
+            try:
+                self.shards_changed.wait_for(lambda: shard_id not in self.shard_users)
+                shard.close()
+                for suffix in ["", "-wal", "-shm"]:
+                    path = shard.database + suffix
+                    if os.path.exists(path):
+                        os.remove(path)
+            finally:
+                self.dropping_shard_ids.discard(shard_id)
+                self.shards_changed.notify_all()
+            # Forget the entities of the shard, which would otherwise never be stored again if re-scraped.
+            self.known_uri_filter.forget_time_buckets(shard_id * 24, shard_id * 24 + 23)
+        bt.logging.info(f"Dropped shard {shard.database}.")
+
+    def close(self):
+        """Closes all shards. The storage cannot be used afterwards."""
+        with self.shards_lock:
+            for shard in self.shards.values():
+                shard.close()
+            self.shards.clear()
+        self.metadata_storage.close()
+
+    def get_connection_pool_stats(self) -> ConnectionPoolStats:
+        """Returns the connection pool counters summed across all shards."""
+        total = ConnectionPoolStats()
+        with self._lease_shards() as shards:
+            for shard in shards:
+                stats = shard.get_connection_pool_stats()
+                for field in dataclasses.fields(ConnectionPoolStats):
+                    setattr(
+                        total,
+                        field.name,
+                        getattr(total, field.name) + getattr(stats, field.name),
+                    )
+        return total
+
+    def get_content_size_bytes(self) -> int:
+        """Returns the total contentSizeBytes currently stored across all shards."""
+        with self._lease_shards() as shards:
+            return sum(shard.get_content_size_bytes() for shard in shards)
+
+    def get_disk_usage(self) -> DiskUsage:
+        """Returns the space taken up on disk by every shard and the metadata database."""
+        total = DiskUsage(
+            database_size_bytes=0, free_bytes=0, wal_size_bytes=0, content_size_bytes=0
+        )
+        with self._lease_shards() as shards:
+            for storage in shards + [self.metadata_storage]:
+                usage = storage.get_disk_usage()
+                for field in dataclasses.fields(DiskUsage):
+                    setattr(
+                        total,
+                        field.name,
+                        getattr(total, field.name) + getattr(usage, field.name),
+                    )
+        return total
+
+    def reconcile_content_size(self) -> int:
+        """Reconciles the running content size total of every shard, returning the total drift corrected."""
+        with self._lease_shards() as shards:
+            return sum(shard.reconcile_content_size() for shard in shards)
+
+    def add_content_dictionary(self, source: int, dictionary: bytes) -> int:
+        """Persists a zstd dictionary in every shard and uses it to compress new content for the source."""
+        with self.shards_lock:
+            for shard in self.shards.values():
+                shard.add_content_dictionary(source, dictionary)
+            return self.metadata_storage.add_content_dictionary(source, dictionary)
+
+    def train_content_dictionaries(self, **kwargs) -> Dict[int, int]:
+        """Trains a zstd dictionary per DataSource from the newest shard and adds it to every shard."""
+        with self._lease_shards() as shards:
+            if not shards:
+                return {}
+
+            newest_shard = shards[-1]
+            dict_ids = newest_shard.train_content_dictionaries(**kwargs)
+            dictionaries = newest_shard.get_content_dictionaries()
+        for source in dict_ids:
+            # The newly trained dictionary is the latest one for the source.
+            dictionary = [d for s, d in dictionaries if s == source][-1]
+            self.add_content_dictionary(source, dictionary)
+        return dict_ids
+
+    def migrate_content_compression(self, compress=True, **kwargs) -> int:
+        """Rewrites the content of every shard. See SqliteMinerStorage.migrate_content_compression."""
+        with self._lease_shards() as shards:
+            return sum(
+                shard.migrate_content_compression(compress, **kwargs) for shard in shards
+            )
+
+    def migrate_integer_timestamps(self, **kwargs) -> int:
+        """Converts stored datetimes in every shard to integer microseconds since epoch, including shards created later."""
+        with self.shards_lock:
+            self.metadata_storage.migrate_integer_timestamps(**kwargs)
+            self.integer_timestamps = True
+        with self._lease_shards() as shards:
+            return sum(shard.migrate_integer_timestamps(**kwargs) for shard in shards)
+
+    def enable_incremental_vacuum(self):
+        """Switches every existing shard and the metadata database to incremental auto-vacuum. New shards use it already."""
+        with self._lease_shards() as shards:
+            for storage in shards + [self.metadata_storage]:
+                storage.enable_incremental_vacuum()
+
+    def store_data_entities(self, data_entities: List[DataEntity]):
+        """Stores any number of DataEntities, making space if necessary."""
+
+        added_content_size = sum(
+            data_entity.content_size_bytes for data_entity in data_entities
+        )
+
+        # If the total size of the store is larger than our maximum configured stored content size then except.
+        if added_content_size > self.database_max_content_size_bytes:
+            raise ValueError(
+                "Content size to store: "
+                + str(added_content_size)
+                + " exceeds configured max: "
+                + str(self.database_max_content_size_bytes)
+            )
+
+        # Ensure only one thread is clearing space when necessary.
+        with self.clearing_space_lock:
+            content_bytes_to_clear = get_content_bytes_to_clear(
+                self.database_max_content_size_bytes,
+                self.database_max_size_bytes,
+                self.get_disk_usage(),
+                added_content_size,
+            )
+            if content_bytes_to_clear > 0:
+                self.clear_content_from_oldest(content_bytes_to_clear)
+
+        # Like REPLACE INTO, the last of several DataEntities with the same URI wins.
+        data_entities_by_shard = ShardedSqliteMinerStorage._group_by_shard(
+            list({data_entity.uri: data_entity for data_entity in data_entities}.values())
+        )
+        self._delete_from_other_shards(data_entities_by_shard)
+        for shard_id, shard_data_entities in data_entities_by_shard.items():
+            with self._lease_shard(shard_id, create=True) as shard:
+                shard.store_data_entities(shard_data_entities)
+
+    def _delete_from_other_shards(
+        self, data_entities_by_shard: Dict[int, List[DataEntity]]
+    ):
+        """Deletes each URI about to be stored from every shard other than the one it is stored in.
+
+        A re-scraped DataEntity whose datetime moved to another UTC day would otherwise be stored, and indexed, twice.
+        """
+        shard_ids_by_uri = {
+            data_entity.uri: shard_id
+            for shard_id, shard_data_entities in data_entities_by_shard.items()
+            for data_entity in shard_data_entities
+        }
+        with self.shards_lock:
+            shard_ids = sorted(self.shards)
+        for shard_id in shard_ids:
+            uris = [
+                uri
+                for uri, target_shard_id in shard_ids_by_uri.items()
+                if target_shard_id != shard_id
+            ]
+            if not uris:
+                continue
+            with self._lease_shard(shard_id) as shard:
+                if shard is not None:
+                    shard.delete_data_entities(uris)
+
+    @staticmethod
+    def _group_by_shard(
+        data_entities: List[DataEntity],
+    ) -> Dict[int, List[DataEntity]]:
+        data_entities_by_shard = defaultdict(list)
+        for data_entity in data_entities:
+            time_bucket_id = TimeBucket.from_datetime(data_entity.datetime).id
+            data_entities_by_shard[
+                ShardedSqliteMinerStorage._shard_id_for_time_bucket(time_bucket_id)
+            ].append(data_entity)
+        return data_entities_by_shard
+
+    def filter_unchanged_data_entities(
+        self, data_entities: List[DataEntity]
+    ) -> List[DataEntity]:
+        """Returns the DataEntities that are not known to be already stored exactly as provided, in order."""
+        changed_ids = set()
+        for shard_id, shard_data_entities in ShardedSqliteMinerStorage._group_by_shard(
+            data_entities
+        ).items():
+            with self._lease_shard(shard_id) as shard:
+                # Nothing can be stored yet in a shard that does not exist.
+                if shard is not None:
+                    shard_data_entities = shard.filter_unchanged_data_entities(
+                        shard_data_entities
+                    )
+            changed_ids.update(id(data_entity) for data_entity in shard_data_entities)
+        return [
+            data_entity for data_entity in data_entities if id(data_entity) in changed_ids
+        ]
+
+    def clear_content_from_oldest(self, content_bytes_to_clear: int) -> EvictionResult:
+        """Deletes entries starting from the oldest until we have cleared the specified amount of content.
+
+        Shards that fit entirely within the amount to clear are unlinked. Only the last shard is partially cleared.
+        """
+        bt.logging.debug(f"Database full. Clearing {content_bytes_to_clear} bytes.")
+        start = time.perf_counter()
+        result = EvictionResult(
+            bytes_cleared=0,
+            rows_cleared=0,
+            time_bucket_ids_cleared=[],
+            duration_seconds=0,
+        )
+
+        # The shards lock is only held to pick the shards and drop whole ones, keeping them from being dropped or
+        # leased meanwhile except while waiting to drop one. The last shard is leased and partially cleared after
+        # releasing it, so other shards stay usable during the batched deletes.
+        partial_shard_id = None
+        with self.shards_lock:
+            for shard_id in sorted(self.shards):
+                if result.bytes_cleared >= content_bytes_to_clear:
+                    break
+
+                shard = self.shards.get(shard_id, None)
+                if shard is None:
+                    continue
+                shard_size = shard.get_content_size_bytes()
+                if result.bytes_cleared + shard_size <= content_bytes_to_clear:
+                    bucket_sizes = shard.list_bucket_sizes(0, -1)
+                    with shard.connection_pool.reader() as connection:
+                        result.rows_cleared += connection.execute(
+                            "SELECT COALESCE(SUM(rowCount), 0) FROM BucketStats"
+                        ).fetchone()[0]
+                    result.bytes_cleared += shard_size
+                    result.time_bucket_ids_cleared.extend(
+                        sorted({bucket.time_bucket_id for bucket in bucket_sizes})
+                    )
+                    self._drop_shard(shard_id)
+                else:
+                    partial_shard_id = shard_id
+                    break
+
+        if partial_shard_id is not None:
+            with self._lease_shard(partial_shard_id) as shard:
+                if shard is not None:
+                    shard_result = shard.clear_content_from_oldest(
+                        content_bytes_to_clear - result.bytes_cleared
+                    )
+                    result.bytes_cleared += shard_result.bytes_cleared
+                    result.rows_cleared += shard_result.rows_cleared
+                    result.time_bucket_ids_cleared.extend(
+                        shard_result.time_bucket_ids_cleared
+                    )
+
+        result.duration_seconds = time.perf_counter() - start
+        bt.logging.info(
+            f"Cleared {result.bytes_cleared} bytes from {len(result.time_bucket_ids_cleared)} time buckets "
+            + f"in {result.duration_seconds:.2f}s."
+        )
+        return result
+
+    def expire_old_shards(self) -> int:
+        """Drops every shard that only holds data older than DATA_ENTITY_BUCKET_AGE_LIMIT_DAYS.
+
+        Returns:
+            int: The number of shards dropped.
+        """
+        oldest_time_bucket_id = TimeBucket.from_datetime(
+            dt.datetime.now() - dt.timedelta(constants.DATA_ENTITY_BUCKET_AGE_LIMIT_DAYS)
+        ).id
+        oldest_live_shard_id = ShardedSqliteMinerStorage._shard_id_for_time_bucket(
+            oldest_time_bucket_id
+        )
+
+        with self.clearing_space_lock, self.shards_lock:
+            expired_shard_ids = [
+                shard_id for shard_id in self.shards if shard_id < oldest_live_shard_id
+            ]
+            for shard_id in expired_shard_ids:
+                self._drop_shard(shard_id)
+
+        return len(expired_shard_ids)
+
+    def list_data_entities_in_data_entity_bucket(
+        self, data_entity_bucket_id: DataEntityBucketId
+    ) -> List[DataEntity]:
+        """Lists from storage all DataEntities matching the provided DataEntityBucketId."""
+        with self._lease_shard(
+            ShardedSqliteMinerStorage._shard_id_for_time_bucket(
+                data_entity_bucket_id.time_bucket.id
+            )
+        ) as shard:
+            if shard is None:
+                return []
+            return shard.list_data_entities_in_data_entity_bucket(data_entity_bucket_id)
+
+    def list_label_stats(self) -> List[LabelStats]:
+        """Lists the row count, size and datetime range of the DataEntities stored for each source and label."""
+        stats_by_key: Dict[tuple, LabelStats] = {}
+        with self._lease_shards() as shards:
+            label_stats = [
+                shard_stats for shard in shards for shard_stats in shard.list_label_stats()
+            ]
+        for shard_stats in label_stats:
+            key = (shard_stats.source, shard_stats.label)
+            stats = stats_by_key.get(key)
+            if stats is None:
+                stats_by_key[key] = shard_stats
+                continue
+            stats.row_count += shard_stats.row_count
+            stats.size_bytes += shard_stats.size_bytes
+            stats.earliest_datetime = min(
+                (d for d in [stats.earliest_datetime, shard_stats.earliest_datetime] if d),
+                default=None,
+            )
+            stats.latest_datetime = max(
+                (d for d in [stats.latest_datetime, shard_stats.latest_datetime] if d),
+                default=None,
+            )
+        return sorted(
+            stats_by_key.values(), key=lambda stats: (stats.source, -stats.size_bytes)
+        )
+
+    def list_contents_in_data_entity_buckets(
+        self, data_entity_bucket_ids: List[DataEntityBucketId]
+    ) -> Dict[DataEntityBucketId, List[bytes]]:
+        """Lists contents for each requested DataEntityBucketId.
+        Args:
+            data_entity_bucket_ids (List[DataEntityBucketId]): Which buckets to get contents for.
+        Returns:
+            Dict[DataEntityBucketId, List[bytes]]: Map of each bucket id to contained contents.
+        """
+        # If no bucket ids or too many bucket ids are provided return an empty dict.
+        if (
+            len(data_entity_bucket_ids) == 0
+            or len(data_entity_bucket_ids) > constants.BULK_BUCKETS_COUNT_LIMIT
+        ):
+            return defaultdict(list)
+
+        bucket_ids = list(dict.fromkeys(data_entity_bucket_ids))
+        bucket_ids_by_shard = defaultdict(list)
+        for bucket_id in bucket_ids:
+            bucket_ids_by_shard[
+                ShardedSqliteMinerStorage._shard_id_for_time_bucket(
+                    bucket_id.time_bucket.id
+                )
+            ].append(bucket_id)
+
+        # Give each shard a share of the overall limits in proportion to the number of buckets it serves.
+        buckets_ids_to_contents = defaultdict(list)
+        for shard_id, shard_bucket_ids in bucket_ids_by_shard.items():
+            with self._lease_shard(shard_id) as shard:
+                if shard is None:
+                    continue
+
+                buckets_ids_to_contents.update(
+                    shard.list_contents_in_data_entity_buckets(
+                        shard_bucket_ids,
+                        size_limit_bytes=constants.BULK_CONTENTS_SIZE_LIMIT_BYTES
+                        * len(shard_bucket_ids)
+                        // len(bucket_ids),
+                        count_limit=constants.BULK_CONTENTS_COUNT_LIMIT
+                        * len(shard_bucket_ids)
+                        // len(bucket_ids),
+                    )
+                )
+
+        return buckets_ids_to_contents
+
+    def refresh_compressed_index(self, time_delta: dt.timedelta):
+        """Refreshes the compressed MinerIndex."""
+        # Seed the shared filter from the newest shards first, off the write path, even while the index is fresh.
+        with self._lease_shards() as shards:
+            for shard in reversed(shards):
+                shard.seed_known_uri_filter()
+
+        with self.cached_index_lock:
+            if dt.datetime.now() - self.cached_index_updated <= time_delta:
+                bt.logging.trace(
+                    f"Skipping updating cached index. It is already fresher than {time_delta}."
+                )
+                return
+
+        with self.cached_index_refresh_lock:
+            with self.cached_index_lock:
+                if dt.datetime.now() - self.cached_index_updated <= time_delta:
+                    bt.logging.trace(
+                        "After waiting on refresh lock the index was already refreshed."
+                    )
+                    return
+
+            # Drop data the validators no longer value before building the index from the live shards.
+            expired_shard_count = self.expire_old_shards()
+            if expired_shard_count:
+                bt.logging.info(f"Expired {expired_shard_count} old shards.")
+
+            oldest_time_bucket_id = TimeBucket.from_datetime(
+                dt.datetime.now()
+                - dt.timedelta(constants.DATA_ENTITY_BUCKET_AGE_LIMIT_DAYS)
+            ).id
+            limit = constants.DATA_ENTITY_BUCKET_COUNT_LIMIT_PER_MINER_INDEX_PROTOCOL_4
+
+            # Buckets never span shards, so the top buckets overall are the top buckets of the merged shard lists.
+            bucket_sizes = []
+            content_size_bytes = 0
+            with self._lease_shards() as shards:
+                for shard in shards:
+                    (
+                        shard_bucket_sizes,
+                        shard_content_size_bytes,
+                    ) = shard.list_bucket_sizes_and_content_size(
+                        oldest_time_bucket_id, limit
+                    )
+                    bucket_sizes.extend(shard_bucket_sizes)
+                    content_size_bytes += shard_content_size_bytes
+            bucket_sizes.sort(key=lambda bucket: bucket.size_bytes, reverse=True)
+
+            compressed_index = build_compressed_index(bucket_sizes[:limit])
+            # Serialize once here so that serving the index to each validator is just a reference copy.
+            serialized_index = SerializedMinerIndex.from_compressed_index(
+                compressed_index
+            )
+            built_at = dt.datetime.now()
+            with self.cached_index_lock:
+                self.cached_index_4 = compressed_index
+                self.cached_index_serialized = serialized_index
+                self.cached_index_updated = built_at
+                bt.logging.success(
+                    f"Created cached index of {serialized_index.size_bytes} bytes "
+                    + f"across {serialized_index.bucket_count} buckets."
+                )
+
+            try:
+                write_index_snapshot(
+                    self.index_snapshot_path,
+                    self.metadata_storage.generation,
+                    content_size_bytes,
+                    built_at,
+                    serialized_index,
+                )
+            except OSError:
+                bt.logging.warning(
+                    f"Failed to persist the index snapshot: {traceback.format_exc()}"
+                )
+
+    def _refresh_stale_compressed_index(self):
+        # While the refresh thread is rebuilding the index, serve the cached index rather than waiting on the rebuild.
+        with self.cached_index_lock:
+            if (
+                self.cached_index_4 is not None
+                and self.cached_index_refresh_lock.locked()
+            ):
+                return
+
+        # Force refresh index if 10 minutes beyond refersh period. Expected to be refreshed earlier by refresh loop.
+        self.refresh_compressed_index(
+            time_delta=(constants.MINER_CACHE_FRESHNESS + dt.timedelta(minutes=10))
+        )
+
+    def get_compressed_index(
+        self,
+        bucket_count_limit=constants.DATA_ENTITY_BUCKET_COUNT_LIMIT_PER_MINER_INDEX_PROTOCOL_4,
+    ) -> CompressedMinerIndex:
+        """Gets the compressed MinerIndex, which is a summary of all of the DataEntities that this MinerStorage is currently serving."""
+
+        self._refresh_stale_compressed_index()
+
+        with self.cached_index_lock:
+            # Only protocol 4 is supported at this time.
+            return self.cached_index_4
+
+    def get_serialized_compressed_index(self) -> SerializedMinerIndex:
+        """Gets the compressed MinerIndex already serialized for GetMinerIndex responses."""
+
+        self._refresh_stale_compressed_index()
+
+        with self.cached_index_lock:
+            return self.cached_index_serialized
+
+    def store_hf_dataset_info(self, hf_metadatas: List[HuggingFaceMetadata]):
+        self.metadata_storage.store_hf_dataset_info(hf_metadatas)
+
+    def should_upload_hf_data(self, unique_id: str) -> bool:
+        return self.metadata_storage.should_upload_hf_data(unique_id)
+
+    def get_hf_metadata(self, unique_id: str) -> List[HuggingFaceMetadata]:
+        return self.metadata_storage.get_hf_metadata(unique_id)
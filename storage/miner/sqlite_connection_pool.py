@@ -0,0 +1,205 @@
+import contextlib
+import dataclasses
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+
+# Tuned PRAGMA profile applied once to every pooled connection.
+# These settings are per connection, so they must be reapplied whenever a new connection is opened.
+DEFAULT_PRAGMAS: Dict[str, Union[int, str]] = {
+    # Map up to 16 GiB of the database file into memory. Pages are shared via the OS page cache.
+    "mmap_size": 16 * 1024 * 1024 * 1024,
+    # Negative values are in KiB. Keep 128 MiB of hot pages per connection.
+    "cache_size": -128 * 1024,
+    # NORMAL is durable across application crashes when using WAL.
+    "synchronous": "NORMAL",
+    # Keep temporary tables and indices (e.g. from GROUP BY or ORDER BY) in memory.
+    "temp_store": "MEMORY",
+}
+
+# Profile for connections that serve validator requests. They can never write, map a larger window of the database
+# since most bucket reads are served straight from the OS page cache, and keep a smaller private cache of their own.
+READER_PRAGMAS: Dict[str, Union[int, str]] = {
+    **DEFAULT_PRAGMAS,
+    "query_only": "ON",
+    "mmap_size": 64 * 1024 * 1024 * 1024,
+    "cache_size": -32 * 1024,
+}
+
+# Profile for long sequential scans, e.g. exporting data to HuggingFace. A scan visits each page once, so a small
+# private cache and no memory map keep it from crowding out the pages hot for the writer and validator reads.
+SCAN_PRAGMAS: Dict[str, Union[int, str]] = {
+    "query_only": "ON",
+    "mmap_size": 0,
+    "cache_size": -16 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+def apply_pragmas(connection: sqlite3.Connection, pragmas: Dict[str, Union[int, str]]):
+    """Applies a PRAGMA profile to a connection."""
+    for pragma, value in pragmas.items():
+        # Always consume the result so the statement is finalized and does not hold a lock.
+        connection.execute(f"PRAGMA {pragma}={value}").fetchall()
+
+
+@dataclasses.dataclass
+class ConnectionPoolStats:
+    """Counters describing how often callers had to wait for a pooled connection."""
+
+    reader_hits: int = 0
+    reader_waits: int = 0
+    reader_wait_seconds: float = 0.0
+    writer_hits: int = 0
+    writer_waits: int = 0
+    writer_wait_seconds: float = 0.0
+
+
+class SqliteConnectionPool:
+    """A thread safe pool of long-lived sqlite connections to a single database.
+
+    The pool holds one writer connection and up to reader_count reader connections. Connections are opened lazily,
+    have their PRAGMA profile applied once and are then kept warm for the lifetime of the pool. Readers use
+    reader_pragmas when provided, so they can be made read-only and given their own cache budget.
+
+    With WAL enabled readers never block the writer (or each other), so a single writer guarded by a lock plus
+    a small set of readers lets concurrent requests proceed without paying for open + PRAGMA + a cold page cache.
+    """
+
+    def __init__(
+        self,
+        connection_factory: Callable[[], sqlite3.Connection],
+        reader_count: int = 4,
+        pragmas: Dict[str, Union[int, str]] = DEFAULT_PRAGMAS,
+        reader_pragmas: Optional[Dict[str, Union[int, str]]] = None,
+    ):
+        if reader_count < 1:
+            raise ValueError(f"reader_count must be at least 1 but was {reader_count}.")
+
+        self.connection_factory = connection_factory
+        self.reader_count = reader_count
+        self.pragmas = pragmas
+        self.reader_pragmas = pragmas if reader_pragmas is None else reader_pragmas
+
+        self.stats_lock = threading.Lock()
+        self.stats = ConnectionPoolStats()
+
+        # Guards lazily opening connections and closing the pool.
+        self.lock = threading.Lock()
+        self.all_connections: List[sqlite3.Connection] = []
+        self.is_closed = False
+
+        self.writer_lock = threading.Lock()
+        self.writer_connection = None
+
+        # LIFO so the most recently used (and therefore warmest) reader is handed out first.
+        self.idle_readers = queue.LifoQueue()
+        self.opened_reader_count = 0
+
+    def _open_connection(self, pragmas: Dict[str, Union[int, str]]) -> sqlite3.Connection:
+        connection = self.connection_factory()
+        apply_pragmas(connection, pragmas)
+        self.all_connections.append(connection)
+        return connection
+
+    def _record(self, is_writer: bool, waited: bool, wait_seconds: float):
+        with self.stats_lock:
+            if is_writer:
+                if waited:
+                    self.stats.writer_waits += 1
+                    self.stats.writer_wait_seconds += wait_seconds
+                else:
+                    self.stats.writer_hits += 1
+            else:
+                if waited:
+                    self.stats.reader_waits += 1
+                    self.stats.reader_wait_seconds += wait_seconds
+                else:
+                    self.stats.reader_hits += 1
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            connection = self.idle_readers.get_nowait()
+            self._record(is_writer=False, waited=False, wait_seconds=0)
+            return connection
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            if self.is_closed:
+                raise sqlite3.ProgrammingError("Cannot operate on a closed connection pool.")
+            if self.opened_reader_count < self.reader_count:
+                self.opened_reader_count += 1
+                connection = self._open_connection(self.reader_pragmas)
+                self._record(is_writer=False, waited=False, wait_seconds=0)
+                return connection
+
+        # All readers are busy so wait for one to be released.
+        start = time.perf_counter()
+        connection = self.idle_readers.get()
+        self._record(
+            is_writer=False, waited=True, wait_seconds=time.perf_counter() - start
+        )
+        return connection
+
+    @contextlib.contextmanager
+    def reader(self):
+        """Checks out a reader connection for the duration of the context."""
+        connection = self._acquire_reader()
+        try:
+            yield connection
+        finally:
+            # Readers should never hold a transaction open between uses since it pins an old WAL snapshot.
+            if connection.in_transaction:
+                connection.rollback()
+            self.idle_readers.put(connection)
+
+    @contextlib.contextmanager
+    def writer(self):
+        """Checks out the single writer connection for the duration of the context.
+
+        Any transaction left open by the caller is rolled back when the context exits with an exception.
+        """
+        waited = not self.writer_lock.acquire(blocking=False)
+        if waited:
+            start = time.perf_counter()
+            self.writer_lock.acquire()
+            self._record(
+                is_writer=True, waited=True, wait_seconds=time.perf_counter() - start
+            )
+        else:
+            self._record(is_writer=True, waited=False, wait_seconds=0)
+
+        try:
+            with self.lock:
+                if self.is_closed:
+                    raise sqlite3.ProgrammingError(
+                        "Cannot operate on a closed connection pool."
+                    )
+                if self.writer_connection is None:
+                    self.writer_connection = self._open_connection(self.pragmas)
+            try:
+                yield self.writer_connection
+            except BaseException:
+                if self.writer_connection.in_transaction:
+                    self.writer_connection.rollback()
+                raise
+        finally:
+            self.writer_lock.release()
+
+    def get_stats(self) -> ConnectionPoolStats:
+        """Returns a snapshot of the pool counters."""
+        with self.stats_lock:
+            return dataclasses.replace(self.stats)
+
+    def close(self):
+        """Closes every connection opened by the pool. The pool cannot be used afterwards."""
+        with self.lock:
+            self.is_closed = True
+            for connection in self.all_connections:
+                connection.close()
+            self.all_connections.clear()
+            self.writer_connection = None
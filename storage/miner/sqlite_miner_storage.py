@@ -1,4 +1,6 @@
 from collections import defaultdict
+import contextlib
+import dataclasses
 import threading
 from common import constants, utils
 from common.data import (
@@ -12,17 +14,56 @@ from common.data import (
     TimeBucket,
     HuggingFaceMetadata,
 )
-from storage.miner.miner_storage import MinerStorage
-from typing import Dict, List
+from storage.miner.content_compression import (
+    CONTENT_DICTIONARY_TABLE_CREATE,
+    CONTENT_DICTIONARY_SAMPLE_COUNT,
+    DEFAULT_DICTIONARY_SIZE_BYTES,
+    is_compressed,
+    load_content_compressor,
+    read_content_dictionaries,
+    train_dictionary,
+)
+from storage.miner.known_uri_filter import KnownUriFilter
+from storage.miner.label_cache import LABEL_TABLE_CREATE, LabelCache
+from storage.miner.index_snapshot import read_index_snapshot, write_index_snapshot
+from storage.miner.miner_storage import (
+    LabelStats,
+    MinerStorage,
+    SerializedMinerIndex,
+)
+from storage.miner.storage_metadata import (
+    DATETIME_FORMAT_EPOCH_MICROS,
+    DATETIME_FORMAT_KEY,
+    DATETIME_FORMAT_TEXT,
+    DATETIME_MIGRATION_COMPLETE_KEY,
+    get_datetime_format,
+    get_or_create_generation,
+    get_storage_metadata,
+    set_storage_metadata,
+)
+from storage.miner.sqlite_connection_pool import (
+    READER_PRAGMAS,
+    ConnectionPoolStats,
+    SqliteConnectionPool,
+)
+from typing import Dict, List, Optional, Tuple
 import datetime as dt
+import math
+import os
 import sqlite3
-import contextlib
+import time
+import traceback
 import bittensor as bt
 import pandas as pd
+import zstandard
 
 
 # Use a timezone aware adapter for timestamp columns.
 def tz_aware_timestamp_adapter(val):
+    # Rows stored in the epoch microseconds format are plain integers.
+    if val.isdigit():
+        return utils.datetime_from_epoch_micros(int(val))
+
     datepart, timepart = val.split(b" ")
     year, month, day = map(int, datepart.split(b"-"))
 
@@ -56,25 +97,193 @@ def tz_aware_timestamp_adapter(val):
     return val
 
 
+def _to_epoch_micros(datetime) -> int:
+    """Returns the microseconds since epoch of a stored or to be stored datetime value in either datetime format."""
+    if isinstance(datetime, int):
+        return datetime
+    if isinstance(datetime, str):
+        datetime = tz_aware_timestamp_adapter(datetime.encode())
+    return utils.datetime_to_epoch_micros(datetime)
+
+
+@dataclasses.dataclass
+class BucketSize:
+    """The total size of the content stored for one DataEntityBucket."""
+
+    time_bucket_id: int
+    source: int
+    label: Optional[str]
+    size_bytes: int
+
+
+def build_compressed_index(bucket_sizes: List[BucketSize]) -> CompressedMinerIndex:
+    """Builds a CompressedMinerIndex from the provided bucket sizes, preserving their order within each label."""
+    buckets_by_source_by_label = defaultdict(dict)
+
+    for bucket_size in bucket_sizes:
+        # Ensure the miner does not attempt to report more than the max DataEntityBucket size.
+        size = min(bucket_size.size_bytes, constants.DATA_ENTITY_BUCKET_SIZE_LIMIT_BYTES)
+
+        source = DataSource(bucket_size.source)
+        bucket = buckets_by_source_by_label[source].get(
+            bucket_size.label, CompressedEntityBucket(label=bucket_size.label)
+        )
+        bucket.sizes_bytes.append(size)
+        bucket.time_bucket_ids.append(bucket_size.time_bucket_id)
+        buckets_by_source_by_label[source][bucket_size.label] = bucket
+
+    # Convert the buckets_by_source_by_label into a list of lists of CompressedEntityBucket and return
+    return CompressedMinerIndex(
+        sources={
+            source: list(labels_to_buckets.values())
+            for source, labels_to_buckets in buckets_by_source_by_label.items()
+        }
+    )
+
+
+def allocate_fair_shares(demands: List[int], budget: int) -> List[int]:
+    """Splits the budget across the demands so that no demand gets less than an equal share unless it needs less.
+
+    Any share left unused by small demands is redistributed equally among the larger ones (max-min fairness).
+    """
+    allocations = [0] * len(demands)
+    remaining_budget = budget
+    remaining_count = len(demands)
+    for index in sorted(range(len(demands)), key=lambda i: demands[i]):
+        allocations[index] = min(demands[index], remaining_budget // remaining_count)
+        remaining_budget -= allocations[index]
+        remaining_count -= 1
+    return allocations
+
+
+@dataclasses.dataclass
+class EvictionResult:
+    """Summarizes the content cleared by a single eviction."""
+
+    bytes_cleared: int
+    rows_cleared: int
+    time_bucket_ids_cleared: List[int]
+    duration_seconds: float
+
+
+@dataclasses.dataclass
+class DiskUsage:
+    """Space a miner database takes up on disk, read from the database header without scanning any table."""
+
+    # The size of the database file, including free pages.
+    database_size_bytes: int
+    # Pages freed by deletes that have not been handed back to the filesystem. They are reused by new writes.
+    free_bytes: int
+    wal_size_bytes: int
+    content_size_bytes: int
+
+    @property
+    def used_bytes(self) -> int:
+        """The bytes on disk that new writes can not reuse."""
+        return self.database_size_bytes - self.free_bytes + self.wal_size_bytes
+
+    @property
+    def overhead_ratio(self) -> float:
+        """The bytes used on disk per byte of content, or 0 if there is no content."""
+        if self.content_size_bytes == 0:
+            return 0.0
+        return self.used_bytes / self.content_size_bytes
+
+
+def get_content_bytes_to_clear(
+    max_content_size_bytes: int,
+    max_size_bytes: int,
+    disk_usage: DiskUsage,
+    added_content_size: int,
+) -> int:
+    """Returns how much content to clear so that the added content fits within both the content and on-disk limits.
+
+    Returns 0 if it already fits. Otherwise at least a tenth of the limit is cleared so that space is not cleared on
+    every write.
+    """
+    content_bytes_to_clear = 0
+    if disk_usage.content_size_bytes + added_content_size > max_content_size_bytes:
+        content_bytes_to_clear = max(max_content_size_bytes // 10, added_content_size)
+
+    # Estimate the space the added content takes on disk, including indexes, from the current overhead.
+    overhead_ratio = max(disk_usage.overhead_ratio, 1.0)
+    excess_bytes = (
+        disk_usage.used_bytes + added_content_size * overhead_ratio - max_size_bytes
+    )
+    if excess_bytes > 0:
+        content_bytes_to_clear = max(
+            content_bytes_to_clear,
+            math.ceil(max(excess_bytes, max_size_bytes // 10) / overhead_ratio),
+        )
+    return content_bytes_to_clear
+
+
 class SqliteMinerStorage(MinerStorage):
     """Sqlite backed MinerStorage"""
 
+    # Maximum number of rows deleted per transaction when clearing space.
+    EVICTION_BATCH_SIZE = 10_000
+
+    # Maximum number of URIs bound to a single lookup query. SQLite allows at most 32766 parameters.
+    URI_LOOKUP_BATCH_SIZE = 1000
+
+    # Maximum number of free pages handed back to the filesystem per transaction after clearing space.
+    INCREMENTAL_VACUUM_BATCH_PAGES = 4096
+
+    # The WAL file is truncated back to this size after each checkpoint.
+    WAL_SIZE_LIMIT_BYTES = 64 * 1024 * 1024
+
+    # Too few samples produce a dictionary that barely improves on plain zstd.
+    MIN_CONTENT_DICTIONARY_SAMPLE_COUNT = 100
+
     # TODO Consider CHECK expression to limit source to expected ENUM values.
     # Sqlite type converters handle the mapping from Python datetime to Timestamp.
+    # Labels are interned into the Label table. See LabelCache.
     DATA_ENTITY_TABLE_CREATE = """CREATE TABLE IF NOT EXISTS DataEntity (
                                 uri                 TEXT            PRIMARY KEY,
                                 datetime            TIMESTAMP(6)    NOT NULL,
                                 timeBucketId        INTEGER         NOT NULL,
                                 source              INTEGER         NOT NULL,
-                                label               CHAR(32)                ,
+                                labelId             INTEGER         NOT NULL,
                                 content             BLOB            NOT NULL,
                                 contentSizeBytes    INTEGER         NOT NULL
                                 ) WITHOUT ROWID"""
 
+    # With split content DataEntity only holds the narrow metadata of each row and points at its content, which is
+    # stored in DataEntityContent. Index refresh, eviction planning and size accounting never touch content pages.
+    SPLIT_DATA_ENTITY_TABLE_CREATE = """CREATE TABLE IF NOT EXISTS DataEntity (
+                                uri                 TEXT            PRIMARY KEY,
+                                datetime            TIMESTAMP(6)    NOT NULL,
+                                timeBucketId        INTEGER         NOT NULL,
+                                source              INTEGER         NOT NULL,
+                                labelId             INTEGER         NOT NULL,
+                                contentId           INTEGER         NOT NULL,
+                                contentSizeBytes    INTEGER         NOT NULL
+                                ) WITHOUT ROWID"""
+
+    # A rowid table, so content is appended in insertion order and fetched by integer key.
+    DATA_ENTITY_CONTENT_TABLE_CREATE = """CREATE TABLE IF NOT EXISTS DataEntityContent (
+                                contentId           INTEGER         PRIMARY KEY,
+                                content             BLOB            NOT NULL
+                                )"""
+
+    # Deletes the content of every deleted or replaced DataEntity.
+    DATA_ENTITY_CONTENT_TRIGGER = """CREATE TRIGGER IF NOT EXISTS data_entity_delete_content AFTER DELETE ON DataEntity
+            BEGIN
+                DELETE FROM DataEntityContent WHERE contentId = OLD.contentId;
+            END"""
+
+    # Every read of content goes through this view so that it works with either layout.
+    DATA_ENTITY_WITH_CONTENT_VIEW_CREATE = """CREATE VIEW IF NOT EXISTS DataEntityWithContent AS
+                                SELECT * FROM DataEntity"""
+
+    SPLIT_DATA_ENTITY_WITH_CONTENT_VIEW_CREATE = """CREATE VIEW IF NOT EXISTS DataEntityWithContent AS
+                                SELECT * FROM DataEntity JOIN DataEntityContent USING (contentId)"""
+
     DELETE_OLD_INDEX = """DROP INDEX IF EXISTS data_entity_bucket_index"""
 
-    DATA_ENTITY_TABLE_INDEX = """CREATE INDEX IF NOT EXISTS data_entity_bucket_index2
-                                ON DataEntity (timeBucketId, source, label, contentSizeBytes)"""
+    DATA_ENTITY_TABLE_INDEX = """CREATE INDEX IF NOT EXISTS data_entity_bucket_index3
+                                ON DataEntity (timeBucketId, source, labelId, contentSizeBytes)"""
 
     HF_METADATA_TABLE_CREATE = """CREATE TABLE IF NOT EXISTS HFMetaData (
                                 uri                 TEXT            PRIMARY KEY,
@@ -83,24 +292,200 @@ class SqliteMinerStorage(MinerStorage):
                                 encodingKey         TEXT
                                 ) WITHOUT ROWID"""
 
+    # Single row table holding the running total of contentSizeBytes across all of DataEntity.
+    CONTENT_SIZE_TOTAL_TABLE_CREATE = """CREATE TABLE IF NOT EXISTS ContentSizeTotal (
+                                id                  INTEGER         PRIMARY KEY CHECK (id = 0),
+                                contentSizeBytes    INTEGER         NOT NULL
+                                )"""
+
+    # Triggers keeping ContentSizeTotal in sync with DataEntity.
+    # Deletes performed by REPLACE only fire the delete trigger with recursive_triggers enabled.
+    CONTENT_SIZE_TOTAL_TRIGGERS = [
+        """CREATE TRIGGER IF NOT EXISTS data_entity_insert_content_size AFTER INSERT ON DataEntity
+            BEGIN
+                UPDATE ContentSizeTotal SET contentSizeBytes = contentSizeBytes + NEW.contentSizeBytes WHERE id = 0;
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS data_entity_delete_content_size AFTER DELETE ON DataEntity
+            BEGIN
+                UPDATE ContentSizeTotal SET contentSizeBytes = contentSizeBytes - OLD.contentSizeBytes WHERE id = 0;
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS data_entity_update_content_size AFTER UPDATE OF contentSizeBytes ON DataEntity
+            BEGIN
+                UPDATE ContentSizeTotal
+                    SET contentSizeBytes = contentSizeBytes - OLD.contentSizeBytes + NEW.contentSizeBytes
+                    WHERE id = 0;
+            END""",
+    ]
+
+    # Per DataEntityBucket aggregates so the index can be built without scanning DataEntity.
+    BUCKET_STATS_TABLE_CREATE = """CREATE TABLE IF NOT EXISTS BucketStats (
+                                timeBucketId        INTEGER         NOT NULL,
+                                source              INTEGER         NOT NULL,
+                                labelId             INTEGER         NOT NULL,
+                                totalBytes          INTEGER         NOT NULL,
+                                rowCount            INTEGER         NOT NULL,
+                                PRIMARY KEY (timeBucketId, source, labelId)
+                                ) WITHOUT ROWID"""
+
+    # Triggers keeping BucketStats in sync with DataEntity. Empty buckets are removed.
+    BUCKET_STATS_TRIGGERS = [
+        """CREATE TRIGGER IF NOT EXISTS data_entity_insert_bucket_stats AFTER INSERT ON DataEntity
+            BEGIN
+                INSERT INTO BucketStats (timeBucketId, source, labelId, totalBytes, rowCount)
+                    VALUES (NEW.timeBucketId, NEW.source, NEW.labelId, NEW.contentSizeBytes, 1)
+                    ON CONFLICT (timeBucketId, source, labelId) DO UPDATE
+                    SET totalBytes = totalBytes + excluded.totalBytes, rowCount = rowCount + 1;
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS data_entity_delete_bucket_stats AFTER DELETE ON DataEntity
+            BEGIN
+                UPDATE BucketStats SET totalBytes = totalBytes - OLD.contentSizeBytes, rowCount = rowCount - 1
+                    WHERE timeBucketId = OLD.timeBucketId AND source = OLD.source AND labelId = OLD.labelId;
+                DELETE FROM BucketStats
+                    WHERE timeBucketId = OLD.timeBucketId AND source = OLD.source AND labelId = OLD.labelId
+                    AND rowCount <= 0;
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS data_entity_update_bucket_stats
+            AFTER UPDATE OF timeBucketId, source, labelId, contentSizeBytes ON DataEntity
+            BEGIN
+                UPDATE BucketStats SET totalBytes = totalBytes - OLD.contentSizeBytes, rowCount = rowCount - 1
+                    WHERE timeBucketId = OLD.timeBucketId AND source = OLD.source AND labelId = OLD.labelId;
+                DELETE FROM BucketStats
+                    WHERE timeBucketId = OLD.timeBucketId AND source = OLD.source AND labelId = OLD.labelId
+                    AND rowCount <= 0;
+                INSERT INTO BucketStats (timeBucketId, source, labelId, totalBytes, rowCount)
+                    VALUES (NEW.timeBucketId, NEW.source, NEW.labelId, NEW.contentSizeBytes, 1)
+                    ON CONFLICT (timeBucketId, source, labelId) DO UPDATE
+                    SET totalBytes = totalBytes + excluded.totalBytes, rowCount = rowCount + 1;
+            END""",
+    ]
+
+    # Per source and label aggregates. Datetimes are in microseconds since epoch regardless of the datetime format.
+    # Counts are kept in sync by triggers. The datetime range is widened by the write path and narrowed by eviction.
+    LABEL_STATS_TABLE_CREATE = """CREATE TABLE IF NOT EXISTS LabelStats (
+                                source              INTEGER         NOT NULL,
+                                labelId             INTEGER         NOT NULL,
+                                totalBytes          INTEGER         NOT NULL,
+                                rowCount            INTEGER         NOT NULL,
+                                minDatetime         INTEGER                 ,
+                                maxDatetime         INTEGER                 ,
+                                PRIMARY KEY (source, labelId)
+                                ) WITHOUT ROWID"""
+
+    # Triggers keeping the LabelStats counts in sync with DataEntity. Empty labels are removed.
+    LABEL_STATS_TRIGGERS = [
+        """CREATE TRIGGER IF NOT EXISTS data_entity_insert_label_stats AFTER INSERT ON DataEntity
+            BEGIN
+                INSERT INTO LabelStats (source, labelId, totalBytes, rowCount)
+                    VALUES (NEW.source, NEW.labelId, NEW.contentSizeBytes, 1)
+                    ON CONFLICT (source, labelId) DO UPDATE
+                    SET totalBytes = totalBytes + excluded.totalBytes, rowCount = rowCount + 1;
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS data_entity_delete_label_stats AFTER DELETE ON DataEntity
+            BEGIN
+                UPDATE LabelStats SET totalBytes = totalBytes - OLD.contentSizeBytes, rowCount = rowCount - 1
+                    WHERE source = OLD.source AND labelId = OLD.labelId;
+                DELETE FROM LabelStats WHERE source = OLD.source AND labelId = OLD.labelId AND rowCount <= 0;
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS data_entity_update_label_stats
+            AFTER UPDATE OF source, labelId, contentSizeBytes ON DataEntity
+            BEGIN
+                UPDATE LabelStats SET totalBytes = totalBytes - OLD.contentSizeBytes, rowCount = rowCount - 1
+                    WHERE source = OLD.source AND labelId = OLD.labelId;
+                DELETE FROM LabelStats WHERE source = OLD.source AND labelId = OLD.labelId AND rowCount <= 0;
+                INSERT INTO LabelStats (source, labelId, totalBytes, rowCount)
+                    VALUES (NEW.source, NEW.labelId, NEW.contentSizeBytes, 1)
+                    ON CONFLICT (source, labelId) DO UPDATE
+                    SET totalBytes = totalBytes + excluded.totalBytes, rowCount = rowCount + 1;
+            END""",
+    ]
+
+    # Widens the datetime range of a label to include newly stored entities.
+    LABEL_STATS_WIDEN_DATETIMES = """UPDATE LabelStats
+                                SET minDatetime = MIN(COALESCE(minDatetime, ?1), ?1),
+                                    maxDatetime = MAX(COALESCE(maxDatetime, ?2), ?2)
+                                WHERE source = ?3 AND labelId = ?4"""
+
     def __init__(
         self,
         database="SqliteMinerStorage.sqlite",
         max_database_size_gb_hint=250,
+        reader_connection_count=4,
+        compress_content=False,
+        integer_timestamps=False,
+        split_content=False,
+        known_uri_filter: Optional[KnownUriFilter] = None,
     ):
         sqlite3.register_converter("timestamp", tz_aware_timestamp_adapter)
         self.database = database
+        # Whether new content is stored zstd compressed. Compressed content is always read back transparently.
+        self.compress_content = compress_content
 
-        # TODO Account for non-content columns when restricting total database size.
+        # Limits both the stored content and the space used on disk, including indexes, metadata and the WAL.
         self.database_max_content_size_bytes = utils.gb_to_bytes(
             max_database_size_gb_hint
         )
+        self.database_max_size_bytes = utils.gb_to_bytes(max_database_size_gb_hint)
+
+        # Databases from previous versions store labels inline. Migrate them before any pooled connection opens. An
+        # interrupted migration resumes on the next start.
+        if os.path.exists(database):
+            SqliteMinerStorage.migrate_label_ids(database)
+
+        # The datetime format of new rows as (writer connection, data_version, format). Only re-read once another
+        # connection, such as a migration script in another process, has committed since it was cached.
+        self.datetime_format_cache: Optional[Tuple[sqlite3.Connection, int, str]] = None
+
+        # Long-lived connections shared by all operations on this storage. Readers serve validator requests, so they
+        # are read-only and keep a cache budget separate from the writer's.
+        self.connection_pool = SqliteConnectionPool(
+            self._create_connection,
+            reader_count=reader_connection_count,
+            reader_pragmas=READER_PRAGMAS,
+        )
 
-        with contextlib.closing(self._create_connection()) as connection:
+        with self.connection_pool.writer() as connection:
             cursor = connection.cursor()
 
-            # Create the DataEntity table (if it does not already exist).
-            cursor.execute(SqliteMinerStorage.DATA_ENTITY_TABLE_CREATE)
+            # New databases hand the pages freed by clearing space back to the filesystem. This can only be enabled
+            # before the first table is created, so existing databases need a VACUUM to switch.
+            if cursor.execute("PRAGMA page_count").fetchone()[0] == 0:
+                cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            elif cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                bt.logging.info(
+                    f"{database} does not use incremental auto-vacuum, so space cleared stays allocated to it. "
+                    + "Use scripts/migrate_miner_incremental_vacuum.py to enable it."
+                )
+
+            # Create the DataEntity table (if it does not already exist). New databases use the requested layout.
+            table_exists = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'DataEntity'"
+            ).fetchone()
+            cursor.execute(
+                SqliteMinerStorage.SPLIT_DATA_ENTITY_TABLE_CREATE
+                if split_content and not table_exists
+                else SqliteMinerStorage.DATA_ENTITY_TABLE_CREATE
+            )
+
+            # Create the table of interned labels.
+            cursor.execute(LABEL_TABLE_CREATE)
+            self.label_cache = LabelCache()
+            self.label_cache.load(connection)
+
+            # Existing databases keep the layout they were created with.
+            cursor.execute("PRAGMA table_info(DataEntity)")
+            self.split_content = "contentId" in [column[1] for column in cursor.fetchall()]
+            if self.split_content:
+                cursor.execute(SqliteMinerStorage.DATA_ENTITY_CONTENT_TABLE_CREATE)
+                cursor.execute(SqliteMinerStorage.DATA_ENTITY_CONTENT_TRIGGER)
+                cursor.execute(
+                    SqliteMinerStorage.SPLIT_DATA_ENTITY_WITH_CONTENT_VIEW_CREATE
+                )
+            else:
+                cursor.execute(SqliteMinerStorage.DATA_ENTITY_WITH_CONTENT_VIEW_CREATE)
+                if split_content:
+                    bt.logging.warning(
+                        f"{database} stores content inline in DataEntity. Split content only applies to new databases."
+                    )
 
             # Delete the old index (if it exists).
             cursor.execute(SqliteMinerStorage.DELETE_OLD_INDEX)
@@ -110,11 +495,51 @@ class SqliteMinerStorage(MinerStorage):
 
             # Create the huggingface table to store HF Info
             cursor.execute(SqliteMinerStorage.HF_METADATA_TABLE_CREATE)
+
+            # Create the table of zstd dictionaries used to compress content.
+            cursor.execute(CONTENT_DICTIONARY_TABLE_CREATE)
+            self.content_compressor = load_content_compressor(
+                connection, self._read_content_dictionaries
+            )
+
+            # Mark this database so that index snapshots are only ever served for the database they were built from.
+            self.generation = get_or_create_generation(connection)
+
+            # New databases start in the requested datetime format. Existing databases keep theirs until migrated.
+            if get_storage_metadata(connection, DATETIME_FORMAT_KEY) is None:
+                is_empty = (
+                    cursor.execute("SELECT 1 FROM DataEntity LIMIT 1").fetchone()
+                    is None
+                )
+                set_storage_metadata(
+                    connection,
+                    DATETIME_FORMAT_KEY,
+                    (
+                        DATETIME_FORMAT_EPOCH_MICROS
+                        if integer_timestamps and is_empty
+                        else DATETIME_FORMAT_TEXT
+                    ),
+                )
+                if integer_timestamps and is_empty:
+                    set_storage_metadata(connection, DATETIME_MIGRATION_COMPLETE_KEY, "1")
+            elif (
+                integer_timestamps
+                and get_datetime_format(connection) == DATETIME_FORMAT_TEXT
+            ):
+                bt.logging.warning(
+                    f"{database} stores datetimes as text. "
+                    + "Use scripts/migrate_miner_integer_timestamps.py to migrate it to integer timestamps."
+                )
+            connection.commit()
             # Use Write Ahead Logging to avoid blocking reads.
-            cursor.execute("pragma journal_mode=wal")
+            # Consume the result so the statement does not keep holding a lock on the database.
+            cursor.execute("pragma journal_mode=wal").fetchall()
 
         # Update the HFMetaData for miners who created this table in previous versions
         self._ensure_hf_metadata_schema()
+        # Start tracking running aggregates for miners who created DataEntity in previous versions.
+        self._ensure_running_aggregates()
+
         # Lock to avoid concurrency issues on clearing space when full.
         self.clearing_space_lock = threading.Lock()
 
@@ -124,21 +549,69 @@ class SqliteMinerStorage(MinerStorage):
         # Lock around the cached get miner index.
         self.cached_index_lock = threading.Lock()
         self.cached_index_4 = None
+        self.cached_index_serialized = None
         self.cached_index_updated = dt.datetime.min
 
+        # Serve the index persisted before the last restart until the refresh thread builds a new one.
+        self.index_snapshot_path = database + ".index_snapshot.json"
+        self._load_index_snapshot()
+
+        # Recently stored entities, seeded from storage by the first index refresh, so unchanged re-scraped entities
+        # can be skipped.
+        # Storages that partition one store, like the shards of ShardedSqliteMinerStorage, may share a single filter.
+        self.known_uri_filter = (
+            known_uri_filter
+            if known_uri_filter is not None
+            else KnownUriFilter(constants.MINER_KNOWN_URI_FILTER_CAPACITY)
+        )
+        self.known_uri_filter_seed_lock = threading.Lock()
+        self.known_uri_filter_seeded = False
+
+    def _load_index_snapshot(self):
+        snapshot = read_index_snapshot(
+            self.index_snapshot_path,
+            self.generation,
+            self.get_content_size_bytes(),
+            constants.MINER_INDEX_SNAPSHOT_MAX_AGE,
+        )
+        if snapshot is None:
+            return
+        with self.cached_index_lock:
+            self.cached_index_4 = snapshot.compressed_index
+            self.cached_index_serialized = snapshot.serialized_index
+            self.cached_index_updated = snapshot.built_at
+
     def _create_connection(self):
         # Create the database if it doesn't exist, defaulting to the local directory.
         # Use PARSE_DECLTYPES to convert accessed values into the appropriate type.
+        # Connections are handed between threads by the connection pool, which guarantees exclusive use.
         connection = sqlite3.connect(
-            self.database, detect_types=sqlite3.PARSE_DECLTYPES, timeout=60.0
+            self.database,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            timeout=60.0,
+            check_same_thread=False,
         )
         # Allow this connection to parse results from returned rows by column name.
         connection.row_factory = sqlite3.Row
+        # Required so that rows deleted by REPLACE INTO fire the delete triggers maintaining running totals.
+        connection.execute("PRAGMA recursive_triggers=ON")
+        # Stop a WAL that grew during a burst of writes from holding on to the disk space afterwards.
+        connection.execute(
+            f"PRAGMA journal_size_limit={SqliteMinerStorage.WAL_SIZE_LIMIT_BYTES}"
+        ).fetchall()
 
         return connection
 
+    def close(self):
+        """Closes all pooled connections. The storage cannot be used afterwards."""
+        self.connection_pool.close()
+
+    def get_connection_pool_stats(self) -> ConnectionPoolStats:
+        """Returns counters for how often operations waited on a pooled connection."""
+        return self.connection_pool.get_stats()
+
     def _ensure_hf_metadata_schema(self):
-        with contextlib.closing(self._create_connection()) as connection:
+        with self.connection_pool.writer() as connection:
             cursor = connection.cursor()
 
             # Check if the encodingKey column exists
@@ -152,6 +625,423 @@ class SqliteMinerStorage(MinerStorage):
 
             connection.commit()
 
+    @staticmethod
+    def _has_inline_labels(connection: sqlite3.Connection) -> bool:
+        """Returns whether DataEntity stores labels inline, as in previous versions, rather than by labelId."""
+        columns = [
+            column[1] for column in connection.execute("PRAGMA table_info(DataEntity)")
+        ]
+        return "label" in columns
+
+    @staticmethod
+    def migrate_label_ids(database: str, batch_size=EVICTION_BATCH_SIZE) -> int:
+        """Moves a database from previous versions over to interned labels, keying DataEntity by labelId.
+
+        Rows are moved into the new table in batches, each committed separately and deleted from the old table as it
+        goes, so the pages they free are reused by the next batch rather than needing space for a second copy of the
+        table. An interrupted migration resumes where it stopped. The miner must be stopped while it runs.
+
+        Returns:
+            int: The number of rows migrated.
+        """
+        with contextlib.closing(sqlite3.connect(database, timeout=60.0)) as connection:
+            if not SqliteMinerStorage._has_inline_labels(connection):
+                return 0
+            bt.logging.info(
+                f"Migrating {database} to interned labels. This may take a while for large databases."
+            )
+
+            connection.execute("pragma journal_mode=wal").fetchall()
+            connection.execute(
+                f"PRAGMA journal_size_limit={SqliteMinerStorage.WAL_SIZE_LIMIT_BYTES}"
+            ).fetchall()
+
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(LABEL_TABLE_CREATE)
+            connection.execute(
+                SqliteMinerStorage.DATA_ENTITY_TABLE_CREATE.replace(
+                    "DataEntity", "DataEntityWithLabelIds"
+                )
+            )
+            # Moving rows must not fire the running aggregate triggers, which are recreated keyed by labelId.
+            for (trigger,) in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'DataEntity'"
+            ).fetchall():
+                connection.execute(f"DROP TRIGGER {trigger}")
+            # Rebuilt from DataEntity by _ensure_running_aggregates.
+            connection.execute("DROP TABLE IF EXISTS BucketStats")
+            connection.commit()
+
+            rows_migrated = 0
+            while True:
+                connection.execute("BEGIN IMMEDIATE")
+                row = connection.execute(
+                    "SELECT MAX(uri), COUNT(*) FROM (SELECT uri FROM DataEntity ORDER BY uri ASC LIMIT ?)",
+                    [batch_size],
+                ).fetchone()
+                last_uri, row_count = row
+                if row_count == 0:
+                    connection.commit()
+                    break
+
+                connection.execute(
+                    """INSERT OR IGNORE INTO Label (label)
+                        SELECT DISTINCT COALESCE(label, 'NULL') FROM DataEntity WHERE uri <= ?""",
+                    [last_uri],
+                )
+                connection.execute(
+                    """INSERT INTO DataEntityWithLabelIds
+                        SELECT d.uri, d.datetime, d.timeBucketId, d.source, l.labelId, d.content, d.contentSizeBytes
+                        FROM DataEntity d
+                        JOIN Label l ON l.label = COALESCE(d.label, 'NULL')
+                        WHERE d.uri <= ?""",
+                    [last_uri],
+                )
+                connection.execute("DELETE FROM DataEntity WHERE uri <= ?", [last_uri])
+                connection.commit()
+                rows_migrated += row_count
+
+            # Dropping DataEntity also drops its indexes, which are recreated keyed by labelId. The view over it is
+            # recreated as well.
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DROP VIEW IF EXISTS DataEntityWithContent")
+            connection.execute("DROP TABLE DataEntity")
+            connection.execute("ALTER TABLE DataEntityWithLabelIds RENAME TO DataEntity")
+            connection.commit()
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+        bt.logging.info(f"Migrated {rows_migrated} rows to interned labels.")
+        return rows_migrated
+
+    def _ensure_running_aggregates(self):
+        with self.connection_pool.writer() as connection:
+            cursor = connection.cursor()
+            # Take the write lock up front so no rows are written between the initial aggregation and the triggers.
+            cursor.execute("BEGIN IMMEDIATE")
+
+            cursor.execute(
+                """SELECT name FROM sqlite_master WHERE type = 'table'
+                    AND name IN ('ContentSizeTotal', 'BucketStats', 'LabelStats')"""
+            )
+            existing_tables = {row["name"] for row in cursor.fetchall()}
+
+            cursor.execute(SqliteMinerStorage.CONTENT_SIZE_TOTAL_TABLE_CREATE)
+            cursor.execute(SqliteMinerStorage.BUCKET_STATS_TABLE_CREATE)
+            cursor.execute(SqliteMinerStorage.LABEL_STATS_TABLE_CREATE)
+            for trigger in (
+                SqliteMinerStorage.CONTENT_SIZE_TOTAL_TRIGGERS
+                + SqliteMinerStorage.BUCKET_STATS_TRIGGERS
+                + SqliteMinerStorage.LABEL_STATS_TRIGGERS
+            ):
+                cursor.execute(trigger)
+
+            if "ContentSizeTotal" not in existing_tables:
+                bt.logging.info("Initializing the running total of stored content size.")
+                cursor.execute(
+                    """INSERT INTO ContentSizeTotal (id, contentSizeBytes)
+                        SELECT 0, COALESCE(SUM(contentSizeBytes), 0) FROM DataEntity"""
+                )
+
+            if "BucketStats" not in existing_tables:
+                bt.logging.info("Initializing the per bucket aggregates. This may take a while.")
+                cursor.execute(
+                    """INSERT INTO BucketStats (timeBucketId, source, labelId, totalBytes, rowCount)
+                        SELECT timeBucketId, source, labelId, SUM(contentSizeBytes), COUNT(*) FROM DataEntity
+                        GROUP BY timeBucketId, source, labelId"""
+                )
+
+            if "LabelStats" not in existing_tables:
+                bt.logging.info("Initializing the per label aggregates. This may take a while.")
+                # Integer and text datetimes do not sort together, so take the range of each format separately.
+                cursor.execute(
+                    """SELECT source, labelId, SUM(contentSizeBytes) AS totalBytes, COUNT(*) AS rowCount,
+                            MIN(CASE WHEN typeof(datetime) = 'integer' THEN datetime END) AS minInteger,
+                            MAX(CASE WHEN typeof(datetime) = 'integer' THEN datetime END) AS maxInteger,
+                            MIN(CASE WHEN typeof(datetime) = 'text' THEN datetime END) AS minText,
+                            MAX(CASE WHEN typeof(datetime) = 'text' THEN datetime END) AS maxText
+                        FROM DataEntity GROUP BY source, labelId"""
+                )
+                values = []
+                for row in cursor.fetchall():
+                    datetimes = [
+                        _to_epoch_micros(row[column])
+                        for column in ["minInteger", "maxInteger", "minText", "maxText"]
+                        if row[column] is not None
+                    ]
+                    values.append(
+                        [
+                            row["source"],
+                            row["labelId"],
+                            row["totalBytes"],
+                            row["rowCount"],
+                            min(datetimes),
+                            max(datetimes),
+                        ]
+                    )
+                cursor.executemany(
+                    """INSERT INTO LabelStats (source, labelId, totalBytes, rowCount, minDatetime, maxDatetime)
+                        VALUES (?, ?, ?, ?, ?, ?)""",
+                    values,
+                )
+
+            connection.commit()
+
+    def get_content_size_bytes(self) -> int:
+        """Returns the total contentSizeBytes currently stored, in O(1) via the running total."""
+        with self.connection_pool.reader() as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT contentSizeBytes FROM ContentSizeTotal WHERE id = 0")
+            return cursor.fetchone()[0]
+
+    def get_disk_usage(self) -> DiskUsage:
+        """Returns the space the database takes up on disk, in O(1) from the database header and the WAL size."""
+        with self.connection_pool.reader() as connection:
+            page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+            page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+            freelist_count = connection.execute("PRAGMA freelist_count").fetchone()[0]
+            content_size_bytes = connection.execute(
+                "SELECT contentSizeBytes FROM ContentSizeTotal WHERE id = 0"
+            ).fetchone()[0]
+        wal_path = self.database + "-wal"
+        return DiskUsage(
+            database_size_bytes=page_count * page_size,
+            free_bytes=freelist_count * page_size,
+            wal_size_bytes=os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+            content_size_bytes=content_size_bytes,
+        )
+
+    def enable_incremental_vacuum(self):
+        """Switches an existing database to incremental auto-vacuum.
+
+        This rebuilds the whole database, which needs free disk space for a second copy of it and blocks every other
+        operation until it completes.
+        """
+        with self.connection_pool.writer() as connection:
+            connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            connection.execute("VACUUM")
+
+    def reconcile_content_size(self) -> int:
+        """Recomputes the running total of stored content size from DataEntity, correcting any drift.
+
+        Returns:
+            int: The drift that was corrected (stored total - actual total).
+        """
+        start = time.perf_counter()
+        with self.connection_pool.writer() as connection:
+            cursor = connection.cursor()
+            # Block writers for the duration of the scan so the recomputed total is exact.
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT COALESCE(SUM(contentSizeBytes), 0) FROM DataEntity")
+            actual_size = cursor.fetchone()[0]
+            cursor.execute("SELECT contentSizeBytes FROM ContentSizeTotal WHERE id = 0")
+            stored_size = cursor.fetchone()[0]
+            cursor.execute(
+                "UPDATE ContentSizeTotal SET contentSizeBytes = ? WHERE id = 0",
+                [actual_size],
+            )
+            connection.commit()
+
+        drift = stored_size - actual_size
+        if drift != 0:
+            bt.logging.warning(
+                f"Corrected drift of {drift} bytes in the running total of stored content size."
+            )
+        bt.logging.debug(
+            f"Reconciled stored content size of {actual_size} bytes in {time.perf_counter() - start:.2f}s."
+        )
+        return drift
+
+    def add_content_dictionary(self, source: int, dictionary: bytes) -> int:
+        """Persists a zstd dictionary and uses it to compress new content for the source. Returns the dictionary id."""
+        dict_id = self.content_compressor.add_dictionary(source, dictionary)
+        with self.connection_pool.writer() as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO ContentDictionary (dictId, source, dictionary) VALUES (?, ?, ?)",
+                [dict_id, source, dictionary],
+            )
+            connection.commit()
+        return dict_id
+
+    def _read_content_dictionaries(self) -> List[Tuple[int, bytes]]:
+        # Reloads happen while a pooled reader is checked out, so use a connection of its own rather than wait on the pool.
+        with contextlib.closing(self._create_connection()) as connection:
+            return read_content_dictionaries(connection)
+
+    def get_content_dictionaries(self) -> List[Tuple[int, bytes]]:
+        """Returns the (source, dictionary) of every persisted zstd dictionary, oldest first."""
+        with self.connection_pool.reader() as connection:
+            return [
+                (row["source"], row["dictionary"])
+                for row in connection.execute(
+                    "SELECT source, dictionary FROM ContentDictionary ORDER BY id ASC"
+                )
+            ]
+
+    def train_content_dictionaries(
+        self,
+        sample_count=CONTENT_DICTIONARY_SAMPLE_COUNT,
+        dictionary_size_bytes=DEFAULT_DICTIONARY_SIZE_BYTES,
+    ) -> Dict[int, int]:
+        """Trains and persists a zstd dictionary per DataSource from its most recently stored content.
+
+        Returns:
+            Dict[int, int]: The new dictionary id for each source that had enough content to train on.
+        """
+        dict_ids = {}
+        for source in DataSource:
+            with self.connection_pool.reader() as connection:
+                samples = [
+                    self.content_compressor.decompress(row["content"])
+                    for row in connection.execute(
+                        """SELECT content FROM DataEntityWithContent WHERE source = ?
+                            ORDER BY timeBucketId DESC LIMIT ?""",
+                        [source, sample_count],
+                    )
+                ]
+
+            if len(samples) < SqliteMinerStorage.MIN_CONTENT_DICTIONARY_SAMPLE_COUNT:
+                continue
+
+            try:
+                dictionary = train_dictionary(samples, dictionary_size_bytes)
+            except zstandard.ZstdError as e:
+                bt.logging.warning(
+                    f"Failed to train a content dictionary for {source.name}: {e}."
+                )
+                continue
+
+            dict_ids[source] = self.add_content_dictionary(source, dictionary)
+            bt.logging.info(
+                f"Trained content dictionary {dict_ids[source]} for {source.name} from {len(samples)} samples."
+            )
+        return dict_ids
+
+    def migrate_content_compression(
+        self, compress=True, batch_size=EVICTION_BATCH_SIZE
+    ) -> int:
+        """Rewrites stored content so that it is compressed with the current dictionaries, or raw if compress is False.
+
+        Each batch is committed separately so that readers and scrapers are only briefly blocked.
+
+        Returns:
+            int: The number of rows rewritten.
+        """
+        rows_rewritten = 0
+        last_uri = ""
+        while True:
+            with self.connection_pool.writer() as connection:
+                cursor = connection.cursor()
+                cursor.execute(
+                    "SELECT uri, source, content FROM DataEntityWithContent WHERE uri > ? ORDER BY uri ASC LIMIT ?",
+                    [last_uri, batch_size],
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_uri = rows[-1]["uri"]
+
+                values = []
+                for row in rows:
+                    content = row["content"]
+                    if compress:
+                        if self.content_compressor.is_compressed_with_current_dictionary(
+                            row["source"], content
+                        ):
+                            continue
+                        new_content = self.content_compressor.compress(
+                            row["source"], self.content_compressor.decompress(content)
+                        )
+                    else:
+                        if not is_compressed(content):
+                            continue
+                        new_content = self.content_compressor.decompress(content)
+                    values.append([new_content, row["uri"]])
+
+                cursor.executemany(
+                    (
+                        """UPDATE DataEntityContent SET content = ?
+                            WHERE contentId = (SELECT contentId FROM DataEntity WHERE uri = ?)"""
+                        if self.split_content
+                        else "UPDATE DataEntity SET content = ? WHERE uri = ?"
+                    ),
+                    values,
+                )
+                connection.commit()
+                rows_rewritten += len(values)
+
+        bt.logging.info(f"Rewrote the content of {rows_rewritten} rows.")
+        return rows_rewritten
+
+    def get_datetime_format(self) -> str:
+        """Returns how datetimes of newly stored DataEntities are written."""
+        with self.connection_pool.reader() as connection:
+            return get_datetime_format(connection)
+
+    def _get_writer_datetime_format(self, connection: sqlite3.Connection) -> str:
+        """Returns how datetimes are written by the open write transaction on the writer connection."""
+        data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+        cache = self.datetime_format_cache
+        if cache is None or cache[0] is not connection or cache[1] != data_version:
+            cache = (connection, data_version, get_datetime_format(connection))
+            self.datetime_format_cache = cache
+        return cache[2]
+
+    def migrate_integer_timestamps(self, batch_size=EVICTION_BATCH_SIZE) -> int:
+        """Converts stored datetimes to integer microseconds since epoch.
+
+        New rows are written as integers as soon as the migration starts. Each batch is committed separately so that
+        readers and scrapers are only briefly blocked, and rows are readable in either format throughout. Completion is
+        recorded once every row is converted, so scans that need a single format know when they can run again.
+
+        Returns:
+            int: The number of rows converted.
+        """
+        with self.connection_pool.writer() as connection:
+            set_storage_metadata(
+                connection, DATETIME_FORMAT_KEY, DATETIME_FORMAT_EPOCH_MICROS
+            )
+            connection.commit()
+            # Written by the writer connection itself, so its data_version does not change.
+            self.datetime_format_cache = None
+
+        rows_converted = 0
+        last_uri = ""
+        while True:
+            with self.connection_pool.writer() as connection:
+                cursor = connection.cursor()
+                cursor.row_factory = None
+                cursor.execute(
+                    """SELECT uri, +datetime FROM DataEntity WHERE uri > ? ORDER BY uri ASC LIMIT ?""",
+                    [last_uri, batch_size],
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_uri = rows[-1][0]
+
+                values = [
+                    [
+                        utils.datetime_to_epoch_micros(
+                            tz_aware_timestamp_adapter(datetime.encode())
+                        ),
+                        uri,
+                    ]
+                    for uri, datetime in rows
+                    if type(datetime) is not int
+                ]
+                cursor.executemany(
+                    "UPDATE DataEntity SET datetime = ? WHERE uri = ?", values
+                )
+                connection.commit()
+                rows_converted += len(values)
+
+        with self.connection_pool.writer() as connection:
+            set_storage_metadata(connection, DATETIME_MIGRATION_COMPLETE_KEY, "1")
+            connection.commit()
+
+        bt.logging.info(f"Converted the datetime of {rows_converted} rows.")
+        return rows_converted
+
     def store_data_entities(self, data_entities: List[DataEntity]):
         """Stores any number of DataEntities, making space if necessary."""
 
@@ -168,57 +1058,187 @@ class SqliteMinerStorage(MinerStorage):
                 + str(self.database_max_content_size_bytes)
             )
 
-        with contextlib.closing(self._create_connection()) as connection:
-            # Ensure only one thread is clearing space when necessary.
-            with self.clearing_space_lock:
-                # If we would exceed our maximum configured stored content size then clear space.
-                cursor = connection.cursor()
-                cursor.execute("SELECT SUM(contentSizeBytes) FROM DataEntity")
+        # Ensure only one thread is clearing space when necessary.
+        with self.clearing_space_lock:
+            # If we would exceed our maximum configured stored content size or disk usage then clear space.
+            content_bytes_to_clear = get_content_bytes_to_clear(
+                self.database_max_content_size_bytes,
+                self.database_max_size_bytes,
+                self.get_disk_usage(),
+                added_content_size,
+            )
+            if content_bytes_to_clear > 0:
+                self.clear_content_from_oldest(content_bytes_to_clear)
 
-                # If there are no rows we convert the None result to 0
-                result = cursor.fetchone()
-                current_content_size = result[0] if result[0] else 0
-
-                if (
-                    current_content_size + added_content_size
-                    > self.database_max_content_size_bytes
-                ):
-                    content_bytes_to_clear = (
-                        self.database_max_content_size_bytes // 10
-                        if self.database_max_content_size_bytes // 10
-                        > added_content_size
-                        else added_content_size
-                    )
-                    self.clear_content_from_oldest(content_bytes_to_clear)
+        # Parse every DataEntity into an list of value lists for inserting.
+        values = []
+        digests = [
+            KnownUriFilter.digest_data_entity(data_entity)
+            for data_entity in data_entities
+        ]
 
-            # Parse every DataEntity into an list of value lists for inserting.
-            values = []
+        for data_entity in data_entities:
+            label = (
+                "NULL" if (data_entity.label is None) else data_entity.label.value
+            )
+            time_bucket_id = TimeBucket.from_datetime(data_entity.datetime).id
+            values.append(
+                [
+                    data_entity.uri,
+                    data_entity.datetime,
+                    time_bucket_id,
+                    data_entity.source,
+                    label,
+                    (
+                        self.content_compressor.compress(
+                            data_entity.source, data_entity.content
+                        )
+                        if self.compress_content
+                        else data_entity.content
+                    ),
+                    # Always the logical size so that limits and scoring are unaffected by compression.
+                    data_entity.content_size_bytes,
+                ]
+            )
 
-            for data_entity in data_entities:
-                label = (
-                    "NULL" if (data_entity.label is None) else data_entity.label.value
-                )
-                time_bucket_id = TimeBucket.from_datetime(data_entity.datetime).id
-                values.append(
-                    [
-                        data_entity.uri,
-                        data_entity.datetime,
-                        time_bucket_id,
-                        data_entity.source,
-                        label,
-                        data_entity.content,
-                        data_entity.content_size_bytes,
-                    ]
+        with self.connection_pool.writer() as connection:
+            cursor = connection.cursor()
+            # Check the datetime format within the write transaction so a concurrent migration is never missed.
+            cursor.execute("BEGIN IMMEDIATE")
+            if self._get_writer_datetime_format(connection) == DATETIME_FORMAT_EPOCH_MICROS:
+                for value in values:
+                    value[1] = utils.datetime_to_epoch_micros(value[1])
+
+            label_ids = self.label_cache.get_or_insert_ids(
+                connection, (value[4] for value in values)
+            )
+            for value in values:
+                value[4] = label_ids[value[4]]
+
+            if self.split_content:
+                # Content ids are only allocated under the write lock, so the next ids are always free.
+                next_content_id = cursor.execute(
+                    "SELECT COALESCE(MAX(contentId), 0) + 1 FROM DataEntityContent"
+                ).fetchone()[0]
+                contents = []
+                for content_id, value in enumerate(values, next_content_id):
+                    contents.append([content_id, value[5]])
+                    value[5] = content_id
+                # Replaced rows delete their previous content through the data_entity_delete_content trigger.
+                cursor.executemany(
+                    "INSERT INTO DataEntityContent (contentId, content) VALUES (?, ?)",
+                    contents,
                 )
 
             # Insert overwriting duplicate keys (in case of updated content).
             cursor.executemany("REPLACE INTO DataEntity VALUES (?,?,?,?,?,?,?)", values)
 
+            # Widen the datetime range of each label stored to, which the triggers do not track.
+            datetime_ranges = {}
+            for value in values:
+                micros = _to_epoch_micros(value[1])
+                key = (value[3], value[4])
+                datetime_range = datetime_ranges.get(key)
+                if datetime_range is None:
+                    datetime_ranges[key] = [micros, micros]
+                else:
+                    datetime_range[0] = min(datetime_range[0], micros)
+                    datetime_range[1] = max(datetime_range[1], micros)
+            cursor.executemany(
+                SqliteMinerStorage.LABEL_STATS_WIDEN_DATETIMES,
+                [
+                    [min_micros, max_micros, source, label_id]
+                    for (source, label_id), (min_micros, max_micros) in datetime_ranges.items()
+                ],
+            )
+
             # Commit the insert.
             connection.commit()
+            self.label_cache.remember(label_ids)
+            self.known_uri_filter.remember(digests)
+
+    def delete_data_entities(self, uris: List[str]) -> int:
+        """Deletes the DataEntities with any of the provided URIs, returning the number deleted.
+
+        URIs are looked up on a reader first, so the writer lock is only taken when one of them is stored.
+        """
+        stored_uris = []
+        with self.connection_pool.reader() as connection:
+            cursor = connection.cursor()
+            cursor.row_factory = None
+            for i in range(0, len(uris), SqliteMinerStorage.URI_LOOKUP_BATCH_SIZE):
+                batch = uris[i : i + SqliteMinerStorage.URI_LOOKUP_BATCH_SIZE]
+                cursor.execute(
+                    f"SELECT uri FROM DataEntity WHERE uri IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+                stored_uris.extend(row[0] for row in cursor)
+            cursor.close()
+        if not stored_uris:
+            return 0
+
+        with self.connection_pool.writer() as connection:
+            cursor = connection.cursor()
+            cursor.executemany(
+                "DELETE FROM DataEntity WHERE uri = ?", ([uri] for uri in stored_uris)
+            )
+            connection.commit()
+        self.known_uri_filter.forget(
+            KnownUriFilter.uri_key(uri) for uri in stored_uris
+        )
+        return len(stored_uris)
+
+    def seed_known_uri_filter(self):
+        """Fills the known URI filter from the most recently stored entities, once per storage.
+
+        Decompresses up to the filter capacity of rows, so it runs on the index refresh thread rather than when storing.
+        """
+        with self.known_uri_filter_seed_lock:
+            if self.known_uri_filter_seeded:
+                return
+
+            start = time.perf_counter()
+            with self.connection_pool.reader() as connection:
+                cursor = connection.cursor()
+                cursor.row_factory = None
+                # Scrapers mostly revisit recent data, so remember the most recent entities.
+                cursor.execute(
+                    """SELECT uri, +datetime, source, label, content, contentSizeBytes FROM DataEntityWithContent
+                        JOIN Label USING (labelId)
+                        ORDER BY timeBucketId DESC
+                        LIMIT ?""",
+                    [self.known_uri_filter.capacity],
+                )
+                seeded = self.known_uri_filter.seed(
+                    KnownUriFilter.digest(
+                        uri,
+                        (
+                            utils.datetime_from_epoch_micros(datetime)
+                            if type(datetime) is int
+                            else tz_aware_timestamp_adapter(datetime.encode())
+                        ),
+                        source,
+                        label,
+                        self.content_compressor.decompress(content),
+                        content_size_bytes,
+                    )
+                    for uri, datetime, source, label, content, content_size_bytes in cursor
+                )
+                cursor.close()
+
+            self.known_uri_filter_seeded = True
+            bt.logging.info(
+                f"Seeded the known URI filter with {seeded} entities in {time.perf_counter() - start:.2f}s."
+            )
+
+    def filter_unchanged_data_entities(
+        self, data_entities: List[DataEntity]
+    ) -> List[DataEntity]:
+        """Returns the DataEntities that are not known to be already stored exactly as provided, in order."""
+        return self.known_uri_filter.filter_unchanged(data_entities)
 
     def store_hf_dataset_info(self, hf_metadatas: List[HuggingFaceMetadata]):
-        with contextlib.closing(self._create_connection()) as connection:
+        with self.connection_pool.writer() as connection:
             cursor = connection.cursor()
             values = []
             for hf_metadata in hf_metadatas:
@@ -237,12 +1257,43 @@ class SqliteMinerStorage(MinerStorage):
             connection.commit()
 
     def get_earliest_data_datetime(self, source):
-        query = "SELECT MIN(datetime) as earliest_date FROM DataEntity WHERE source = ?"
-        with contextlib.closing(self._create_connection()) as connection:
+        query = "SELECT MIN(minDatetime) as earliest_date FROM LabelStats WHERE source = ?"
+        with self.connection_pool.reader() as connection:
             cursor = connection.cursor()
             cursor.execute(query, (source,))
             result = cursor.fetchone()
-            return result['earliest_date'] if result and result['earliest_date'] else None
+            if not result or result['earliest_date'] is None:
+                return None
+            return utils.datetime_from_epoch_micros(result['earliest_date'])
+
+    def list_label_stats(self) -> List[LabelStats]:
+        """Lists the row count, size and datetime range of the DataEntities stored for each source and label."""
+        with self.connection_pool.reader() as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                """SELECT source, label, rowCount, totalBytes, minDatetime, maxDatetime FROM LabelStats
+                        JOIN Label USING (labelId)
+                        ORDER BY source, totalBytes DESC"""
+            )
+            return [
+                LabelStats(
+                    source=row["source"],
+                    label=row["label"] if row["label"] != "NULL" else None,
+                    row_count=row["rowCount"],
+                    size_bytes=row["totalBytes"],
+                    earliest_datetime=(
+                        utils.datetime_from_epoch_micros(row["minDatetime"])
+                        if row["minDatetime"] is not None
+                        else None
+                    ),
+                    latest_datetime=(
+                        utils.datetime_from_epoch_micros(row["maxDatetime"])
+                        if row["maxDatetime"] is not None
+                        else None
+                    ),
+                )
+                for row in cursor
+            ]
 
     def should_upload_hf_data(self, unique_id: str) -> bool:
         sql_query = """
@@ -256,7 +1307,7 @@ class SqliteMinerStorage(MinerStorage):
             );
         """
         try:
-            with contextlib.closing(self._create_connection()) as connection:
+            with self.connection_pool.reader() as connection:
                 cursor = connection.cursor()
                 cursor.execute(sql_query, (f"%_{unique_id}",))
                 result = cursor.fetchone()
@@ -288,7 +1339,7 @@ class SqliteMinerStorage(MinerStorage):
             LIMIT 2;
         """
 
-        with contextlib.closing(self._create_connection()) as connection:
+        with self.connection_pool.reader() as connection:
             cursor = connection.cursor()
             cursor.execute(sql_query, (f"%_{unique_id}",))
             hf_metadatas = []
@@ -315,15 +1366,29 @@ class SqliteMinerStorage(MinerStorage):
             else data_entity_bucket_id.label.value
         )
 
-        with contextlib.closing(self._create_connection()) as connection:
+        # Every row in the bucket shares the same source and label, so build them once and share them across rows.
+        source = DataSource(data_entity_bucket_id.source)
+        data_label = data_entity_bucket_id.label
+        decompress = self.content_compressor.decompress
+        size_limit = constants.DATA_ENTITY_BUCKET_SIZE_LIMIT_BYTES
+        from_epoch_micros = utils.datetime_from_epoch_micros
+
+        with self.connection_pool.reader() as connection:
+            label_id = self.label_cache.get_id(connection, label)
+            if label_id is None:
+                return []
+
             cursor = connection.cursor()
+            # Plain tuples avoid allocating a Row per row.
+            cursor.row_factory = None
+            # The unary + bypasses the timestamp converter so that integer timestamps are not parsed as text.
             cursor.execute(
-                """SELECT * FROM DataEntity 
-                        WHERE timeBucketId = ? AND source = ? AND label = ?""",
+                """SELECT uri, +datetime, content, contentSizeBytes FROM DataEntityWithContent
+                        WHERE timeBucketId = ? AND source = ? AND labelId = ?""",
                 [
                     data_entity_bucket_id.time_bucket.id,
                     data_entity_bucket_id.source,
-                    label,
+                    label_id,
                 ],
             )
 
@@ -332,23 +1397,30 @@ class SqliteMinerStorage(MinerStorage):
 
             running_size = 0
 
-            for row in cursor:
+            for uri, datetime, content, content_size_bytes in cursor:
                 # If we have already reached the max DataEntityBucket size instead return early.
-                if running_size >= constants.DATA_ENTITY_BUCKET_SIZE_LIMIT_BYTES:
-                    return data_entities
-                else:
-                    # Construct the new DataEntity with all non null columns.
-                    data_entity = DataEntity(
-                        uri=row["uri"],
-                        datetime=row["datetime"],
-                        source=DataSource(row["source"]),
-                        content=row["content"],
-                        content_size_bytes=row["contentSizeBytes"],
-                        label=DataLabel(value=row["label"]) if row["label"] != "NULL" else None
+                if running_size >= size_limit:
+                    break
+
+                # Skip validation since every row was validated when it was stored.
+                data_entities.append(
+                    DataEntity.model_construct(
+                        uri=uri,
+                        datetime=(
+                            from_epoch_micros(datetime)
+                            if type(datetime) is int
+                            else tz_aware_timestamp_adapter(datetime.encode())
+                        ),
+                        source=source,
+                        label=data_label,
+                        content=decompress(content),
+                        content_size_bytes=content_size_bytes,
                     )
+                )
+                running_size += content_size_bytes
 
-                    data_entities.append(data_entity)
-                    running_size += row["contentSizeBytes"]
+            # Release the read snapshot before handing the connection back to the pool.
+            cursor.close()
 
             # If we reach the end of the cursor then return all of the data entities for this DataEntityBucket.
             bt.logging.trace(
@@ -358,6 +1430,9 @@ class SqliteMinerStorage(MinerStorage):
 
     def refresh_compressed_index(self, time_delta: dt.timedelta):
         """Refreshes the compressed MinerIndex."""
+        # Seed the filter here, off the write path, even while the index is still fresh.
+        self.seed_known_uri_filter()
+
         # First check if we already have a fresh enough index, if so return immediately.
         # Since the GetMinerIndex uses a 30 minute freshness period this should be the default path with the
         # Refresh thread using a 20 minute freshness period and calling this method every 21 minutes.
@@ -382,71 +1457,112 @@ class SqliteMinerStorage(MinerStorage):
                     )
                     return
 
-            with contextlib.closing(self._create_connection()) as connection:
-                cursor = connection.cursor()
+            oldest_time_bucket_id = TimeBucket.from_datetime(
+                dt.datetime.now()
+                - dt.timedelta(constants.DATA_ENTITY_BUCKET_AGE_LIMIT_DAYS)
+            ).id
 
-                oldest_time_bucket_id = TimeBucket.from_datetime(
-                    dt.datetime.now()
-                    - dt.timedelta(constants.DATA_ENTITY_BUCKET_AGE_LIMIT_DAYS)
-                ).id
+            # Always get the max for caching and truncate to each necessary size.
+            bucket_sizes, content_size_bytes = self.list_bucket_sizes_and_content_size(
+                oldest_time_bucket_id,
+                constants.DATA_ENTITY_BUCKET_COUNT_LIMIT_PER_MINER_INDEX_PROTOCOL_4,
+            )
 
-                # Get sum of content_size_bytes for all rows grouped by DataEntityBucket.
-                cursor.execute(
-                    """SELECT SUM(contentSizeBytes) AS bucketSize, timeBucketId, source, label FROM DataEntity
-                            WHERE timeBucketId >= ?
-                            GROUP BY timeBucketId, source, label
-                            ORDER BY bucketSize DESC
-                            LIMIT ?
-                            """,
-                    [
-                        oldest_time_bucket_id,
-                        constants.DATA_ENTITY_BUCKET_COUNT_LIMIT_PER_MINER_INDEX_PROTOCOL_4,
-                    ],  # Always get the max for caching and truncate to each necessary size.
+            bt.logging.trace("Creating protocol 4 cached index.")
+            compressed_index = build_compressed_index(bucket_sizes)
+            # Serialize once here so that serving the index to each validator is just a reference copy.
+            serialized_index = SerializedMinerIndex.from_compressed_index(
+                compressed_index
+            )
+            built_at = dt.datetime.now()
+            with self.cached_index_lock:
+                self.cached_index_4 = compressed_index
+                self.cached_index_serialized = serialized_index
+                self.cached_index_updated = built_at
+                bt.logging.success(
+                    f"Created cached index of {serialized_index.size_bytes} bytes "
+                    + f"across {serialized_index.bucket_count} buckets."
                 )
 
-                buckets_by_source_by_label = defaultdict(dict)
+            try:
+                write_index_snapshot(
+                    self.index_snapshot_path,
+                    self.generation,
+                    content_size_bytes,
+                    built_at,
+                    serialized_index,
+                )
+            except OSError:
+                bt.logging.warning(
+                    f"Failed to persist the index snapshot: {traceback.format_exc()}"
+                )
 
-                for row in cursor:
-                    # Ensure the miner does not attempt to report more than the max DataEntityBucket size.
-                    size = (
-                        constants.DATA_ENTITY_BUCKET_SIZE_LIMIT_BYTES
-                        if row["bucketSize"]
-                        >= constants.DATA_ENTITY_BUCKET_SIZE_LIMIT_BYTES
-                        else row["bucketSize"]
-                    )
+    def list_bucket_sizes(
+        self, oldest_time_bucket_id: int, limit: int
+    ) -> List[BucketSize]:
+        """Lists the largest DataEntityBuckets at or after the provided time bucket, largest first."""
+        with self.connection_pool.reader() as connection:
+            return self._list_bucket_sizes(connection, oldest_time_bucket_id, limit)
 
-                    label = row["label"] if row["label"] != "NULL" else None
+    def list_bucket_sizes_and_content_size(
+        self, oldest_time_bucket_id: int, limit: int
+    ) -> Tuple[List[BucketSize], int]:
+        """Lists the largest DataEntityBuckets like list_bucket_sizes, along with the total contentSizeBytes stored.
 
-                    bucket = buckets_by_source_by_label[DataSource(row["source"])].get(
-                        label, CompressedEntityBucket(label=label)
-                    )
-                    bucket.sizes_bytes.append(size)
-                    bucket.time_bucket_ids.append(row["timeBucketId"])
-                    buckets_by_source_by_label[DataSource(row["source"])][
-                        label
-                    ] = bucket
-
-                # Convert the buckets_by_source_by_label into a list of lists of CompressedEntityBucket and return
-                bt.logging.trace("Creating protocol 4 cached index.")
-                with self.cached_index_lock:
-                    self.cached_index_4 = CompressedMinerIndex(
-                        sources={
-                            source: list(labels_to_buckets.values())
-                            for source, labels_to_buckets in buckets_by_source_by_label.items()
-                        }
-                    )
-                    self.cached_index_updated = dt.datetime.now()
-                    bt.logging.success(
-                        f"Created cached index of {CompressedMinerIndex.size_bytes(self.cached_index_4)} bytes "
-                        + f"across {CompressedMinerIndex.bucket_count(self.cached_index_4)} buckets."
-                    )
+        Both are read in one transaction, so the total identifies the content the buckets were read from.
+        """
+        with self.connection_pool.reader() as connection:
+            connection.execute("BEGIN")
+            try:
+                bucket_sizes = self._list_bucket_sizes(
+                    connection, oldest_time_bucket_id, limit
+                )
+                content_size_bytes = connection.execute(
+                    "SELECT contentSizeBytes FROM ContentSizeTotal WHERE id = 0"
+                ).fetchone()[0]
+            finally:
+                connection.rollback()
+            return bucket_sizes, content_size_bytes
+
+    def _list_bucket_sizes(
+        self, connection: sqlite3.Connection, oldest_time_bucket_id: int, limit: int
+    ) -> List[BucketSize]:
+        cursor = connection.cursor()
+        # Get the size of every DataEntityBucket from the incrementally maintained aggregates.
+        cursor.execute(
+            """SELECT totalBytes AS bucketSize, timeBucketId, source, label FROM BucketStats
+                    JOIN Label USING (labelId)
+                    WHERE timeBucketId >= ?
+                    ORDER BY bucketSize DESC
+                    LIMIT ?
+                    """,
+            [oldest_time_bucket_id, limit],
+        )
+        return [
+            BucketSize(
+                time_bucket_id=row["timeBucketId"],
+                source=row["source"],
+                label=row["label"] if row["label"] != "NULL" else None,
+                size_bytes=row["bucketSize"],
+            )
+            for row in cursor
+        ]
 
     def list_contents_in_data_entity_buckets(
-        self, data_entity_bucket_ids: List[DataEntityBucketId]
+        self,
+        data_entity_bucket_ids: List[DataEntityBucketId],
+        size_limit_bytes: int = constants.BULK_CONTENTS_SIZE_LIMIT_BYTES,
+        count_limit: int = constants.BULK_CONTENTS_COUNT_LIMIT,
     ) -> Dict[DataEntityBucketId, List[bytes]]:
         """Lists contents for each requested DataEntityBucketId.
+
+        The size and count limits are split fairly between the requested buckets, so one large bucket can not crowd
+        out the others. Within a bucket the smallest contents are returned first.
+
         Args:
             data_entity_bucket_ids (List[DataEntityBucketId]): Which buckets to get contents for.
+            size_limit_bytes (int): The maximum total contentSizeBytes to return across all buckets.
+            count_limit (int): The maximum number of contents to return across all buckets.
         Returns:
             Dict[DataEntityBucketId, List[bytes]]: Map of each bucket id to contained contents.
         """
@@ -457,106 +1573,284 @@ class SqliteMinerStorage(MinerStorage):
         ):
             return defaultdict(list)
 
-        # Get rows that match the DataEntityBucketIds.
-        # Use a list of alternating ids and labels to match the upcoming sql query.
-        time_bucket_ids_and_labels = list()
-        for bucket_id in data_entity_bucket_ids:
-            time_bucket_ids_and_labels.append(bucket_id.time_bucket.id)
-            # Note that only twitter has NULL label and that all twitter labels are prefixed with #.
-            # Therefore we do not need to distinguish labels by source.
-            label = "NULL" if (bucket_id.label is None) else bucket_id.label.value
-            time_bucket_ids_and_labels.append(label)
+        # Deduplicate while preserving order so that each bucket gets exactly one share of the limits.
+        bucket_ids = list(dict.fromkeys(data_entity_bucket_ids))
+
+        with self.connection_pool.reader() as connection:
+            # Labels that have never been stored have no labelId (None) and so match no rows.
+            bucket_keys = [
+                (
+                    bucket_id.time_bucket.id,
+                    bucket_id.source,
+                    self.label_cache.get_id(
+                        connection,
+                        "NULL" if (bucket_id.label is None) else bucket_id.label.value,
+                    ),
+                )
+                for bucket_id in bucket_ids
+            ]
+            requested_values = ", ".join(["(?, ?, ?)"] * len(bucket_keys))
+            requested_params = [value for key in bucket_keys for value in key]
 
-        with contextlib.closing(self._create_connection()) as connection:
             cursor = connection.cursor()
+
+            # Look up how much each requested bucket holds so the limits can be split fairly between them.
             cursor.execute(
-                f"""SELECT timeBucketId, source, label, content, contentSizeBytes FROM DataEntity
-                    WHERE timeBucketId = ? AND label = ?
-                    {"OR timeBucketId = ? AND label = ?" * (len(data_entity_bucket_ids) - 1)}
-                    LIMIT ?
-                 """,
-                list(time_bucket_ids_and_labels)
-                + [constants.BULK_CONTENTS_COUNT_LIMIT],
+                f"""WITH Requested(timeBucketId, source, labelId) AS (VALUES {requested_values})
+                    SELECT r.timeBucketId, r.source, r.labelId, b.totalBytes, b.rowCount
+                    FROM Requested r
+                    CROSS JOIN BucketStats b
+                    ON b.timeBucketId = r.timeBucketId AND b.source = r.source AND b.labelId = r.labelId""",
+                requested_params,
+            )
+            stats_by_key = {
+                (row["timeBucketId"], row["source"], row["labelId"]): (
+                    row["totalBytes"],
+                    row["rowCount"],
+                )
+                for row in cursor
+            }
+            byte_demands = [stats_by_key.get(key, (0, 0))[0] for key in bucket_keys]
+            count_demands = [stats_by_key.get(key, (0, 0))[1] for key in bucket_keys]
+            byte_allocations = allocate_fair_shares(byte_demands, size_limit_bytes)
+            count_allocations = allocate_fair_shares(count_demands, count_limit)
+
+            # Buckets that fit entirely within their share are not limited (NULL), so every row is returned.
+            allocated_keys = [
+                key
+                + (
+                    None if byte_allocation == byte_demand else byte_allocation,
+                    None if count_allocation == count_demand else count_allocation,
+                )
+                for key, byte_demand, count_demand, byte_allocation, count_allocation in zip(
+                    bucket_keys,
+                    byte_demands,
+                    count_demands,
+                    byte_allocations,
+                    count_allocations,
+                )
+                if count_allocation > 0
+            ]
+            if not allocated_keys:
+                return defaultdict(list)
+
+            # Walk the bucket index for each requested bucket in turn, choosing rows using only the index.
+            # Content is then only read for the rows that fit within the bucket's share of the limits.
+            # A row is included only if the bucket's size including it fits within the share, so the shares and
+            # therefore the overall limit are never exceeded.
+            cursor.execute(
+                f"""WITH Requested(timeBucketId, source, labelId, byteAllocation, countAllocation) AS (
+                        VALUES {", ".join(["(?, ?, ?, ?, ?)"] * len(allocated_keys))}
+                    ),
+                    Chosen AS (
+                        SELECT r.timeBucketId, r.source, r.labelId, d.uri, r.byteAllocation, r.countAllocation,
+                            SUM(d.contentSizeBytes) OVER bucket AS sizeThrough,
+                            ROW_NUMBER() OVER bucket AS rowNumber
+                        FROM Requested r
+                        CROSS JOIN DataEntity d INDEXED BY data_entity_bucket_index3
+                        ON d.timeBucketId = r.timeBucketId AND d.source = r.source AND d.labelId = r.labelId
+                        WINDOW bucket AS (
+                            PARTITION BY r.timeBucketId, r.source, r.labelId
+                            ORDER BY d.contentSizeBytes, d.uri
+                            ROWS UNBOUNDED PRECEDING
+                        )
+                    )
+                    SELECT c.timeBucketId, c.source, c.labelId, d.content
+                    FROM Chosen c
+                    JOIN DataEntityWithContent d ON d.uri = c.uri
+                    WHERE (c.byteAllocation IS NULL OR c.sizeThrough <= c.byteAllocation)
+                        AND (c.countAllocation IS NULL OR c.rowNumber <= c.countAllocation)""",
+                [value for key in allocated_keys for value in key],
             )
 
-            # Get the contents from each row and return them up to the configured max size.
+            bucket_ids_by_key = dict(zip(bucket_keys, bucket_ids))
+            decompress = self.content_compressor.decompress
             buckets_ids_to_contents = defaultdict(list)
-            running_size = 0
-
             for row in cursor:
-                if running_size < constants.BULK_CONTENTS_SIZE_LIMIT_BYTES:
-                    data_entity_bucket_id = DataEntityBucketId(
-                        time_bucket=TimeBucket(id=row["timeBucketId"]),
-                        source=DataSource(row["source"]),
-                        label=DataLabel(value=row["label"]) if row["label"] != "NULL" else None
-                    )
-                    buckets_ids_to_contents[data_entity_bucket_id].append(
-                        row["content"]
-                    )
-                    running_size += row["contentSizeBytes"]
-                else:
-                    # Return early since we hit the size limit.
-                    break
+                bucket_id = bucket_ids_by_key[
+                    (row["timeBucketId"], row["source"], row["labelId"])
+                ]
+                buckets_ids_to_contents[bucket_id].append(decompress(row["content"]))
+
+            # Release the read snapshot before handing the connection back to the pool.
+            cursor.close()
 
             return buckets_ids_to_contents
 
+    def _refresh_stale_compressed_index(self):
+        # While the refresh thread is rebuilding the index, e.g. after loading a snapshot on startup, serve the
+        # cached index rather than waiting on the rebuild.
+        with self.cached_index_lock:
+            if (
+                self.cached_index_4 is not None
+                and self.cached_index_refresh_lock.locked()
+            ):
+                return
+
+        # Force refresh index if 10 minutes beyond refersh period. Expected to be refreshed earlier by refresh loop.
+        self.refresh_compressed_index(
+            time_delta=(constants.MINER_CACHE_FRESHNESS + dt.timedelta(minutes=10))
+        )
+
     def get_compressed_index(
         self,
         bucket_count_limit=constants.DATA_ENTITY_BUCKET_COUNT_LIMIT_PER_MINER_INDEX_PROTOCOL_4,
     ) -> CompressedMinerIndex:
         """Gets the compressed MinerIndex, which is a summary of all of the DataEntities that this MinerStorage is currently serving."""
 
-        # Force refresh index if 10 minutes beyond refersh period. Expected to be refreshed earlier by refresh loop.
-        self.refresh_compressed_index(
-            time_delta=(constants.MINER_CACHE_FRESHNESS + dt.timedelta(minutes=10))
-        )
+        self._refresh_stale_compressed_index()
 
         with self.cached_index_lock:
             # Only protocol 4 is supported at this time.
             return self.cached_index_4
 
-    def clear_content_from_oldest(self, content_bytes_to_clear: int):
-        """Deletes entries starting from the oldest until we have cleared the specified amount of content."""
+    def get_serialized_compressed_index(self) -> SerializedMinerIndex:
+        """Gets the compressed MinerIndex already serialized for GetMinerIndex responses."""
+
+        self._refresh_stale_compressed_index()
+
+        with self.cached_index_lock:
+            return self.cached_index_serialized
+
+    def clear_content_from_oldest(self, content_bytes_to_clear: int) -> EvictionResult:
+        """Deletes entries starting from the oldest until we have cleared the specified amount of content.
+
+        Whole time buckets are deleted, oldest first, in batches of at most EVICTION_BATCH_SIZE rows per transaction
+        so that the writer lock is only ever held briefly.
+        """
 
         bt.logging.debug(f"Database full. Clearing {content_bytes_to_clear} bytes.")
+        start = time.perf_counter()
 
-        with contextlib.closing(self._create_connection()) as connection:
+        # Find the time buckets to clear in one pass over the per bucket aggregates, oldest first.
+        # BucketStats is keyed by timeBucketId first so the aggregate streams and we stop as soon as we have enough.
+        time_bucket_ids_to_clear = []
+        bytes_to_clear = 0
+        with self.connection_pool.reader() as connection:
             cursor = connection.cursor()
-
-            # TODO Investigate way to select last X bytes worth of entries in a single query.
-            # Get the contentSizeBytes of each row by timestamp desc.
             cursor.execute(
-                "SELECT contentSizeBytes, datetime FROM DataEntity ORDER BY datetime ASC"
+                """SELECT timeBucketId, SUM(totalBytes) AS bucketSize FROM BucketStats
+                        GROUP BY timeBucketId
+                        ORDER BY timeBucketId ASC"""
             )
-
-            running_bytes = 0
-            earliest_datetime_to_clear = dt.datetime.min
-            # Iterate over rows until we have found bytes to clear or we reach the end and fail.
             for row in cursor:
-                running_bytes += row["contentSizeBytes"]
-                earliest_datetime_to_clear = row["datetime"]
-                # Once we have enough content to clear then we do so.
-                if running_bytes >= content_bytes_to_clear:
+                time_bucket_ids_to_clear.append(row["timeBucketId"])
+                bytes_to_clear += row["bucketSize"]
+                if bytes_to_clear >= content_bytes_to_clear:
+                    break
+            cursor.close()
+
+        # Delete the chosen time buckets in bounded batches, committing each batch.
+        rows_cleared = 0
+        for time_bucket_id in time_bucket_ids_to_clear:
+            while True:
+                with self.connection_pool.writer() as connection:
+                    cursor = connection.cursor()
                     cursor.execute(
-                        "DELETE FROM DataEntity WHERE datetime <= ?",
-                        [earliest_datetime_to_clear],
+                        """DELETE FROM DataEntity WHERE uri IN (
+                                SELECT uri FROM DataEntity WHERE timeBucketId = ? LIMIT ?
+                            )""",
+                        [time_bucket_id, SqliteMinerStorage.EVICTION_BATCH_SIZE],
                     )
+                    deleted = cursor.rowcount
                     connection.commit()
 
+                rows_cleared += deleted
+                if deleted < SqliteMinerStorage.EVICTION_BATCH_SIZE:
+                    break
+
+        if time_bucket_ids_to_clear:
+            # Forget the deleted entities, so they are stored again if re-scraped, but keep the rest of the filter.
+            self.known_uri_filter.forget_time_buckets(
+                min(time_bucket_ids_to_clear), max(time_bucket_ids_to_clear)
+            )
+            self._narrow_earliest_datetimes(max(time_bucket_ids_to_clear))
+        self._release_free_pages()
+
+        result = EvictionResult(
+            bytes_cleared=bytes_to_clear,
+            rows_cleared=rows_cleared,
+            time_bucket_ids_cleared=time_bucket_ids_to_clear,
+            duration_seconds=time.perf_counter() - start,
+        )
+        disk_usage = self.get_disk_usage()
+        bt.logging.info(
+            f"Cleared {result.bytes_cleared} bytes across {result.rows_cleared} rows "
+            + f"from {len(result.time_bucket_ids_cleared)} time buckets in {result.duration_seconds:.2f}s. "
+            + f"Using {disk_usage.used_bytes} bytes on disk for {disk_usage.content_size_bytes} bytes of content "
+            + f"(overhead ratio {disk_usage.overhead_ratio:.2f})."
+        )
+        return result
+
+    def _release_free_pages(self):
+        """Hands pages freed by deletes back to the filesystem, in batches, if incremental auto-vacuum is enabled."""
+        while True:
+            with self.connection_pool.writer() as connection:
+                if connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                    return
+                if connection.execute("PRAGMA freelist_count").fetchone()[0] == 0:
+                    return
+                connection.execute(
+                    f"PRAGMA incremental_vacuum({SqliteMinerStorage.INCREMENTAL_VACUUM_BATCH_PAGES})"
+                ).fetchall()
+                connection.commit()
+
+    def _narrow_earliest_datetimes(self, last_cleared_time_bucket_id: int):
+        """Recomputes the earliest datetime of each label that may have lost its earliest entity to eviction."""
+        # Every entity in a cleared time bucket is before the end of the last cleared time bucket.
+        cleared_before_micros = (
+            (last_cleared_time_bucket_id + 1) * 3600 * 1_000_000
+        )
+        with self.connection_pool.writer() as connection:
+            cursor = connection.cursor()
+            cursor.row_factory = None
+            cursor.execute("BEGIN IMMEDIATE")
+            stale_keys = cursor.execute(
+                "SELECT source, labelId FROM LabelStats WHERE minDatetime < ?",
+                [cleared_before_micros],
+            ).fetchall()
+            if stale_keys:
+                earliest_time_bucket_ids = {
+                    (source, label_id): time_bucket_id
+                    for source, label_id, time_bucket_id in cursor.execute(
+                        "SELECT source, labelId, MIN(timeBucketId) FROM BucketStats GROUP BY source, labelId"
+                    )
+                }
+                values = []
+                for source, label_id in stale_keys:
+                    # The earliest entity is in the earliest time bucket still holding the label.
+                    cursor.execute(
+                        """SELECT +datetime FROM DataEntity
+                            WHERE timeBucketId = ? AND source = ? AND labelId = ?""",
+                        [earliest_time_bucket_ids[(source, label_id)], source, label_id],
+                    )
+                    values.append(
+                        [
+                            min(_to_epoch_micros(row[0]) for row in cursor),
+                            source,
+                            label_id,
+                        ]
+                    )
+                cursor.executemany(
+                    "UPDATE LabelStats SET minDatetime = ? WHERE source = ? AND labelId = ?",
+                    values,
+                )
+            connection.commit()
+
     def list_data_entity_buckets(self) -> List[DataEntityBucket]:
         """Lists all DataEntityBuckets for all the DataEntities that this MinerStorage is currently serving."""
 
-        with contextlib.closing(self._create_connection()) as connection:
+        with self.connection_pool.reader() as connection:
             cursor = connection.cursor()
             oldest_time_bucket_id = TimeBucket.from_datetime(
                 dt.datetime.now()
                 - dt.timedelta(constants.DATA_ENTITY_BUCKET_AGE_LIMIT_DAYS)
             ).id
-            # Get sum of content_size_bytes for all rows grouped by DataEntityBucket.
+            # Get the size of every DataEntityBucket from the incrementally maintained aggregates.
             cursor.execute(
-                """SELECT SUM(contentSizeBytes) AS bucketSize, timeBucketId, source, label FROM DataEntity
+                """SELECT totalBytes AS bucketSize, timeBucketId, source, label FROM BucketStats
+                        JOIN Label USING (labelId)
                         WHERE timeBucketId >= ?
-                        GROUP BY timeBucketId, source, label
                         ORDER BY bucketSize DESC
                         LIMIT ?
                         """,
@@ -0,0 +1,75 @@
+import sqlite3
+import uuid
+from typing import Optional
+
+STORAGE_METADATA_TABLE_CREATE = """CREATE TABLE IF NOT EXISTS MinerStorageMetadata (
+                            key                 TEXT            PRIMARY KEY,
+                            value               TEXT            NOT NULL
+                            )"""
+
+GENERATION_KEY = "generation"
+
+# How the DataEntity datetime column is stored for newly written rows.
+DATETIME_FORMAT_KEY = "datetimeFormat"
+# Text as written by the sqlite3 datetime adapter and parsed back by the timestamp converter.
+DATETIME_FORMAT_TEXT = "text"
+# Integer microseconds since epoch (UTC).
+DATETIME_FORMAT_EPOCH_MICROS = "epochMicros"
+# Set once every stored datetime is in the integer format. Until then rows may hold either format.
+DATETIME_MIGRATION_COMPLETE_KEY = "datetimeMigrationComplete"
+
+
+def get_storage_metadata(connection: sqlite3.Connection, key: str) -> Optional[str]:
+    """Returns the value stored for key, or None if it has never been set."""
+    table_exists = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'MinerStorageMetadata'"
+    ).fetchone()
+    if not table_exists:
+        return None
+
+    row = connection.execute(
+        "SELECT value FROM MinerStorageMetadata WHERE key = ?", [key]
+    ).fetchone()
+    return row[0] if row else None
+
+
+def set_storage_metadata(connection: sqlite3.Connection, key: str, value: str):
+    """Stores value for key. Callers are expected to commit."""
+    connection.execute(STORAGE_METADATA_TABLE_CREATE)
+    connection.execute(
+        "REPLACE INTO MinerStorageMetadata (key, value) VALUES (?, ?)", [key, value]
+    )
+
+
+def get_or_create_generation(connection: sqlite3.Connection) -> str:
+    """Returns the generation marker of the database, creating it if necessary.
+
+    The marker is random per database, so a snapshot is never served for a database that was recreated or replaced.
+    Callers are expected to commit.
+    """
+    generation = get_storage_metadata(connection, GENERATION_KEY)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        set_storage_metadata(connection, GENERATION_KEY, generation)
+    return generation
+
+
+def get_datetime_format(connection: sqlite3.Connection) -> str:
+    """Returns how the DataEntity datetime column is stored, defaulting to text for databases that predate the option."""
+    return (
+        get_storage_metadata(connection, DATETIME_FORMAT_KEY) or DATETIME_FORMAT_TEXT
+    )
+
+
+def is_datetime_migration_complete(connection: sqlite3.Connection) -> bool:
+    """Returns whether every stored datetime is in the datetime format of the database.
+
+    Text and integer datetimes do not compare or parse alike, so scans that filter or parse the datetime column must
+    wait while a migration to integer timestamps is in progress.
+
+    Only reads the metadata, never DataEntity. Completion is recorded by SqliteMinerStorage.migrate_integer_timestamps,
+    so databases whose migration finished before that was recorded report it once the migration is run again.
+    """
+    if get_datetime_format(connection) != DATETIME_FORMAT_EPOCH_MICROS:
+        return True
+    return get_storage_metadata(connection, DATETIME_MIGRATION_COMPLETE_KEY) is not None
@@ -0,0 +1,498 @@
+import dataclasses
+import datetime as dt
+import os
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Set, Tuple
+
+import bittensor as bt
+import numpy as np
+
+from common import constants, utils
+from common.data import CompressedMinerIndex, DataSource, HuggingFaceMetadata
+from common.data_v2 import ScorableDataEntityBucket, ScorableMinerIndex
+from storage.validator.sqlite_memory_validator_storage import AutoIncrementDict
+from storage.validator.validator_storage import ValidatorStorage
+
+
+# Each bucket is packed into a single int64 key: source in the top 8 bits, labelId in the next 32 and timeBucketId in
+# the low 24. Sorting by key therefore sorts by (source, labelId, timeBucketId).
+_SOURCE_SHIFT = 56
+_LABEL_ID_SHIFT = 24
+_LABEL_ID_MASK = (1 << 32) - 1
+_TIME_BUCKET_ID_MASK = (1 << _LABEL_ID_SHIFT) - 1
+# Sources must leave the sign bit clear, so keys sort in the same order as their parts.
+_SOURCE_LIMIT = 1 << (63 - _SOURCE_SHIFT)
+
+# Credibility weighted sizes are kept as fixed point integers, so removing a miner's contribution from the per bucket
+# totals exactly undoes adding it, no matter how many upserts happen in between. The part of each credibility below
+# the fixed point precision is summed separately as a float, as SqliteMemoryValidatorStorage does with the same scale.
+# Sizes are clamped to DATA_ENTITY_BUCKET_SIZE_LIMIT_BYTES, so each scaled size fits in 51 bits and totals across
+# thousands of miners cannot overflow.
+_CREDIBILITY_SCALE = 1 << 24
+
+
+def _split_credibility(credibility: float) -> Tuple[int, float]:
+    """Splits a credibility into its fixed point part, in units of 1 / _CREDIBILITY_SCALE, and the rest."""
+    scaled_credibility = round(credibility * _CREDIBILITY_SCALE)
+    return scaled_credibility, credibility - scaled_credibility / _CREDIBILITY_SCALE
+
+
+def _adjusted_sizes(sizes: np.ndarray, credibility: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the fixed point credibility weighted sizes of a miner's buckets and the remainders they leave out."""
+    scaled_credibility, credibility_remainder = _split_credibility(credibility)
+    return sizes * scaled_credibility, sizes * credibility_remainder
+
+
+@dataclasses.dataclass
+class _MinerBuckets:
+    """The index of a single miner, as columns sorted by bucket key."""
+
+    keys: np.ndarray
+    sizes: np.ndarray
+    credibility: float
+    last_updated: dt.datetime
+
+
+class NumpyValidatorStorage(ValidatorStorage):
+    """In-memory Validator Storage that keeps each miner's index as sorted NumPy columns.
+
+    Alongside the per miner columns it keeps, for every bucket any miner claims, the credibility weighted total size
+    across all miners. Reading a scored index is then a vectorized lookup of the miner's keys in those totals, rather
+    than a join re-aggregating the bucket across every miner.
+
+    Supports the same HuggingFace metadata and snapshot methods as SqliteMemoryValidatorStorage, although snapshots of
+    one can not be loaded by the other. Unlike it, upserts always replace the whole index and are not counted.
+    """
+
+    # Bumped whenever the snapshot layout changes, so snapshots written by other versions are ignored.
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self):
+        # Lock to avoid concurrency issues on interacting with the columns. Guards everything below.
+        self.lock = threading.RLock()
+        self.label_dict = AutoIncrementDict()
+        self.miners: Dict[str, _MinerBuckets] = {}
+
+        # Sorted keys of every bucket claimed by at least one miner, with the total fixed point credibility weighted
+        # size, the total remainder left out of it and the number of miners claiming it.
+        self.bucket_keys = np.empty(0, dtype=np.int64)
+        self.bucket_totals = np.empty(0, dtype=np.int64)
+        self.bucket_remainders = np.empty(0, dtype=np.float64)
+        self.bucket_miner_counts = np.empty(0, dtype=np.int32)
+
+        # HuggingFace metadata of each miner by repo name.
+        self.hf_metadata: Dict[str, Dict[str, HuggingFaceMetadata]] = {}
+
+    def _label_value_parse_str(self, label: Optional[str]) -> str:
+        """Parses the value to store out of an Optional label string."""
+        return "NULL" if (label is None) else label.casefold()
+
+    def _to_columns(self, index: CompressedMinerIndex) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the bucket keys, sorted and deduplicated, and sizes of a miner index."""
+        key_parts = []
+        size_parts = []
+        for source, compressed_buckets in index.sources.items():
+            if not 0 <= int(source) < _SOURCE_LIMIT:
+                continue
+            for compressed_bucket in compressed_buckets:
+                # Pair each time bucket with its size, dropping unpaired entries as the SQLite storage does.
+                count = min(
+                    len(compressed_bucket.time_bucket_ids),
+                    len(compressed_bucket.sizes_bytes),
+                )
+                try:
+                    label_id = self.label_dict.get_or_insert(
+                        self._label_value_parse_str(compressed_bucket.label)
+                    )
+                    time_bucket_ids = np.asarray(
+                        compressed_bucket.time_bucket_ids[:count], dtype=np.int64
+                    )
+                    sizes = np.asarray(
+                        compressed_bucket.sizes_bytes[:count], dtype=np.int64
+                    )
+                except:
+                    # In the case that we fail to get a label (due to unsupported characters) or a value does not fit
+                    # in an int64 we drop just that one bucket.
+                    continue
+                # Time bucket ids outside of their bits would corrupt the source and label of the key.
+                valid = (time_bucket_ids >= 0) & (time_bucket_ids <= _TIME_BUCKET_ID_MASK)
+                prefix = (int(source) << _SOURCE_SHIFT) | (label_id << _LABEL_ID_SHIFT)
+                key_parts.append(time_bucket_ids[valid] | prefix)
+                # No bucket can be larger than the limit, and larger sizes would overflow the totals shared by all miners.
+                size_parts.append(
+                    np.clip(sizes[valid], 0, constants.DATA_ENTITY_BUCKET_SIZE_LIMIT_BYTES)
+                )
+
+        if not key_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        # Keep the first occurrence of duplicate buckets, as the SQLite storage does.
+        keys, first_indexes = np.unique(np.concatenate(key_parts), return_index=True)
+        return keys, np.concatenate(size_parts)[first_indexes]
+
+    def _remove_from_totals(self, miner: _MinerBuckets):
+        adjusted_sizes, remainders = _adjusted_sizes(miner.sizes, miner.credibility)
+        positions = np.searchsorted(self.bucket_keys, miner.keys)
+        self.bucket_totals[positions] -= adjusted_sizes
+        self.bucket_remainders[positions] -= remainders
+        self.bucket_miner_counts[positions] -= 1
+
+    def _add_to_totals(self, miner: _MinerBuckets):
+        adjusted_sizes, remainders = _adjusted_sizes(miner.sizes, miner.credibility)
+        positions = np.searchsorted(self.bucket_keys, miner.keys)
+        found = positions < len(self.bucket_keys)
+        found[found] = self.bucket_keys[positions[found]] == miner.keys[found]
+
+        self.bucket_totals[positions[found]] += adjusted_sizes[found]
+        self.bucket_remainders[positions[found]] += remainders[found]
+        self.bucket_miner_counts[positions[found]] += 1
+
+        # Buckets no other miner claims are inserted in order. Their positions refer to the arrays before insertion.
+        missing = ~found
+        if missing.any():
+            self.bucket_keys = np.insert(
+                self.bucket_keys, positions[missing], miner.keys[missing]
+            )
+            self.bucket_totals = np.insert(
+                self.bucket_totals, positions[missing], adjusted_sizes[missing]
+            )
+            self.bucket_remainders = np.insert(
+                self.bucket_remainders, positions[missing], remainders[missing]
+            )
+            self.bucket_miner_counts = np.insert(
+                self.bucket_miner_counts, positions[missing], 1
+            )
+
+    def _drop_unclaimed_buckets(self):
+        claimed = self.bucket_miner_counts > 0
+        if not claimed.all():
+            self.bucket_keys = self.bucket_keys[claimed]
+            self.bucket_totals = self.bucket_totals[claimed]
+            self.bucket_remainders = self.bucket_remainders[claimed]
+            self.bucket_miner_counts = self.bucket_miner_counts[claimed]
+
+    def upsert_compressed_miner_index(
+        self, index: CompressedMinerIndex, hotkey: str, credibility: float
+    ):
+        """Stores the index for all of the data that a specific miner promises to provide."""
+
+        bt.logging.trace(
+            f"{hotkey}: Upserting miner index with {CompressedMinerIndex.bucket_count(index)} buckets"
+        )
+
+        with self.lock:
+            keys, sizes = self._to_columns(index)
+            miner = _MinerBuckets(
+                keys=keys,
+                sizes=sizes,
+                credibility=credibility,
+                last_updated=dt.datetime.utcnow(),
+            )
+
+            previous = self.miners.get(hotkey)
+            if previous is not None:
+                self._remove_from_totals(previous)
+            self._add_to_totals(miner)
+            self._drop_unclaimed_buckets()
+            self.miners[hotkey] = miner
+
+    def read_miner_index(self, miner_hotkey: str) -> Optional[ScorableMinerIndex]:
+        """Gets a scored index for all of the data that a specific miner promises to provide."""
+
+        with self.lock:
+            miner = self.miners.get(miner_hotkey)
+            if miner is None:
+                return None
+
+            # Evaluated in the same order as the SqliteMemoryValidatorStorage query, so both backends agree.
+            positions = np.searchsorted(self.bucket_keys, miner.keys)
+            totals = (
+                self.bucket_totals[positions].astype(np.float64) * (1 / _CREDIBILITY_SCALE)
+                + self.bucket_remainders[positions]
+            )
+            # A bucket only claimed by miners without credibility has no scorable bytes.
+            scorable_bytes = np.divide(
+                miner.sizes * (miner.sizes * miner.credibility),
+                totals,
+                out=np.zeros(len(totals)),
+                where=totals != 0,
+            ).astype(np.int64)
+
+            sources = (miner.keys >> _SOURCE_SHIFT).tolist()
+            label_ids = ((miner.keys >> _LABEL_ID_SHIFT) & _LABEL_ID_MASK).tolist()
+            time_bucket_ids = (miner.keys & _TIME_BUCKET_ID_MASK).tolist()
+            labels = [self.label_dict.get_by_id(label_id) for label_id in label_ids]
+
+            return ScorableMinerIndex(
+                scorable_data_entity_buckets=[
+                    ScorableDataEntityBucket(
+                        time_bucket_id=time_bucket_id,
+                        source=source,
+                        label=label if label != "NULL" else None,
+                        size_bytes=size_bytes,
+                        scorable_bytes=scorable,
+                    )
+                    for source, label, time_bucket_id, size_bytes, scorable in zip(
+                        sources,
+                        labels,
+                        time_bucket_ids,
+                        miner.sizes.tolist(),
+                        scorable_bytes.tolist(),
+                    )
+                ],
+                last_updated=miner.last_updated,
+            )
+
+    def delete_miner(self, hotkey: str):
+        """Removes the index and miner details for the specified miner."""
+        with self.lock:
+            miner = self.miners.pop(hotkey, None)
+            self.hf_metadata.pop(hotkey, None)
+            if miner is not None:
+                self._remove_from_totals(miner)
+                self._drop_unclaimed_buckets()
+
+    def read_miner_last_updated(self, miner_hotkey: str) -> Optional[dt.datetime]:
+        """Gets when a specific miner was last updated."""
+        with self.lock:
+            miner = self.miners.get(miner_hotkey)
+            return miner.last_updated if miner is not None else None
+
+    def get_memory_usage_bytes(self) -> int:
+        """Returns the bytes held by the miner columns and the per bucket totals."""
+        with self.lock:
+            return (
+                sum(miner.keys.nbytes + miner.sizes.nbytes for miner in self.miners.values())
+                + self.bucket_keys.nbytes
+                + self.bucket_totals.nbytes
+                + self.bucket_remainders.nbytes
+                + self.bucket_miner_counts.nbytes
+            )
+
+    def save_snapshot(self, path: str):
+        """Atomically replaces the snapshot of every miner index at path.
+
+        Storage operations are only blocked while the miners are listed, not while the snapshot is written.
+        """
+        start = time.perf_counter()
+        # Miner columns are never modified in place, so the listed miners stay consistent after releasing the lock.
+        with self.lock:
+            hotkeys = list(self.miners)
+            miners = [self.miners[hotkey] for hotkey in hotkeys]
+            labels = list(self.label_dict.items)
+            hf_metadata = [
+                (hotkey, metadata)
+                for hotkey, metadatas in self.hf_metadata.items()
+                for metadata in metadatas.values()
+            ]
+
+        arrays = {
+            "version": np.array(NumpyValidatorStorage.SNAPSHOT_VERSION),
+            "saved_at": np.array(
+                utils.datetime_to_epoch_micros(dt.datetime.now(tz=dt.timezone.utc))
+            ),
+            # Freed label ids are kept as empty strings so every other label keeps its id.
+            "labels": np.array([label or "" for label in labels], dtype=np.str_),
+            "label_is_free": np.array([label is None for label in labels], dtype=bool),
+            "hotkeys": np.array(hotkeys, dtype=np.str_),
+            "credibilities": np.array(
+                [miner.credibility for miner in miners], dtype=np.float64
+            ),
+            "last_updated": np.array(
+                [
+                    utils.datetime_to_epoch_micros(
+                        miner.last_updated.replace(tzinfo=dt.timezone.utc)
+                    )
+                    for miner in miners
+                ],
+                dtype=np.int64,
+            ),
+            "bucket_counts": np.array([len(miner.keys) for miner in miners], dtype=np.int64),
+            "keys": np.concatenate([miner.keys for miner in miners] or [np.empty(0, np.int64)]),
+            "sizes": np.concatenate([miner.sizes for miner in miners] or [np.empty(0, np.int64)]),
+            "hf_hotkeys": np.array([hotkey for hotkey, _ in hf_metadata], dtype=np.str_),
+            "hf_repo_names": np.array(
+                [metadata.repo_name for _, metadata in hf_metadata], dtype=np.str_
+            ),
+            "hf_sources": np.array(
+                [int(metadata.source) for _, metadata in hf_metadata], dtype=np.int64
+            ),
+            "hf_updated_at": np.array(
+                [
+                    utils.datetime_to_epoch_micros(
+                        metadata.updated_at
+                        if metadata.updated_at.tzinfo is not None
+                        else metadata.updated_at.replace(tzinfo=dt.timezone.utc)
+                    )
+                    for _, metadata in hf_metadata
+                ],
+                dtype=np.int64,
+            ),
+        }
+
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(temp_path, path)
+
+        bt.logging.debug(
+            f"Saved validator index snapshot to {path} in {time.perf_counter() - start:.2f}s."
+        )
+
+    def load_snapshot(
+        self,
+        path: str,
+        max_miner_age: dt.timedelta,
+        hotkeys: Optional[Set[str]] = None,
+    ) -> int:
+        """Replaces the contents of this storage with the snapshot at path.
+
+        Miners last updated longer than max_miner_age ago, or not in hotkeys when provided, are not restored. Restored
+        miners keep when they were last updated, so they are only re-queried once due.
+
+        Returns:
+            int: The number of miners restored. 0 if the snapshot is missing, unreadable or from another version.
+        """
+        if not os.path.exists(path):
+            return 0
+
+        start = time.perf_counter()
+        oldest_micros = utils.datetime_to_epoch_micros(
+            dt.datetime.now(tz=dt.timezone.utc) - max_miner_age
+        )
+        try:
+            with np.load(path, allow_pickle=False) as snapshot:
+                if int(snapshot["version"]) != NumpyValidatorStorage.SNAPSHOT_VERSION:
+                    bt.logging.info(
+                        f"Ignoring validator index snapshot {path} written by another version."
+                    )
+                    return 0
+                labels = [
+                    None if is_free else label
+                    for label, is_free in zip(
+                        snapshot["labels"].tolist(), snapshot["label_is_free"].tolist()
+                    )
+                ]
+                offsets = np.concatenate([[0], np.cumsum(snapshot["bucket_counts"])])
+                keys = snapshot["keys"]
+                sizes = snapshot["sizes"]
+                miners = {}
+                for i, (hotkey, credibility, last_updated) in enumerate(
+                    zip(
+                        snapshot["hotkeys"].tolist(),
+                        snapshot["credibilities"].tolist(),
+                        snapshot["last_updated"].tolist(),
+                    )
+                ):
+                    # Drop the miners whose indexes are too stale to be used for scoring.
+                    if last_updated < oldest_micros or (
+                        hotkeys is not None and hotkey not in hotkeys
+                    ):
+                        continue
+                    miners[hotkey] = _MinerBuckets(
+                        keys=keys[offsets[i] : offsets[i + 1]],
+                        sizes=sizes[offsets[i] : offsets[i + 1]],
+                        credibility=credibility,
+                        last_updated=utils.datetime_from_epoch_micros(last_updated).replace(
+                            tzinfo=None
+                        ),
+                    )
+                hf_metadata: Dict[str, Dict[str, HuggingFaceMetadata]] = {}
+                for hotkey, repo_name, source, updated_at in zip(
+                    snapshot["hf_hotkeys"].tolist(),
+                    snapshot["hf_repo_names"].tolist(),
+                    snapshot["hf_sources"].tolist(),
+                    snapshot["hf_updated_at"].tolist(),
+                ):
+                    if hotkey in miners:
+                        hf_metadata.setdefault(hotkey, {})[repo_name] = HuggingFaceMetadata(
+                            repo_name=repo_name,
+                            source=DataSource(source),
+                            updated_at=utils.datetime_from_epoch_micros(updated_at),
+                        )
+                saved_at = int(snapshot["saved_at"])
+        except (OSError, ValueError, KeyError):
+            bt.logging.warning(
+                f"Failed to load validator index snapshot {path}: {traceback.format_exc()}"
+            )
+            return 0
+
+        with self.lock:
+            self.label_dict.load(labels)
+            self.miners = miners
+            self.hf_metadata = hf_metadata
+            self._rebuild_totals()
+
+        snapshot_age = dt.datetime.now(
+            tz=dt.timezone.utc
+        ) - utils.datetime_from_epoch_micros(saved_at)
+        bt.logging.success(
+            f"Restored {len(miners)} miner indexes from {path} in {time.perf_counter() - start:.2f}s. "
+            + f"The snapshot is {snapshot_age} old."
+        )
+        return len(miners)
+
+    def _rebuild_totals(self):
+        """Recomputes the per bucket totals from every miner's columns."""
+        if not self.miners:
+            self.bucket_keys = np.empty(0, dtype=np.int64)
+            self.bucket_totals = np.empty(0, dtype=np.int64)
+            self.bucket_remainders = np.empty(0, dtype=np.float64)
+            self.bucket_miner_counts = np.empty(0, dtype=np.int32)
+            return
+
+        self.bucket_keys, positions = np.unique(
+            np.concatenate([miner.keys for miner in self.miners.values()]),
+            return_inverse=True,
+        )
+        adjusted_sizes, remainders = zip(
+            *(
+                _adjusted_sizes(miner.sizes, miner.credibility)
+                for miner in self.miners.values()
+            )
+        )
+        self.bucket_totals = np.zeros(len(self.bucket_keys), dtype=np.int64)
+        np.add.at(self.bucket_totals, positions, np.concatenate(adjusted_sizes))
+        self.bucket_remainders = np.zeros(len(self.bucket_keys), dtype=np.float64)
+        np.add.at(self.bucket_remainders, positions, np.concatenate(remainders))
+        self.bucket_miner_counts = np.bincount(
+            positions, minlength=len(self.bucket_keys)
+        ).astype(np.int32)
+
+    # Hugging face functionality
+    def upsert_hf_metadata(self, hotkey: str, metadata: List[HuggingFaceMetadata]):
+        """Stores or updates the HuggingFace metadata for a specific miner."""
+        bt.logging.trace(f"{hotkey}: Upserting HuggingFace metadata with {len(metadata)} entries")
+
+        with self.lock:
+            if hotkey not in self.miners:
+                bt.logging.warning(f"{hotkey}: Attempted to upsert HF metadata for non-existent miner")
+                return
+
+            metadatas = self.hf_metadata.setdefault(hotkey, {})
+            for entry in metadata:
+                metadatas[entry.repo_name] = HuggingFaceMetadata(
+                    repo_name=entry.repo_name,
+                    source=entry.source,
+                    updated_at=entry.updated_at,
+                )
+
+    def read_hf_metadata(self, miner_hotkey: str) -> List[HuggingFaceMetadata]:
+        """Gets the HuggingFace metadata for a specific miner."""
+        with self.lock:
+            return list(self.hf_metadata.get(miner_hotkey, {}).values())
+
+    def has_hf_metadata(self, miner_hotkey: str) -> bool:
+        """Checks if a specific miner has any HuggingFace metadata."""
+        with self.lock:
+            return bool(self.hf_metadata.get(miner_hotkey))
+
+    def read_hf_metadata_last_updated(self, miner_hotkey: str) -> Optional[dt.datetime]:
+        """Gets when a specific miner's HuggingFace metadata was last updated."""
+        with self.lock:
+            metadatas = self.hf_metadata.get(miner_hotkey)
+            if not metadatas:
+                return None
+            return max(metadata.updated_at for metadata in metadatas.values())
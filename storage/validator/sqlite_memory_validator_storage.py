@@ -1,9 +1,17 @@
+import array
 import contextlib
+import dataclasses
 import datetime as dt
+import hashlib
+import itertools
+import os
+import time
 import bittensor as bt
 import sqlite3
 import threading
+import traceback
 from typing import Any, Dict, Optional, Set, Tuple, List
+from common import utils
 from common.data import CompressedMinerIndex, DataLabel, HuggingFaceMetadata
 from common.data_v2 import ScorableDataEntityBucket, ScorableMinerIndex
 from storage.validator.validator_storage import ValidatorStorage
@@ -37,6 +45,12 @@ class AutoIncrementDict:
     def get_by_id(self, id: int) -> Any:
         return self.items[id]
 
+    def load(self, items: List[Any]):
+        """Replaces the contents with items, where the id of each key is its position and None marks a free id."""
+        self.items = list(items)
+        self.indexes = {key: key_id for key_id, key in enumerate(self.items) if key is not None}
+        self.available_ids = {key_id for key_id, key in enumerate(self.items) if key is None}
+
     def delete_key(self, key: Any):
         if key in self.indexes:
             key_id = self.indexes[key]
@@ -45,8 +59,53 @@ class AutoIncrementDict:
             self.available_ids.add(key_id)
 
 
+# Gives each storage its own in-memory database.
+_DATABASE_IDS = itertools.count()
+
+
+def _compressed_index_digest(index: CompressedMinerIndex) -> Optional[bytes]:
+    """Returns a digest of the buckets in a compressed index, in order, or None if it can not be computed."""
+    hasher = hashlib.blake2b(digest_size=16)
+    try:
+        for source, compressed_buckets in index.sources.items():
+            hasher.update(int(source).to_bytes(8, "little", signed=True))
+            for compressed_bucket in compressed_buckets:
+                label = (
+                    b""
+                    if compressed_bucket.label is None
+                    else b"\1" + compressed_bucket.label.encode("utf-8", "surrogatepass")
+                )
+                time_bucket_ids = array.array("q", compressed_bucket.time_bucket_ids)
+                sizes_bytes = array.array("q", compressed_bucket.sizes_bytes)
+                hasher.update(len(label).to_bytes(8, "little"))
+                hasher.update(label)
+                hasher.update(len(time_bucket_ids).to_bytes(8, "little"))
+                hasher.update(time_bucket_ids.tobytes())
+                hasher.update(len(sizes_bytes).to_bytes(8, "little"))
+                hasher.update(sizes_bytes.tobytes())
+    except (OverflowError, TypeError, ValueError):
+        return None
+    return hasher.digest()
+
+
+@dataclasses.dataclass
+class MinerIndexUpsertStats:
+    """Counters for how much of the stored miner indexes each upsert had to change."""
+
+    upserts: int = 0
+    # Upserts skipped because the index was identical to the one already stored.
+    unchanged_upserts: int = 0
+    rows_inserted: int = 0
+    rows_updated: int = 0
+    rows_deleted: int = 0
+
+
 # Use a timezone aware adapter for timestamp columns.
 def tz_aware_timestamp_adapter(val):
+    # Timestamps stored as microseconds since epoch are plain integers.
+    if val.isdigit():
+        return utils.datetime_from_epoch_micros(int(val))
+
     datepart, timepart = val.split(b" ")
     year, month, day = map(int, datepart.split(b"-"))
 
@@ -84,10 +143,11 @@ class SqliteMemoryValidatorStorage(ValidatorStorage):
     """Sqlite in-memory backed Validator Storage"""
 
     # Integer Primary Key = ROWID alias which is auto-increment when assigning NULL on insert.
+    # lastUpdated is stored as microseconds since epoch (UTC) to avoid parsing text on every read.
     MINER_TABLE_CREATE = """CREATE TABLE IF NOT EXISTS Miner (
                             minerId     INTEGER         PRIMARY KEY,
                             hotkey      VARCHAR(64)     NOT NULL,
-                            lastUpdated TIMESTAMP(6)    NOT NULL,
+                            lastUpdated INTEGER         NOT NULL,
                             credibility FLOAT           NOT NULL    DEFAULT 0.00,
                             UNIQUE(hotkey)
                             )"""
@@ -108,6 +168,42 @@ class SqliteMemoryValidatorStorage(ValidatorStorage):
     MINER_INDEX_TABLE_BUCKET_SIZE_INDEX = """CREATE INDEX IF NOT EXISTS bucket_size_index
                                              ON MinerIndex (source, labelId, timeBucketId, contentSizeBytes)"""
 
+    # Total credibility weighted size of every bucket claimed by at least one miner, kept up to date as indexes and
+    # credibilities change so that reading a miner index does not have to re-aggregate its buckets across every miner.
+    # Totals are fixed point integers (see CREDIBILITY_SCALE) so that removing a contribution exactly undoes adding it.
+    # The part of each credibility below the fixed point precision is summed separately, so the total still matches
+    # re-aggregating the bucket for miners with a low credibility.
+    BUCKET_TOTAL_TABLE_CREATE = """CREATE TABLE IF NOT EXISTS BucketTotal (
+                                    source                          TINYINT         NOT NULL,
+                                    labelId                         INTEGER         NOT NULL,
+                                    timeBucketId                    INTEGER         NOT NULL,
+                                    adjContentSizeBytes             INTEGER         NOT NULL,
+                                    adjContentSizeBytesRemainder    REAL            NOT NULL,
+                                    minerCount                      INTEGER         NOT NULL,
+                                    PRIMARY KEY(source, labelId, timeBucketId)
+                                    ) WITHOUT ROWID"""
+
+    # Bumped whenever the schema changes, so snapshots written by other versions are ignored.
+    SNAPSHOT_VERSION = 2
+
+    # Number of pages copied per step of a snapshot backup. Other operations may run between steps.
+    SNAPSHOT_BACKUP_STEP_PAGES = 1024
+
+    # Tables only present in snapshots: the labels behind each labelId and when the snapshot was taken.
+    SNAPSHOT_LABEL_TABLE_CREATE = """CREATE TABLE SnapshotLabel (
+                                    labelId     INTEGER         PRIMARY KEY,
+                                    label       TEXT
+                                    )"""
+
+    SNAPSHOT_INFO_TABLE_CREATE = """CREATE TABLE SnapshotInfo (
+                                    version     INTEGER         NOT NULL,
+                                    savedAt     INTEGER         NOT NULL
+                                    )"""
+
+    # Bucket totals weight sizes by credibilities rounded to multiples of 1 / CREDIBILITY_SCALE. The scaled size of a
+    # bucket of at most 128 MB fits in 51 bits.
+    CREDIBILITY_SCALE = 1 << 24
+
     HF_METADATA_TABLE_CREATE = """CREATE TABLE IF NOT EXISTS HFMetadata (
                                         minerId     INTEGER         NOT NULL,
                                         repo_name   TEXT            NOT NULL,
@@ -119,11 +215,26 @@ class SqliteMemoryValidatorStorage(ValidatorStorage):
     def __init__(self):
         sqlite3.register_converter("timestamp", tz_aware_timestamp_adapter)
 
-        self.continuous_connection_do_not_reuse = self._create_connection()
+        # A named shared-cache database lives as long as a connection to it is open and is private to this storage.
+        self.database_uri = (
+            f"file:validator_storage_{next(_DATABASE_IDS)}?mode=memory&cache=shared"
+        )
+
+        # Lock to avoid concurrency issues on interacting with the database. Guards the connection and miner_ids.
+        self.lock = threading.RLock()
+
+        # Long-lived connection used by every operation, so its prepared statements stay cached between calls.
+        self.connection = self._create_connection()
         self.label_dict = AutoIncrementDict()
 
-        with contextlib.closing(self._create_connection()) as connection:
-            cursor = connection.cursor()
+        # The minerId of every stored hotkey. Only this storage writes to its database, so this is always current.
+        self.miner_ids: Dict[str, int] = {}
+        # Digest of the compressed index last stored for each hotkey, to skip upserting an unchanged index.
+        self.index_digests: Dict[str, bytes] = {}
+        self.upsert_stats = MinerIndexUpsertStats()
+
+        with self.lock:
+            cursor = self.connection.cursor()
 
             # Create the Miner table (if it does not already exist).
             cursor.execute(SqliteMemoryValidatorStorage.MINER_TABLE_CREATE)
@@ -135,47 +246,133 @@ class SqliteMemoryValidatorStorage(ValidatorStorage):
                 SqliteMemoryValidatorStorage.MINER_INDEX_TABLE_BUCKET_SIZE_INDEX
             )
 
+            cursor.execute(SqliteMemoryValidatorStorage.BUCKET_TOTAL_TABLE_CREATE)
+
             cursor.execute(SqliteMemoryValidatorStorage.HF_METADATA_TABLE_CREATE)
-            # Lock to avoid concurrency issues on interacting with the database.
-            self.lock = threading.RLock()
 
     def _create_connection(self):
-        # Create the database if it doesn't exist, defaulting to the local directory.
+        # Create the database if it doesn't exist.
         # Use PARSE_DECLTYPES to convert accessed values into the appropriate type.
+        # The connection is shared by the evaluation threads, which only use it while holding the lock.
         connection = sqlite3.connect(
-            "file::memory:?cache=shared",
+            self.database_uri,
             uri=True,
             detect_types=sqlite3.PARSE_DECLTYPES,
             timeout=120.0,
+            check_same_thread=False,
         )
         # Avoid using a row_factory that would allow parsing results by column name for performance.
         # connection.row_factory = sqlite3.Row
         connection.isolation_level = None
         return connection
 
-    def _upsert_miner(self, hotkey: str, now_str: str, credibility: float) -> int:
-        miner_id = 0
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Runs the statements in the context as a single transaction, joining any transaction already open.
+
+        Must be called while holding the lock.
+        """
+        cursor = self.connection.cursor()
+        if self.connection.in_transaction:
+            yield cursor
+            return
+
+        cursor.execute("BEGIN")
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
+
+    def _add_to_bucket_totals(
+        self,
+        miner_id: int,
+        scaled_credibility: int,
+        credibility_remainder: float,
+        miner_count: int,
+    ):
+        """Adds the buckets of a miner, weighted by its split credibility, to the bucket totals.
+
+        Negative values remove them again. Must be called while holding the lock.
+        """
+        self.connection.execute(
+            """INSERT INTO BucketTotal (source, labelId, timeBucketId, adjContentSizeBytes, adjContentSizeBytesRemainder, minerCount)
+                SELECT source, labelId, timeBucketId, contentSizeBytes * ?, contentSizeBytes * ?, ?
+                FROM MinerIndex WHERE minerId = ?
+                ON CONFLICT (source, labelId, timeBucketId) DO UPDATE SET
+                    adjContentSizeBytes = adjContentSizeBytes + excluded.adjContentSizeBytes,
+                    adjContentSizeBytesRemainder = adjContentSizeBytesRemainder + excluded.adjContentSizeBytesRemainder,
+                    minerCount = minerCount + excluded.minerCount""",
+            [scaled_credibility, credibility_remainder, miner_count, miner_id],
+        )
+        if miner_count < 0:
+            self.connection.execute(
+                """DELETE FROM BucketTotal WHERE minerCount = 0 AND (source, labelId, timeBucketId) IN
+                    (SELECT source, labelId, timeBucketId FROM MinerIndex WHERE minerId = ?)""",
+                [miner_id],
+            )
 
-        with self.lock:
-            with contextlib.closing(self._create_connection()) as connection:
-                cursor = connection.cursor()
+    @staticmethod
+    def _split_credibility(credibility: float) -> Tuple[int, float]:
+        """Splits a credibility into its fixed point part, in units of 1 / CREDIBILITY_SCALE, and the rest."""
+        scaled_credibility = round(
+            credibility * SqliteMemoryValidatorStorage.CREDIBILITY_SCALE
+        )
+        return (
+            scaled_credibility,
+            credibility
+            - scaled_credibility / SqliteMemoryValidatorStorage.CREDIBILITY_SCALE,
+        )
+
+    def _read_credibility(self, miner_id: int) -> float:
+        return self.connection.execute(
+            "SELECT credibility FROM Miner WHERE minerId = ?", [miner_id]
+        ).fetchone()[0]
 
-                cursor.execute(
-                    "UPDATE OR IGNORE Miner SET lastUpdated=?, credibility=? WHERE hotkey=?",
-                    [now_str, credibility, hotkey],
+    def _upsert_miner(self, hotkey: str, now: dt.datetime, credibility: float) -> int:
+        miner_id = 0
+        # Naive datetimes are in UTC, matching what read_miner_last_updated returns.
+        if now.tzinfo is None:
+            now = now.replace(tzinfo=dt.timezone.utc)
+        now_micros = utils.datetime_to_epoch_micros(now)
+
+        with self.lock, self._transaction():
+            miner_id = self.miner_ids.get(hotkey)
+            if miner_id is not None:
+                # Reweight the buckets the miner already claims by its new credibility.
+                old_credibility = self._read_credibility(miner_id)
+                if credibility != old_credibility:
+                    scaled_credibility, credibility_remainder = self._split_credibility(
+                        credibility
+                    )
+                    old_scaled_credibility, old_credibility_remainder = (
+                        self._split_credibility(old_credibility)
+                    )
+                    self._add_to_bucket_totals(
+                        miner_id,
+                        scaled_credibility - old_scaled_credibility,
+                        credibility_remainder - old_credibility_remainder,
+                        0,
+                    )
+                self.connection.execute(
+                    "UPDATE Miner SET lastUpdated=?, credibility=? WHERE minerId=?",
+                    [now_micros, credibility, miner_id],
                 )
-                cursor.execute(
-                    """INSERT OR IGNORE INTO Miner (hotkey, lastUpdated, credibility) VALUES (?, ?, ?)""",
-                    [hotkey, now_str, credibility],
+            else:
+                cursor = self.connection.execute(
+                    "INSERT INTO Miner (hotkey, lastUpdated, credibility) VALUES (?, ?, ?)",
+                    [hotkey, now_micros, credibility],
                 )
-                connection.commit()
-
-                # Then we get the existing or newly created minerId
-                cursor.execute("SELECT minerId FROM Miner WHERE hotkey = ?", [hotkey])
-                miner_id = cursor.fetchone()[0]
+                miner_id = cursor.lastrowid
+                self.miner_ids[hotkey] = miner_id
 
         return miner_id
 
+    def _last_updated_from_micros(self, micros: int) -> dt.datetime:
+        """Converts a stored lastUpdated into the naive UTC datetime returned by the ValidatorStorage API."""
+        return utils.datetime_from_epoch_micros(micros).replace(tzinfo=None)
+
     def _label_value_parse(self, label: Optional[DataLabel]) -> str:
         """Parses the value to store in the database out of an Optional DataLabel."""
         return "NULL" if (label is None) else label.value
@@ -187,57 +384,292 @@ class SqliteMemoryValidatorStorage(ValidatorStorage):
     def upsert_compressed_miner_index(
         self, index: CompressedMinerIndex, hotkey: str, credibility: float
     ):
-        """Stores the index for all of the data that a specific miner promises to provide."""
+        """Stores the index for all of the data that a specific miner promises to provide.
+
+        Only the buckets that differ from the stored index are written.
+        """
 
         bt.logging.trace(
             f"{hotkey}: Upserting miner index with {CompressedMinerIndex.bucket_count(index)} buckets"
         )
 
-        now_str = dt.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
-
-        # Upsert this Validator's minerId for the specified hotkey.
-        miner_id = self._upsert_miner(hotkey, now_str, credibility)
-
-        # Parse every DataEntityBucket from the index into a list of values to insert.
-        values = []
+        now = dt.datetime.utcnow()
+        digest = _compressed_index_digest(index)
+        with self.lock:
+            if digest is not None and self.index_digests.get(hotkey) == digest:
+                # The buckets are unchanged, but the miner's credibility may not be.
+                self._upsert_miner(hotkey, now, credibility)
+                self.upsert_stats.upserts += 1
+                self.upsert_stats.unchanged_upserts += 1
+                bt.logging.debug(f"{hotkey}: Miner index unchanged since the last upsert.")
+                return
+
+        # Parse every DataEntityBucket from the index into the size of each bucket, keyed by (source, labelId,
+        # timeBucketId). The first of any duplicate buckets wins, to defend against a miner giving us duplicate rows.
+        sizes = {}
         for source, compressed_buckets in index.sources.items():
             for compressed_bucket in compressed_buckets:
+                try:
+                    label_id = self.label_dict.get_or_insert(
+                        self._label_value_parse_str(compressed_bucket.label)
+                    )
+                except:
+                    # In the case that we fail to get a label (due to unsupported characters) we drop just that one bucket.
+                    continue
                 for time_bucket_id, size_bytes in zip(
                     compressed_bucket.time_bucket_ids, compressed_bucket.sizes_bytes
                 ):
-                    try:
-                        values.append(
-                            [
-                                miner_id,
-                                int(source),
-                                self.label_dict.get_or_insert(
-                                    self._label_value_parse_str(compressed_bucket.label)
-                                ),
-                                time_bucket_id,
-                                size_bytes,
-                            ]
-                        )
-                    except:
-                        # In the case that we fail to get a label (due to unsupported characters) we drop just that one bucket.
-                        pass
+                    sizes.setdefault((int(source), label_id, time_bucket_id), size_bytes)
 
         with self.lock:
-            # Clear the previous keys for this miner.
-            self._delete_miner_index(hotkey)
-
-            with contextlib.closing(self._create_connection()) as connection:
-                cursor = connection.cursor()
-                # Insert the new keys. (Ignore into to defend against a miner giving us multiple duplicate rows.)
-                # Batch in groups of 1m if necessary to avoid congestion issues.
-                value_subsets = [
-                    values[x : x + 1_000_000] for x in range(0, len(values), 1_000_000)
-                ]
-                for value_subset in value_subsets:
-                    cursor.executemany(
-                        """INSERT OR IGNORE INTO MinerIndex (minerId, source, labelId, timeBucketId, contentSizeBytes) VALUES (?, ?, ?, ?, ?)""",
-                        value_subset,
+            is_new_miner = hotkey not in self.miner_ids
+            self.index_digests.pop(hotkey, None)
+            try:
+                with self._transaction():
+                    # Upsert this Validator's minerId for the specified hotkey. This also reweights the bucket totals
+                    # of the stored index if the miner's credibility changed.
+                    miner_id = self._upsert_miner(hotkey, now, credibility)
+                    inserted, updated, deleted = self._apply_miner_index_diff(
+                        miner_id, sizes
                     )
-                connection.commit()
+            except BaseException:
+                # The new miner row was rolled back along with the rest of the transaction.
+                if is_new_miner:
+                    self.miner_ids.pop(hotkey, None)
+                raise
+
+            if digest is not None:
+                self.index_digests[hotkey] = digest
+            self.upsert_stats.upserts += 1
+            self.upsert_stats.rows_inserted += inserted
+            self.upsert_stats.rows_updated += updated
+            self.upsert_stats.rows_deleted += deleted
+
+        bt.logging.debug(
+            f"{hotkey}: Upserted miner index of {len(sizes)} buckets. "
+            + f"Inserted {inserted}, updated {updated} and deleted {deleted} rows."
+        )
+
+    def _apply_miner_index_diff(
+        self, miner_id: int, sizes: Dict[Tuple[int, int, int], int]
+    ) -> Tuple[int, int, int]:
+        """Changes the stored index of a miner to the provided bucket sizes, along with the bucket totals.
+
+        Must be called while holding the lock, inside a transaction.
+
+        Returns:
+            Tuple[int, int, int]: The number of rows inserted, updated and deleted.
+        """
+        stored_sizes = {
+            (row[0], row[1], row[2]): row[3]
+            for row in self.connection.execute(
+                "SELECT source, labelId, timeBucketId, contentSizeBytes FROM MinerIndex WHERE minerId = ?",
+                [miner_id],
+            )
+        }
+
+        inserts = []
+        updates = []
+        for key, size_bytes in sizes.items():
+            stored_size_bytes = stored_sizes.pop(key, None)
+            if stored_size_bytes is None:
+                inserts.append((*key, size_bytes))
+            elif stored_size_bytes != size_bytes:
+                updates.append((*key, size_bytes, size_bytes - stored_size_bytes))
+        # Whatever is left is no longer in the index.
+        deletes = [(*key, size_bytes) for key, size_bytes in stored_sizes.items()]
+
+        cursor = self.connection.cursor()
+        cursor.executemany(
+            "DELETE FROM MinerIndex WHERE minerId = ? AND source = ? AND labelId = ? AND timeBucketId = ?",
+            ((miner_id, *delete[:3]) for delete in deletes),
+        )
+        cursor.executemany(
+            """UPDATE MinerIndex SET contentSizeBytes = ?
+                WHERE minerId = ? AND source = ? AND labelId = ? AND timeBucketId = ?""",
+            ((update[3], miner_id, *update[:3]) for update in updates),
+        )
+        cursor.executemany(
+            "INSERT INTO MinerIndex (minerId, source, labelId, timeBucketId, contentSizeBytes) VALUES (?, ?, ?, ?, ?)",
+            ((miner_id, *insert) for insert in inserts),
+        )
+
+        # Apply the same changes to the totals of the affected buckets.
+        scaled_credibility, credibility_remainder = self._split_credibility(
+            self._read_credibility(miner_id)
+        )
+        cursor.executemany(
+            """INSERT INTO BucketTotal (source, labelId, timeBucketId, adjContentSizeBytes, adjContentSizeBytesRemainder, minerCount)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (source, labelId, timeBucketId) DO UPDATE SET
+                    adjContentSizeBytes = adjContentSizeBytes + excluded.adjContentSizeBytes,
+                    adjContentSizeBytesRemainder = adjContentSizeBytesRemainder + excluded.adjContentSizeBytesRemainder,
+                    minerCount = minerCount + excluded.minerCount""",
+            itertools.chain(
+                (
+                    (*insert[:3], insert[3] * scaled_credibility, insert[3] * credibility_remainder, 1)
+                    for insert in inserts
+                ),
+                (
+                    (*update[:3], update[4] * scaled_credibility, update[4] * credibility_remainder, 0)
+                    for update in updates
+                ),
+                (
+                    (*delete[:3], -delete[3] * scaled_credibility, -delete[3] * credibility_remainder, -1)
+                    for delete in deletes
+                ),
+            ),
+        )
+        cursor.executemany(
+            """DELETE FROM BucketTotal
+                WHERE source = ? AND labelId = ? AND timeBucketId = ? AND minerCount = 0""",
+            (delete[:3] for delete in deletes),
+        )
+
+        return len(inserts), len(updates), len(deletes)
+
+    def get_upsert_stats(self) -> MinerIndexUpsertStats:
+        """Returns a snapshot of the miner index upsert counters."""
+        with self.lock:
+            return dataclasses.replace(self.upsert_stats)
+
+    def save_snapshot(self, path: str):
+        """Atomically replaces the snapshot of every miner index at path.
+
+        The database is copied in memory in steps of SNAPSHOT_BACKUP_STEP_PAGES pages and storage operations run
+        between steps. Their changes are made through the connection being backed up, so SQLite applies them to the copy
+        as well. Storage operations are never blocked while the copy is written to disk.
+        """
+        start = time.perf_counter()
+        staging = sqlite3.connect(":memory:")
+        try:
+            with self.lock:
+                self.connection.backup(
+                    staging,
+                    pages=SqliteMemoryValidatorStorage.SNAPSHOT_BACKUP_STEP_PAGES,
+                    progress=self._release_lock_between_backup_steps,
+                )
+                # The lock is held again after the last step, so any labelId stored in the copy is listed.
+                labels = list(self.label_dict.items)
+            copy_seconds = time.perf_counter() - start
+
+            staging.execute(SqliteMemoryValidatorStorage.SNAPSHOT_LABEL_TABLE_CREATE)
+            staging.executemany(
+                "INSERT INTO SnapshotLabel (labelId, label) VALUES (?, ?)",
+                enumerate(labels),
+            )
+            staging.execute(SqliteMemoryValidatorStorage.SNAPSHOT_INFO_TABLE_CREATE)
+            staging.execute(
+                "INSERT INTO SnapshotInfo (version, savedAt) VALUES (?, ?)",
+                [
+                    SqliteMemoryValidatorStorage.SNAPSHOT_VERSION,
+                    utils.datetime_to_epoch_micros(dt.datetime.now(tz=dt.timezone.utc)),
+                ],
+            )
+            staging.commit()
+
+            temp_path = path + ".tmp"
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            with contextlib.closing(sqlite3.connect(temp_path)) as target:
+                staging.backup(target)
+            os.replace(temp_path, path)
+        finally:
+            staging.close()
+
+        bt.logging.debug(
+            f"Saved validator index snapshot to {path} in {time.perf_counter() - start:.2f}s, "
+            + f"copying it in memory for {copy_seconds:.2f}s."
+        )
+
+    def _release_lock_between_backup_steps(self, status: int, remaining: int, total: int):
+        """Lets waiting storage operations run between the steps of a snapshot backup."""
+        self.lock.release()
+        try:
+            # Yield to the threads waiting on the lock.
+            time.sleep(0)
+        finally:
+            self.lock.acquire()
+
+    def load_snapshot(
+        self,
+        path: str,
+        max_miner_age: dt.timedelta,
+        hotkeys: Optional[Set[str]] = None,
+    ) -> int:
+        """Replaces the contents of this storage with the snapshot at path.
+
+        Miners last updated longer than max_miner_age ago, or not in hotkeys when provided, are not restored. Restored
+        miners keep when they were last updated, so they are only re-queried once due.
+
+        Returns:
+            int: The number of miners restored. 0 if the snapshot is missing, unreadable or from another version.
+        """
+        if not os.path.exists(path):
+            return 0
+
+        start = time.perf_counter()
+        try:
+            with contextlib.closing(sqlite3.connect(path)) as source:
+                version, saved_at = source.execute(
+                    "SELECT version, savedAt FROM SnapshotInfo"
+                ).fetchone()
+                if version != SqliteMemoryValidatorStorage.SNAPSHOT_VERSION:
+                    bt.logging.info(
+                        f"Ignoring validator index snapshot {path} written by another version."
+                    )
+                    return 0
+                labels = [None] * source.execute(
+                    "SELECT COALESCE(MAX(labelId) + 1, 0) FROM SnapshotLabel"
+                ).fetchone()[0]
+                for label_id, label in source.execute(
+                    "SELECT labelId, label FROM SnapshotLabel"
+                ):
+                    labels[label_id] = label
+
+                with self.lock:
+                    source.backup(self.connection)
+                    self.connection.execute("DROP TABLE SnapshotLabel")
+                    self.connection.execute("DROP TABLE SnapshotInfo")
+                    self.label_dict.load(labels)
+                    self.miner_ids = {
+                        hotkey: miner_id
+                        for miner_id, hotkey in self.connection.execute(
+                            "SELECT minerId, hotkey FROM Miner"
+                        )
+                    }
+                    self.index_digests = {}
+        except (sqlite3.Error, TypeError, IndexError):
+            bt.logging.warning(
+                f"Failed to load validator index snapshot {path}: {traceback.format_exc()}"
+            )
+            return 0
+
+        # Drop the miners whose indexes are too stale to be used for scoring.
+        oldest_micros = utils.datetime_to_epoch_micros(
+            dt.datetime.now(tz=dt.timezone.utc) - max_miner_age
+        )
+        with self.lock:
+            stale_hotkeys = [
+                hotkey
+                for (hotkey,) in self.connection.execute(
+                    "SELECT hotkey FROM Miner WHERE lastUpdated < ?", [oldest_micros]
+                )
+            ]
+            if hotkeys is not None:
+                stale_hotkeys.extend(set(self.miner_ids) - set(hotkeys))
+            for hotkey in set(stale_hotkeys):
+                self.delete_miner(hotkey)
+            restored = len(self.miner_ids)
+
+        snapshot_age = dt.datetime.now(
+            tz=dt.timezone.utc
+        ) - utils.datetime_from_epoch_micros(saved_at)
+        bt.logging.success(
+            f"Restored {restored} miner indexes from {path} in {time.perf_counter() - start:.2f}s. "
+            + f"The snapshot is {snapshot_age} old and {len(set(stale_hotkeys))} stale miners were dropped."
+        )
+        return restored
 
     def read_miner_index(
         self,
@@ -246,106 +678,100 @@ class SqliteMemoryValidatorStorage(ValidatorStorage):
         """Gets a scored index for all of the data that a specific miner promises to provide."""
 
         with self.lock:
-            with contextlib.closing(self._create_connection()) as connection:
-                cursor = connection.cursor()
-                cursor.execute(
-                    "SELECT minerId, lastUpdated, credibility from Miner WHERE hotkey = ?",
-                    [miner_hotkey],
-                )
-                result = cursor.fetchone()
-                if result is None:
-                    return None
-
-                miner_id = result[0]
-                last_updated = result[1]
-                miner_credibility = result[2]
-
-                # Get all the DataEntityBuckets for this miner joined to the total content size of like buckets.
-                sql_string = """WITH
-                                TempBuckets AS (
-                                    SELECT source, labelId, timeBucketId
-                                    FROM MinerIndex
-                                    WHERE MinerId = ?
-                                ),
-                                TempAgg AS (
-                                    SELECT source, labelId, timeBucketId,
-                                    SUM(contentSizeBytes * credibility) as totalAdjContentSizeBytes
-                                    FROM MinerIndex
-                                    INNER JOIN TempBuckets USING (source, labelId, timeBucketId)
-                                    JOIN Miner USING (minerId)
-                                    GROUP BY source, labelId, timeBucketId
-                                )
-                                SELECT source, labelId, timeBucketId, contentSizeBytes,
-                                    (contentSizeBytes * (contentSizeBytes * ?) / TempAgg.totalAdjContentSizeBytes) as scorableBytes
-                                FROM MinerIndex
-                                LEFT JOIN TempAgg USING (source, labelId, timeBucketId)
-                                WHERE minerId = ?"""
-
-                cursor.execute(sql_string, [miner_id, miner_credibility, miner_id])
-
-                # Create to a list to hold each of the ScorableDataEntityBuckets we generate for this miner.
-                scored_data_entity_buckets = []
-
-                # For each row (representing a DataEntityBucket and Uniqueness) turn it into a ScorableDataEntityBucket.
-                for row in cursor:
-                    label_value = self.label_dict.get_by_id(row[1])
-
-                    # Add the bucket to the list of scored buckets on the overall index.
-                    scored_data_entity_buckets.append(
-                        ScorableDataEntityBucket(
-                            time_bucket_id=int(row[2]),
-                            source=int(row[0]),
-                            label=label_value if label_value != "NULL" else None,
-                            size_bytes=int(row[3] if row[3] else 0),
-                            scorable_bytes=int(row[4] if row[4] else 0),
-                        )
-                    )
+            miner_id = self.miner_ids.get(miner_hotkey)
+            if miner_id is None:
+                return None
+
+            cursor = self.connection.cursor()
+            cursor.execute(
+                "SELECT lastUpdated, credibility from Miner WHERE minerId = ?",
+                [miner_id],
+            )
+            result = cursor.fetchone()
+            last_updated = self._last_updated_from_micros(result[0])
+            miner_credibility = result[1]
+
+            # Get all the DataEntityBuckets for this miner joined to the total content size of like buckets.
+            sql_string = """SELECT source, labelId, timeBucketId, contentSizeBytes,
+                                (contentSizeBytes * (contentSizeBytes * ?) / (adjContentSizeBytes * ? + adjContentSizeBytesRemainder)) as scorableBytes
+                            FROM MinerIndex
+                            LEFT JOIN BucketTotal USING (source, labelId, timeBucketId)
+                            WHERE minerId = ?"""
+
+            cursor.execute(
+                sql_string,
+                [
+                    miner_credibility,
+                    1 / SqliteMemoryValidatorStorage.CREDIBILITY_SCALE,
+                    miner_id,
+                ],
+            )
 
-                scored_index = ScorableMinerIndex(
-                    scorable_data_entity_buckets=scored_data_entity_buckets,
-                    last_updated=last_updated,
+            # Create to a list to hold each of the ScorableDataEntityBuckets we generate for this miner.
+            scored_data_entity_buckets = []
+
+            # For each row (representing a DataEntityBucket and Uniqueness) turn it into a ScorableDataEntityBucket.
+            for row in cursor:
+                label_value = self.label_dict.get_by_id(row[1])
+
+                # Add the bucket to the list of scored buckets on the overall index.
+                scored_data_entity_buckets.append(
+                    ScorableDataEntityBucket(
+                        time_bucket_id=int(row[2]),
+                        source=int(row[0]),
+                        label=label_value if label_value != "NULL" else None,
+                        size_bytes=int(row[3] if row[3] else 0),
+                        scorable_bytes=int(row[4] if row[4] else 0),
+                    )
                 )
 
-                return scored_index
+            scored_index = ScorableMinerIndex(
+                scorable_data_entity_buckets=scored_data_entity_buckets,
+                last_updated=last_updated,
+            )
+
+            return scored_index
 
     def _delete_miner_index(self, miner_hotkey: str):
-        """Removes the index for the specified miner."""
+        """Removes the index for the specified miner. Must be called while holding the lock."""
 
         bt.logging.trace(f"{miner_hotkey}: Deleting miner index")
 
-        with contextlib.closing(self._create_connection()) as connection:
-            cursor = connection.cursor()
-
-            cursor.execute("SELECT minerId FROM Miner WHERE hotkey = ?", [miner_hotkey])
-
-            # Delete the rows for the specified miner.
-            result = cursor.fetchone()
-            if result is not None:
-                cursor.execute("DELETE FROM MinerIndex WHERE minerId = ?", [result[0]])
-                connection.commit()
+        miner_id = self.miner_ids.get(miner_hotkey)
+        if miner_id is not None:
+            scaled_credibility, credibility_remainder = self._split_credibility(
+                self._read_credibility(miner_id)
+            )
+            self._add_to_bucket_totals(
+                miner_id, -scaled_credibility, -credibility_remainder, -1
+            )
+            self.connection.execute("DELETE FROM MinerIndex WHERE minerId = ?", [miner_id])
 
     def delete_miner(self, hotkey: str):
         """Removes the index and miner details for the specified miner."""
         with self.lock:
-            self._delete_miner_index(hotkey)
-            self._delete_hf_metadata(hotkey)
-            with contextlib.closing(self._create_connection()) as connection:
-                cursor = connection.cursor()
-                cursor.execute("DELETE FROM Miner WHERE hotkey = ?", [hotkey])
+            miner_id = self.miner_ids.get(hotkey)
+            if miner_id is None:
+                return
+
+            with self._transaction() as cursor:
+                self._delete_miner_index(hotkey)
+                self._delete_hf_metadata(hotkey)
+                cursor.execute("DELETE FROM Miner WHERE minerId = ?", [miner_id])
+            del self.miner_ids[hotkey]
+            self.index_digests.pop(hotkey, None)
 
     def read_miner_last_updated(self, miner_hotkey: str) -> Optional[dt.datetime]:
         """Gets when a specific miner was last updated."""
         with self.lock:
-            with contextlib.closing(self._create_connection()) as connection:
-                cursor = connection.cursor()
-                cursor.execute(
-                    "SELECT lastUpdated FROM Miner WHERE hotkey = ?", [miner_hotkey]
-                )
-                result = cursor.fetchone()
-                if result is not None:
-                    return result[0]
-                else:
-                    return None
+            miner_id = self.miner_ids.get(miner_hotkey)
+            if miner_id is None:
+                return None
+
+            result = self.connection.execute(
+                "SELECT lastUpdated FROM Miner WHERE minerId = ?", [miner_id]
+            ).fetchone()
+            return self._last_updated_from_micros(result[0])
 
     # Hugging face functionality
     def upsert_hf_metadata(self, hotkey: str, metadata: List[HuggingFaceMetadata]):
@@ -353,85 +779,65 @@ class SqliteMemoryValidatorStorage(ValidatorStorage):
         bt.logging.trace(f"{hotkey}: Upserting HuggingFace metadata with {len(metadata)} entries")
 
         with self.lock:
-            with contextlib.closing(self._create_connection()) as connection:
-                cursor = connection.cursor()
-                cursor.execute("SELECT minerId FROM Miner WHERE hotkey = ?", [hotkey])
-                result = cursor.fetchone()
-                if result is None:
-                    bt.logging.warning(f"{hotkey}: Attempted to upsert HF metadata for non-existent miner")
-                    return
-                miner_id = result[0]
-
-                for entry in metadata:
-                    cursor.execute("""
-                        INSERT OR REPLACE INTO HFMetadata 
-                        (minerId, repo_name, source, updated_at) 
-                        VALUES (?, ?, ?, ?)
-                    """, (miner_id, entry.repo_name, entry.source, entry.updated_at))
-                connection.commit()
+            miner_id = self.miner_ids.get(hotkey)
+            if miner_id is None:
+                bt.logging.warning(f"{hotkey}: Attempted to upsert HF metadata for non-existent miner")
+                return
+
+            with self._transaction() as cursor:
+                cursor.executemany("""
+                    INSERT OR REPLACE INTO HFMetadata 
+                    (minerId, repo_name, source, updated_at) 
+                    VALUES (?, ?, ?, ?)
+                """, [(miner_id, entry.repo_name, entry.source, entry.updated_at) for entry in metadata])
 
     def read_hf_metadata(self, miner_hotkey: str) -> List[HuggingFaceMetadata]:
         """Gets the HuggingFace metadata for a specific miner."""
         with self.lock:
-            with contextlib.closing(self._create_connection()) as connection:
-                cursor = connection.cursor()
-                cursor.execute("SELECT minerId FROM Miner WHERE hotkey = ?", [miner_hotkey])
-                result = cursor.fetchone()
-                if result is None:
-                    return []
-                miner_id = result[0]
-
-                cursor.execute("""
-                    SELECT repo_name, source, updated_at 
-                    FROM HFMetadata 
-                    WHERE minerId = ?
-                """, (miner_id,))
-                return [HuggingFaceMetadata(
-                    repo_name=row[0],
-                    source=row[1],
-                    updated_at=row[2]
-                ) for row in cursor.fetchall()]
+            miner_id = self.miner_ids.get(miner_hotkey)
+            if miner_id is None:
+                return []
+
+            cursor = self.connection.execute("""
+                SELECT repo_name, source, updated_at 
+                FROM HFMetadata 
+                WHERE minerId = ?
+            """, (miner_id,))
+            return [HuggingFaceMetadata(
+                repo_name=row[0],
+                source=row[1],
+                updated_at=row[2]
+            ) for row in cursor.fetchall()]
 
     def _delete_hf_metadata(self, miner_hotkey: str):
-        """Removes the HuggingFace metadata for the specified miner."""
+        """Removes the HuggingFace metadata for the specified miner. Must be called while holding the lock."""
         bt.logging.trace(f"{miner_hotkey}: Deleting HuggingFace metadata")
 
-        with contextlib.closing(self._create_connection()) as connection:
-            cursor = connection.cursor()
-            cursor.execute("SELECT minerId FROM Miner WHERE hotkey = ?", [miner_hotkey])
-            result = cursor.fetchone()
-            if result is not None:
-                cursor.execute("DELETE FROM HFMetadata WHERE minerId = ?", [result[0]])
-                connection.commit()
+        miner_id = self.miner_ids.get(miner_hotkey)
+        if miner_id is not None:
+            self.connection.execute("DELETE FROM HFMetadata WHERE minerId = ?", [miner_id])
 
     def has_hf_metadata(self, miner_hotkey: str) -> bool:
         """Checks if a specific miner has any HuggingFace metadata."""
         with self.lock:
-            with contextlib.closing(self._create_connection()) as connection:
-                cursor = connection.cursor()
-                cursor.execute("SELECT minerId FROM Miner WHERE hotkey = ?", [miner_hotkey])
-                result = cursor.fetchone()
-                if result is None:
-                    return False
-                miner_id = result[0]
+            miner_id = self.miner_ids.get(miner_hotkey)
+            if miner_id is None:
+                return False
 
-                cursor.execute("SELECT EXISTS(SELECT 1 FROM HFMetadata WHERE minerId = ?)", (miner_id,))
-                return bool(cursor.fetchone()[0])
+            result = self.connection.execute(
+                "SELECT EXISTS(SELECT 1 FROM HFMetadata WHERE minerId = ?)", (miner_id,)
+            ).fetchone()
+            return bool(result[0])
 
     def read_hf_metadata_last_updated(self, miner_hotkey: str) -> Optional[dt.datetime]:
         """Gets when a specific miner's HuggingFace metadata was last updated."""
         with self.lock:
-            with contextlib.closing(self._create_connection()) as connection:
-                cursor = connection.cursor()
-                cursor.execute("SELECT minerId FROM Miner WHERE hotkey = ?", [miner_hotkey])
-                result = cursor.fetchone()
-                if result is None:
-                    return None
-                miner_id = result[0]
-
-                # TODO DO WE NEED TO TAKE MAX VALUE?
-                cursor.execute(
-                    "SELECT MAX(updated_at) FROM HFMetadata WHERE minerId = ?", (miner_id,)
-                )
-                result = cursor.fetchone()
-                return result[0] if result and result[0] is not None else None
\ No newline at end of file
+            miner_id = self.miner_ids.get(miner_hotkey)
+            if miner_id is None:
+                return None
+
+            # TODO DO WE NEED TO TAKE MAX VALUE?
+            result = self.connection.execute(
+                "SELECT MAX(updated_at) FROM HFMetadata WHERE minerId = ?", (miner_id,)
+            ).fetchone()
+            return result[0] if result and result[0] is not None else None
@@ -1,8 +1,13 @@
+import datetime as dt
 import functools
 import time
 import unittest
 
-from common.utils import run_in_thread
+from common.utils import (
+    datetime_from_epoch_micros,
+    datetime_to_epoch_micros,
+    run_in_thread,
+)
 
 
 class TestUtils(unittest.TestCase):
@@ -52,6 +57,24 @@ class TestUtils(unittest.TestCase):
         with self.assertRaises(ValueError):
             result = run_in_thread(func=partial, ttl=5)
 
+    def test_epoch_micros_round_trip(self):
+        datetime = dt.datetime(2024, 3, 1, 12, 30, 15, 123456, tzinfo=dt.timezone.utc)
+
+        micros = datetime_to_epoch_micros(datetime)
+
+        self.assertEqual(micros, 1709296215123456)
+        self.assertEqual(datetime_from_epoch_micros(micros), datetime)
+
+    def test_epoch_micros_other_timezone(self):
+        datetime = dt.datetime(
+            2024, 3, 1, 14, 30, tzinfo=dt.timezone(dt.timedelta(hours=2))
+        )
+
+        self.assertEqual(
+            datetime_from_epoch_micros(datetime_to_epoch_micros(datetime)),
+            dt.datetime(2024, 3, 1, 12, 30, tzinfo=dt.timezone.utc),
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
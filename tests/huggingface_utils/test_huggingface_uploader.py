@@ -0,0 +1,121 @@
+import datetime as dt
+import os
+import unittest
+
+from common.data import DataEntity, DataLabel, DataSource
+from huggingface_utils.encoding_system import EncodingKeyManager
+from huggingface_utils.huggingface_uploader import HuggingFaceUploader
+from storage.miner.sqlite_miner_storage import SqliteMinerStorage
+from storage.miner.storage_metadata import (
+    DATETIME_FORMAT_EPOCH_MICROS,
+    DATETIME_FORMAT_KEY,
+    DATETIME_FORMAT_TEXT,
+    set_storage_metadata,
+)
+
+
+class TestHuggingFaceUploader(unittest.TestCase):
+    KEY_FILES = ["test_public_key.json", "test_private_key.json"]
+
+    def setUp(self):
+        self.storage = None
+        self.uploader = HuggingFaceUploader(
+            db_path="TestHfDb.sqlite",
+            miner_hotkey="test_hotkey",
+            encoding_key_manager=EncodingKeyManager(key_path=self.KEY_FILES[0]),
+            private_encoding_key_manager=EncodingKeyManager(
+                key_path=self.KEY_FILES[1]
+            ),
+            state_file="TestHfState.json",
+        )
+        self.start = dt.datetime(2024, 1, 1, tzinfo=dt.timezone.utc)
+
+    def tearDown(self):
+        if self.storage is not None:
+            self.storage.close()
+        for file in ["TestHfDb.sqlite", "TestHfDb.sqlite.index_snapshot.json"] + (
+            self.KEY_FILES
+        ):
+            if os.path.exists(file):
+                os.remove(file)
+
+    def _create_storage(self, integer_timestamps: bool):
+        self.storage = SqliteMinerStorage(
+            "TestHfDb.sqlite",
+            max_database_size_gb_hint=1,
+            integer_timestamps=integer_timestamps,
+        )
+        # Only some datetimes have fractional seconds, so text datetimes are stored with differing precision.
+        self.storage.store_data_entities(
+            [
+                DataEntity(
+                    uri=f"test_entity_{i}",
+                    datetime=self.start + dt.timedelta(seconds=i * 0.5),
+                    source=DataSource.REDDIT,
+                    label=DataLabel(value="r/test"),
+                    content=bytes(10),
+                    content_size_bytes=10,
+                )
+                for i in range(4)
+            ]
+        )
+
+    def _read_datetimes(self, last_upload):
+        return [
+            timestamp.to_pydatetime()
+            for chunk in self.uploader.get_data_for_huggingface_upload(
+                DataSource.REDDIT.value, last_upload
+            )
+            for timestamp in chunk["datetime"]
+        ]
+
+    def _test_get_data_for_huggingface_upload(self, integer_timestamps: bool):
+        self._create_storage(integer_timestamps)
+        expected = [self.start + dt.timedelta(seconds=i * 0.5) for i in range(4)]
+
+        self.assertEqual(self._read_datetimes(None), expected)
+        # Datetimes from the upload state are naive UTC.
+        self.assertEqual(
+            self._read_datetimes(self.start.replace(tzinfo=None)), expected[1:]
+        )
+        # Datetimes from a previous chunk are timezone aware.
+        self.assertEqual(self._read_datetimes(expected[1]), expected[2:])
+        self.assertEqual(self._read_datetimes(expected[3]), [])
+
+    def test_get_data_for_huggingface_upload_text_timestamps(self):
+        """Tests that chunks after the last upload are read from a database with text datetimes."""
+        self._test_get_data_for_huggingface_upload(integer_timestamps=False)
+
+    def test_get_data_for_huggingface_upload_integer_timestamps(self):
+        """Tests that chunks after the last upload are read from a database with integer datetimes."""
+        self._test_get_data_for_huggingface_upload(integer_timestamps=True)
+
+    def test_get_data_for_huggingface_upload_during_migration(self):
+        """Tests that nothing is read while the database holds both text and integer datetimes."""
+        self._create_storage(integer_timestamps=False)
+        with self.storage.connection_pool.writer() as connection:
+            set_storage_metadata(
+                connection, DATETIME_FORMAT_KEY, DATETIME_FORMAT_EPOCH_MICROS
+            )
+            connection.commit()
+
+        self.assertEqual(self._read_datetimes(self.start), [])
+
+    def test_to_datetime_param(self):
+        """Tests that datetimes are converted to the stored value in each format."""
+        naive = dt.datetime(2024, 1, 1, 0, 0, 1, 500)
+        aware = naive.replace(tzinfo=dt.timezone.utc)
+
+        for value in [naive, aware, aware.astimezone(dt.timezone(dt.timedelta(hours=2)))]:
+            self.assertEqual(
+                self.uploader.to_datetime_param(value, DATETIME_FORMAT_EPOCH_MICROS),
+                1704067201000500,
+            )
+            self.assertEqual(
+                self.uploader.to_datetime_param(value, DATETIME_FORMAT_TEXT),
+                "2024-01-01 00:00:01.000500+00:00",
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -181,6 +181,7 @@ class TestScraperCoordinator(unittest.TestCase):
         mock_scraper.scrape.return_value = expected_entities
 
         mock_storage = Mock(spec=MinerStorage)
+        mock_storage.filter_unchanged_data_entities.side_effect = lambda entities: entities
 
         # Create a ScraperProvider that uses the Mock Scraper
         provider = ScraperProvider(
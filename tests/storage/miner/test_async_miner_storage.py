@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import unittest
+
+from common.data import DataEntityBucketId, DataSource, TimeBucket
+from storage.miner.async_miner_storage import AsyncMinerStorage
+
+
+class BlockingStorage:
+    """A MinerStorage stand in whose bucket reads block until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def list_data_entities_in_data_entity_bucket(self, data_entity_bucket_id):
+        self.release.wait(5)
+        return [data_entity_bucket_id]
+
+    def list_contents_in_data_entity_buckets(self, data_entity_bucket_ids):
+        raise ValueError("Query failed.")
+
+
+class TestAsyncMinerStorage(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.storage = BlockingStorage()
+        self.async_storage = AsyncMinerStorage(self.storage, max_workers=1)
+        self.bucket_id = DataEntityBucketId(
+            time_bucket=TimeBucket(id=1), source=DataSource.REDDIT
+        )
+
+    def tearDown(self):
+        self.storage.release.set()
+        self.async_storage.shutdown()
+
+    async def test_event_loop_not_blocked(self):
+        """Tests that the event loop keeps running while a slow query runs and that queued queries are measured."""
+        first = asyncio.ensure_future(
+            self.async_storage.list_data_entities_in_data_entity_bucket(self.bucket_id)
+        )
+        second = asyncio.ensure_future(
+            self.async_storage.list_data_entities_in_data_entity_bucket(self.bucket_id)
+        )
+
+        # The loop can still run other work while both queries are outstanding.
+        await asyncio.sleep(0.1)
+        self.assertFalse(first.done())
+        self.assertEqual(self.async_storage.get_stats().queue_depth, 2)
+
+        self.storage.release.set()
+        self.assertEqual(await first, [self.bucket_id])
+        self.assertEqual(await second, [self.bucket_id])
+
+        stats = self.async_storage.get_stats()
+        self.assertEqual(stats.queue_depth, 0)
+        self.assertEqual(stats.max_queue_depth, 2)
+        self.assertEqual(stats.completed, 2)
+        # The second query waited for the single worker.
+        self.assertGreater(stats.max_wait_seconds, 0.05)
+
+    async def test_errors_propagate(self):
+        """Tests that storage errors are raised to the caller and counted."""
+        with self.assertRaises(ValueError):
+            await self.async_storage.list_contents_in_data_entity_buckets(
+                [self.bucket_id]
+            )
+
+        stats = self.async_storage.get_stats()
+        self.assertEqual(stats.failed, 1)
+        self.assertEqual(stats.queue_depth, 0)
+
+    async def test_shutdown_rejects_requests(self):
+        """Tests that no new queries are accepted after shutdown."""
+        self.async_storage.shutdown()
+        with self.assertRaises(RuntimeError):
+            await self.async_storage.list_data_entities_in_data_entity_bucket(
+                self.bucket_id
+            )
+        self.assertEqual(self.async_storage.get_stats().queue_depth, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
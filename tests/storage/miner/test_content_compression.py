@@ -0,0 +1,144 @@
+import sqlite3
+import threading
+import unittest
+
+from common.data import DataSource
+from storage.miner.content_compression import (
+    CONTENT_DICTIONARY_TABLE_CREATE,
+    ContentCompressor,
+    is_compressed,
+    load_content_compressor,
+    train_dictionary,
+)
+
+
+def _samples(source: str, count: int):
+    return [
+        f'{{"id": "{source}_{i}", "url": "https://example.com/{source}/{i}", "body": "body number {i * 7}"}}'.encode()
+        for i in range(count)
+    ]
+
+
+class TestContentCompressor(unittest.TestCase):
+    def test_round_trip_without_dictionary(self):
+        """Tests that content is compressed and decompressed without a trained dictionary."""
+        compressor = ContentCompressor()
+        content = _samples("x", 1)[0]
+
+        compressed = compressor.compress(DataSource.X, content)
+
+        self.assertTrue(is_compressed(compressed))
+        self.assertFalse(is_compressed(content))
+        self.assertEqual(compressor.decompress(compressed), content)
+        # Raw content is passed through unchanged.
+        self.assertEqual(compressor.decompress(content), content)
+
+    def test_round_trip_with_dictionaries(self):
+        """Tests that each source uses its latest dictionary and older dictionaries stay readable."""
+        compressor = ContentCompressor()
+        old_dict_id = compressor.add_dictionary(
+            DataSource.X, train_dictionary(_samples("old", 1000), 4096)
+        )
+        content = _samples("x", 1)[0]
+        compressed_with_old = compressor.compress(DataSource.X, content)
+
+        new_dict_id = compressor.add_dictionary(
+            DataSource.X, train_dictionary(_samples("x", 1000), 4096)
+        )
+        compressed_with_new = compressor.compress(DataSource.X, content)
+
+        self.assertNotEqual(old_dict_id, new_dict_id)
+        self.assertFalse(
+            compressor.is_compressed_with_current_dictionary(
+                DataSource.X, compressed_with_old
+            )
+        )
+        self.assertTrue(
+            compressor.is_compressed_with_current_dictionary(
+                DataSource.X, compressed_with_new
+            )
+        )
+        self.assertLess(len(compressed_with_new), len(content))
+        self.assertEqual(compressor.decompress(compressed_with_old), content)
+        self.assertEqual(compressor.decompress(compressed_with_new), content)
+
+        # Reddit has no dictionary so it falls back to plain zstd.
+        self.assertFalse(
+            compressor.is_compressed_with_current_dictionary(
+                DataSource.X, compressor.compress(DataSource.REDDIT, content)
+            )
+        )
+
+    def test_unknown_dictionary_raises(self):
+        """Tests that content compressed with an unregistered dictionary can not be silently misread."""
+        compressor = ContentCompressor()
+        compressor.add_dictionary(DataSource.X, train_dictionary(_samples("x", 1000), 4096))
+        compressed = compressor.compress(DataSource.X, _samples("x", 1)[0])
+
+        with self.assertRaises(ValueError):
+            ContentCompressor().decompress(compressed)
+
+    def test_unknown_dictionary_reloaded(self):
+        """Tests that content compressed with a dictionary added elsewhere is read after reloading the dictionaries."""
+        stored_dictionaries = []
+        compressor = ContentCompressor(dictionaries_loader=lambda: stored_dictionaries)
+        # A compressor of another process, e.g. a migration script, adding a dictionary to the same database.
+        other_compressor = ContentCompressor()
+        dictionary = train_dictionary(_samples("x", 1000), 4096)
+        other_compressor.add_dictionary(DataSource.X, dictionary)
+        stored_dictionaries.append((DataSource.X, dictionary))
+        content = _samples("x", 1)[0]
+
+        self.assertEqual(
+            compressor.decompress(other_compressor.compress(DataSource.X, content)), content
+        )
+        self.assertEqual(
+            compressor.source_dict_ids[DataSource.X],
+            other_compressor.source_dict_ids[DataSource.X],
+        )
+
+    def test_concurrent_use(self):
+        """Tests that a compressor can be shared between threads."""
+        compressor = ContentCompressor()
+        compressor.add_dictionary(DataSource.X, train_dictionary(_samples("x", 1000), 4096))
+        errors = []
+
+        def round_trip():
+            for content in _samples("x", 200):
+                if compressor.decompress(compressor.compress(DataSource.X, content)) != content:
+                    errors.append(content)
+
+        threads = [threading.Thread(target=round_trip) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+    def test_load_content_compressor(self):
+        """Tests that dictionaries are loaded from the database in the order they were added."""
+        connection = sqlite3.connect(":memory:")
+        # Loading before the table exists returns a compressor without dictionaries.
+        self.assertEqual(load_content_compressor(connection).dictionaries, {})
+
+        connection.execute(CONTENT_DICTIONARY_TABLE_CREATE)
+        for source in ["old", "new"]:
+            dictionary = train_dictionary(_samples(source, 1000), 4096)
+            connection.execute(
+                "INSERT INTO ContentDictionary (dictId, source, dictionary) VALUES (?, ?, ?)",
+                [ContentCompressor().add_dictionary(DataSource.X, dictionary), DataSource.X, dictionary],
+            )
+
+        compressor = load_content_compressor(connection)
+        latest_dict_id = connection.execute(
+            "SELECT dictId FROM ContentDictionary ORDER BY id DESC LIMIT 1"
+        ).fetchone()[0]
+
+        self.assertEqual(len(compressor.dictionaries), 2)
+        self.assertEqual(compressor.source_dict_ids[DataSource.X], latest_dict_id)
+        connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import datetime as dt
+import threading
+import unittest
+from unittest.mock import Mock
+
+from common.data import DataEntity, DataSource
+from storage.miner.ingest_writer import IngestWriter
+from storage.miner.miner_storage import MinerStorage
+
+
+def _create_entities(prefix: str, count: int):
+    now = dt.datetime.now()
+    return [
+        DataEntity(
+            uri=f"{prefix}_{i}",
+            datetime=now,
+            source=DataSource.REDDIT,
+            content=b"content",
+            content_size_bytes=7,
+        )
+        for i in range(count)
+    ]
+
+
+class TestIngestWriter(unittest.TestCase):
+    def setUp(self):
+        self.storage = Mock(spec=MinerStorage)
+        self.storage.filter_unchanged_data_entities.side_effect = lambda entities: entities
+
+    def test_coalesces_batches(self):
+        """Tests that batches submitted together are stored in a single write."""
+        writer = IngestWriter(self.storage, max_delay_seconds=0.5)
+        batches = [_create_entities(f"batch{i}", 3) for i in range(4)]
+        for batch in batches:
+            writer.submit(batch)
+
+        writer.start()
+        writer.flush()
+        writer.stop()
+
+        self.storage.store_data_entities.assert_called_once_with(
+            [entity for batch in batches for entity in batch]
+        )
+        stats = writer.get_stats()
+        self.assertEqual(stats.submitted_batches, 4)
+        self.assertEqual(stats.commits, 1)
+        self.assertEqual(stats.committed_entities, 12)
+        self.assertEqual(stats.max_commit_entities, 12)
+        self.assertEqual(stats.queue_depth, 0)
+
+    def test_commits_at_entity_threshold(self):
+        """Tests that a write is started as soon as the entity threshold is reached."""
+        writer = IngestWriter(
+            self.storage, max_commit_entities=5, max_delay_seconds=60
+        )
+        for i in range(4):
+            writer.submit(_create_entities(f"batch{i}", 3))
+
+        writer.start()
+        writer.flush()
+        writer.stop()
+
+        self.assertEqual(
+            [len(call.args[0]) for call in self.storage.store_data_entities.call_args_list],
+            [6, 6],
+        )
+
+    def test_backpressure(self):
+        """Tests that submitters wait while the queue is full and that nothing is dropped."""
+        release = threading.Event()
+        self.storage.store_data_entities.side_effect = lambda entities: release.wait(5)
+        writer = IngestWriter(
+            self.storage, max_queue_batches=1, max_commit_entities=1
+        )
+        writer.start()
+
+        def submit_all():
+            for i in range(3):
+                writer.submit(_create_entities(f"batch{i}", 1))
+
+        submitter = threading.Thread(target=submit_all)
+        submitter.start()
+        # The writer is blocked on the first batch and the queue holds the second, so the third must wait.
+        submitter.join(0.5)
+        self.assertTrue(submitter.is_alive())
+
+        release.set()
+        submitter.join(5)
+        writer.flush()
+        writer.stop()
+
+        stats = writer.get_stats()
+        self.assertGreaterEqual(stats.backpressure_waits, 1)
+        self.assertEqual(stats.committed_entities, 3)
+
+    def test_unchanged_entities_skipped(self):
+        """Tests that entities the storage already holds unchanged are not written and are counted per scraper."""
+        known = _create_entities("known", 2)
+        self.storage.filter_unchanged_data_entities.side_effect = lambda entities: [
+            entity for entity in entities if entity not in known
+        ]
+        writer = IngestWriter(self.storage, max_delay_seconds=0.5)
+        new = _create_entities("new", 1)
+        writer.submit(known + new, "X.apidojo")
+        writer.submit(known[:1], "Reddit.custom")
+        writer.submit(known[:1])
+
+        writer.start()
+        writer.flush()
+        writer.stop()
+
+        self.storage.store_data_entities.assert_called_once_with(new)
+        stats = writer.get_stats()
+        self.assertEqual(stats.skipped_unchanged_entities, 4)
+        self.assertEqual(
+            stats.skipped_unchanged_entities_by_scraper,
+            {"X.apidojo": 2, "Reddit.custom": 1},
+        )
+        self.assertEqual(stats.committed_entities, 1)
+
+    def test_failed_write_is_counted(self):
+        """Tests that a failed write does not stop the writer."""
+        self.storage.store_data_entities.side_effect = [ValueError(), None]
+        writer = IngestWriter(self.storage, max_commit_entities=1)
+        writer.start()
+        writer.submit(_create_entities("first", 1))
+        writer.flush()
+        writer.submit(_create_entities("second", 1))
+        writer.flush()
+        writer.stop()
+
+        stats = writer.get_stats()
+        self.assertEqual(stats.failed_commits, 1)
+        self.assertEqual(stats.commits, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
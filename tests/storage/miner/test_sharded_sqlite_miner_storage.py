@@ -0,0 +1,466 @@
+import os
+import shutil
+import threading
+import unittest
+from unittest import mock
+
+from common import constants
+from common.data import (
+    CompressedMinerIndex,
+    DataEntity,
+    DataEntityBucketId,
+    DataLabel,
+    DataSource,
+    TimeBucket,
+)
+import datetime as dt
+
+from storage.miner.sharded_sqlite_miner_storage import ShardedSqliteMinerStorage
+
+
+class TestShardedSqliteMinerStorage(unittest.TestCase):
+    def setUp(self):
+        # Make a test shard directory for the test to operate against.
+        self.directory = "TestShards"
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.test_storage = ShardedSqliteMinerStorage(
+            self.directory, max_database_size_gb_hint=1
+        )
+
+    def tearDown(self):
+        self.test_storage.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _create_entity(self, uri: str, datetime: dt.datetime, size: int, label=None):
+        return DataEntity(
+            uri=uri,
+            datetime=datetime,
+            source=DataSource.REDDIT,
+            label=DataLabel(value=label) if label else None,
+            content=bytes(size),
+            content_size_bytes=size,
+        )
+
+    def _shard_files(self):
+        return sorted(
+            file_name
+            for file_name in os.listdir(self.directory)
+            if file_name.startswith(ShardedSqliteMinerStorage.SHARD_FILE_PREFIX)
+            and file_name.endswith(ShardedSqliteMinerStorage.SHARD_FILE_SUFFIX)
+        )
+
+    def test_store_entities_by_day(self):
+        """Tests that entities are stored in one shard per UTC day."""
+        today = dt.datetime.now(tz=dt.timezone.utc).replace(hour=12)
+        yesterday = today - dt.timedelta(days=1)
+
+        self.test_storage.store_data_entities(
+            [
+                self._create_entity("today_1", today, 10),
+                self._create_entity("today_2", today, 20),
+                self._create_entity("yesterday_1", yesterday, 30),
+            ]
+        )
+
+        self.assertEqual(
+            self._shard_files(),
+            [
+                "DataEntity_" + yesterday.strftime("%Y-%m-%d") + ".sqlite",
+                "DataEntity_" + today.strftime("%Y-%m-%d") + ".sqlite",
+            ],
+        )
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 60)
+
+        bucket_id = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(today), source=DataSource.REDDIT
+        )
+        entities = self.test_storage.list_data_entities_in_data_entity_bucket(bucket_id)
+        self.assertEqual({entity.uri for entity in entities}, {"today_1", "today_2"})
+
+    def test_reopen_existing_shards(self):
+        """Tests that shards written by a previous instance are served after a restart."""
+        now = dt.datetime.now(tz=dt.timezone.utc)
+        self.test_storage.store_data_entities([self._create_entity("uri", now, 10)])
+        self.test_storage.close()
+
+        self.test_storage = ShardedSqliteMinerStorage(
+            self.directory, max_database_size_gb_hint=1
+        )
+
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 10)
+        bucket_id = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(now), source=DataSource.REDDIT
+        )
+        self.assertEqual(
+            len(self.test_storage.list_data_entities_in_data_entity_bucket(bucket_id)),
+            1,
+        )
+
+    def test_filter_unchanged_data_entities(self):
+        """Tests that unchanged entities are filtered across shards, keeping the order of the rest."""
+        today = dt.datetime.now(tz=dt.timezone.utc).replace(hour=12)
+        yesterday = today - dt.timedelta(days=1)
+        stored = [
+            self._create_entity("today_1", today, 10),
+            self._create_entity("yesterday_1", yesterday, 30),
+        ]
+        self.test_storage.store_data_entities(stored)
+
+        entities = [
+            self._create_entity("two_days_ago_1", yesterday - dt.timedelta(days=1), 10),
+            stored[0],
+            self._create_entity("yesterday_1", yesterday, 40),
+            self._create_entity("today_2", today, 20),
+            stored[1],
+        ]
+        self.assertEqual(
+            self.test_storage.filter_unchanged_data_entities(entities),
+            [entities[0], entities[2], entities[3]],
+        )
+
+    def test_list_label_stats_across_shards(self):
+        """Tests that the per label aggregates of every shard are combined."""
+        today = dt.datetime.now(tz=dt.timezone.utc).replace(hour=12, microsecond=0)
+        yesterday = today - dt.timedelta(days=1)
+        self.test_storage.store_data_entities(
+            [
+                self._create_entity("today_1", today, 10, label="label_1"),
+                self._create_entity("yesterday_1", yesterday, 30, label="label_1"),
+                self._create_entity("yesterday_2", yesterday, 5),
+            ]
+        )
+
+        stats = self.test_storage.list_label_stats()
+
+        self.assertEqual(
+            [(s.label, s.row_count, s.size_bytes) for s in stats],
+            [("label_1", 2, 40), (None, 1, 5)],
+        )
+        self.assertEqual(stats[0].earliest_datetime, yesterday)
+        self.assertEqual(stats[0].latest_datetime, today)
+
+    def test_list_contents_across_shards(self):
+        """Tests that contents can be listed for buckets in different shards."""
+        today = dt.datetime.now(tz=dt.timezone.utc).replace(hour=12)
+        yesterday = today - dt.timedelta(days=1)
+        self.test_storage.store_data_entities(
+            [
+                self._create_entity("today", today, 10),
+                self._create_entity("yesterday", yesterday, 20),
+            ]
+        )
+
+        today_bucket = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(today), source=DataSource.REDDIT
+        )
+        yesterday_bucket = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(yesterday), source=DataSource.REDDIT
+        )
+        missing_bucket = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(today - dt.timedelta(days=3)),
+            source=DataSource.REDDIT,
+        )
+
+        contents = self.test_storage.list_contents_in_data_entity_buckets(
+            [today_bucket, yesterday_bucket, missing_bucket]
+        )
+
+        self.assertEqual(contents[today_bucket], [bytes(10)])
+        self.assertEqual(contents[yesterday_bucket], [bytes(20)])
+        self.assertEqual(contents[missing_bucket], [])
+
+    def test_clear_content_from_oldest(self):
+        """Tests that the oldest shards are deleted first and the remainder is cleared from the next shard."""
+        today = dt.datetime.now(tz=dt.timezone.utc).replace(hour=12)
+        days = [today - dt.timedelta(days=offset) for offset in [2, 1, 0]]
+        self.test_storage.store_data_entities(
+            [
+                self._create_entity("oldest", days[0], 100),
+                self._create_entity("middle_1", days[1], 50),
+                self._create_entity("middle_2", days[1] + dt.timedelta(hours=1), 50),
+                self._create_entity("newest", days[2], 100),
+            ]
+        )
+
+        result = self.test_storage.clear_content_from_oldest(150)
+
+        self.assertEqual(result.bytes_cleared, 150)
+        self.assertEqual(result.rows_cleared, 2)
+        self.assertEqual(
+            result.time_bucket_ids_cleared,
+            [TimeBucket.from_datetime(days[0]).id, TimeBucket.from_datetime(days[1]).id],
+        )
+        self.assertEqual(len(self._shard_files()), 2)
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 150)
+
+    def test_partial_clear_does_not_block_other_shards(self):
+        """Tests that other shards can be leased while the oldest shard is partially cleared."""
+        today = dt.datetime.now(tz=dt.timezone.utc).replace(hour=12)
+        yesterday = today - dt.timedelta(days=1)
+        self.test_storage.store_data_entities(
+            [
+                self._create_entity("yesterday_1", yesterday, 100),
+                self._create_entity("yesterday_2", yesterday + dt.timedelta(hours=1), 100),
+                self._create_entity("today", today, 100),
+            ]
+        )
+        today_shard_id = ShardedSqliteMinerStorage._shard_id_for_time_bucket(
+            TimeBucket.from_datetime(today).id
+        )
+
+        clearing_started = threading.Event()
+        finish_clearing = threading.Event()
+        with self.test_storage._lease_shards() as shards:
+            partial_shard = shards[0]
+        clear_content_from_oldest = partial_shard.clear_content_from_oldest
+
+        def slow_clear_content_from_oldest(content_bytes_to_clear):
+            clearing_started.set()
+            finish_clearing.wait(timeout=10)
+            return clear_content_from_oldest(content_bytes_to_clear)
+
+        with mock.patch.object(
+            partial_shard, "clear_content_from_oldest", slow_clear_content_from_oldest
+        ):
+            clearing = threading.Thread(
+                target=self.test_storage.clear_content_from_oldest, args=(100,)
+            )
+            clearing.start()
+            self.assertTrue(clearing_started.wait(timeout=10))
+
+            # Leasing a shard returns immediately rather than waiting for the deletes.
+            leased = threading.Event()
+
+            def lease_today():
+                with self.test_storage._lease_shard(today_shard_id):
+                    leased.set()
+
+            leasing = threading.Thread(target=lease_today)
+            leasing.start()
+            self.assertTrue(leased.wait(timeout=5))
+            finish_clearing.set()
+            clearing.join(timeout=10)
+            leasing.join(timeout=10)
+
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 200)
+
+    def test_store_entity_moved_to_another_day(self):
+        """Tests that re-storing an entity whose datetime moved to another UTC day keeps a single copy."""
+        today = dt.datetime.now(tz=dt.timezone.utc).replace(hour=0, minute=30)
+        yesterday = today - dt.timedelta(hours=1)
+        self.test_storage.store_data_entities(
+            [
+                self._create_entity("moved", yesterday, 100),
+                self._create_entity("kept", yesterday, 10),
+            ]
+        )
+
+        self.test_storage.store_data_entities(
+            [
+                self._create_entity("moved", today, 50),
+                self._create_entity("moved", today, 40),
+            ]
+        )
+
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 50)
+        yesterday_bucket = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(yesterday), source=DataSource.REDDIT
+        )
+        today_bucket = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(today), source=DataSource.REDDIT
+        )
+        self.assertEqual(
+            [
+                entity.uri
+                for entity in self.test_storage.list_data_entities_in_data_entity_bucket(
+                    yesterday_bucket
+                )
+            ],
+            ["kept"],
+        )
+        self.assertEqual(
+            [
+                entity.content_size_bytes
+                for entity in self.test_storage.list_data_entities_in_data_entity_bucket(
+                    today_bucket
+                )
+            ],
+            [40],
+        )
+
+    def test_drop_shard_waits_for_leases(self):
+        """Tests that a shard in use is only closed and deleted once released, and is not reopened meanwhile."""
+        today = dt.datetime.now(tz=dt.timezone.utc).replace(hour=12)
+        yesterday = today - dt.timedelta(days=1)
+        self.test_storage.store_data_entities(
+            [
+                self._create_entity("yesterday", yesterday, 100),
+                self._create_entity("today", today, 100),
+            ]
+        )
+        bucket_id = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(yesterday), source=DataSource.REDDIT
+        )
+        shard_id = ShardedSqliteMinerStorage._shard_id_for_time_bucket(
+            bucket_id.time_bucket.id
+        )
+
+        with self.test_storage._lease_shard(shard_id) as shard:
+            clearing = threading.Thread(
+                target=self.test_storage.clear_content_from_oldest, args=(100,)
+            )
+            clearing.start()
+            clearing.join(timeout=0.5)
+
+            # The drop is waiting on the lease, so the leased shard keeps working.
+            self.assertTrue(clearing.is_alive())
+            self.assertEqual(
+                len(shard.list_data_entities_in_data_entity_bucket(bucket_id)), 1
+            )
+
+        clearing.join(timeout=10)
+        self.assertFalse(clearing.is_alive())
+        self.assertEqual(len(self._shard_files()), 1)
+        self.assertEqual(
+            self.test_storage.list_data_entities_in_data_entity_bucket(bucket_id), []
+        )
+
+    def test_shards_share_known_uri_filter(self):
+        """Tests that shards share one known URI filter, which forgets entities of dropped shards."""
+        today = dt.datetime.now(tz=dt.timezone.utc).replace(hour=12)
+        yesterday = today - dt.timedelta(days=1)
+        entities = [
+            self._create_entity("yesterday", yesterday, 100),
+            self._create_entity("today", today, 100),
+        ]
+        self.test_storage.store_data_entities(entities)
+
+        with self.test_storage._lease_shards() as shards:
+            self.assertEqual(len(shards), 2)
+            for shard in shards:
+                self.assertIs(shard.known_uri_filter, self.test_storage.known_uri_filter)
+                self.assertLessEqual(
+                    shard.connection_pool.reader_count,
+                    ShardedSqliteMinerStorage.MAX_SHARD_READER_CONNECTION_COUNT,
+                )
+        self.assertEqual(self.test_storage.filter_unchanged_data_entities(entities), [])
+
+        self.test_storage.clear_content_from_oldest(100)
+        # The entity is no longer stored, so it must be stored again.
+        self.assertEqual(
+            self.test_storage.filter_unchanged_data_entities(entities[:1]), entities[:1]
+        )
+
+    def test_new_shards_use_content_dictionaries(self):
+        """Tests that shards created after training compress with the trained dictionaries."""
+        self.test_storage.close()
+        self.test_storage = ShardedSqliteMinerStorage(
+            self.directory, max_database_size_gb_hint=1, compress_content=True
+        )
+        today = dt.datetime.now(tz=dt.timezone.utc).replace(hour=12)
+        entities = [
+            DataEntity(
+                uri=f"uri_{i}",
+                datetime=today,
+                source=DataSource.REDDIT,
+                content=f'{{"id": "t3_{i}", "body": "comment {i * 7}"}}'.encode(),
+                content_size_bytes=10,
+            )
+            for i in range(500)
+        ]
+        self.test_storage.store_data_entities(entities)
+        dict_ids = self.test_storage.train_content_dictionaries(
+            dictionary_size_bytes=4096
+        )
+
+        self.test_storage.store_data_entities(
+            [self._create_entity("tomorrow", today + dt.timedelta(days=1), 10)]
+        )
+
+        with self.test_storage._lease_shards() as shards:
+            for shard in shards:
+                self.assertEqual(
+                    shard.content_compressor.source_dict_ids[DataSource.REDDIT],
+                    dict_ids[DataSource.REDDIT],
+                )
+        bucket_id = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(today), source=DataSource.REDDIT
+        )
+        self.assertEqual(
+            {
+                entity.content
+                for entity in self.test_storage.list_data_entities_in_data_entity_bucket(
+                    bucket_id
+                )
+            },
+            {entity.content for entity in entities},
+        )
+
+    def test_refresh_index_expires_old_shards(self):
+        """Tests that the index covers buckets across shards and that expired shards are dropped."""
+        now = dt.datetime.now(tz=dt.timezone.utc)
+        expired = now - dt.timedelta(
+            days=constants.DATA_ENTITY_BUCKET_AGE_LIMIT_DAYS + 2
+        )
+        self.test_storage.store_data_entities(
+            [
+                self._create_entity("now", now, 10, label="label_1"),
+                self._create_entity(
+                    "yesterday", now - dt.timedelta(days=1), 20, label="label_2"
+                ),
+                self._create_entity("expired", expired, 30),
+            ]
+        )
+        self.assertEqual(len(self._shard_files()), 3)
+
+        self.test_storage.refresh_compressed_index(dt.timedelta(minutes=-1))
+        index = self.test_storage.get_compressed_index()
+
+        self.assertEqual(len(self._shard_files()), 2)
+        self.assertEqual(CompressedMinerIndex.bucket_count(index), 2)
+        self.assertEqual(CompressedMinerIndex.size_bytes(index), 30)
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 30)
+
+    def test_index_snapshot_loaded_after_restart(self):
+        """Tests that the last built index is served immediately after a restart."""
+        now = dt.datetime.now(tz=dt.timezone.utc)
+        self.test_storage.store_data_entities(
+            [self._create_entity("now", now, 10, label="label_1")]
+        )
+        serialized_index = self.test_storage.get_serialized_compressed_index()
+
+        self.test_storage.close()
+        self.test_storage = ShardedSqliteMinerStorage(
+            self.directory, max_database_size_gb_hint=1
+        )
+
+        self.assertEqual(self.test_storage.cached_index_serialized, serialized_index)
+        self.assertEqual(
+            CompressedMinerIndex.bucket_count(self.test_storage.cached_index_4), 1
+        )
+
+    def test_index_snapshot_ignored_after_write(self):
+        """Tests that a snapshot is not served once any shard changed after it was built."""
+        now = dt.datetime.now(tz=dt.timezone.utc)
+        self.test_storage.store_data_entities(
+            [self._create_entity("now", now, 10, label="label_1")]
+        )
+        self.test_storage.get_serialized_compressed_index()
+
+        self.test_storage.store_data_entities(
+            [
+                self._create_entity(
+                    "yesterday", now - dt.timedelta(days=1), 10, label="label_1"
+                )
+            ]
+        )
+        self.test_storage.close()
+        self.test_storage = ShardedSqliteMinerStorage(
+            self.directory, max_database_size_gb_hint=1
+        )
+
+        self.assertIsNone(self.test_storage.cached_index_4)
+
+
+if __name__ == "__main__":
+    unittest.main()
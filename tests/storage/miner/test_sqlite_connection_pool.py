@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import threading
+import unittest
+
+from storage.miner.sqlite_connection_pool import READER_PRAGMAS, SqliteConnectionPool
+
+
+class TestSqliteConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.database = "TestPoolDb.sqlite"
+        self.pool = SqliteConnectionPool(
+            lambda: sqlite3.connect(
+                self.database, timeout=5.0, check_same_thread=False
+            ),
+            reader_count=2,
+        )
+        with self.pool.writer() as connection:
+            connection.execute("pragma journal_mode=wal").fetchall()
+            connection.execute("CREATE TABLE Test (value INTEGER)")
+
+    def tearDown(self):
+        self.pool.close()
+        os.remove(self.database)
+
+    def test_pragmas_applied(self):
+        """Tests that the PRAGMA profile is applied to pooled connections."""
+        with self.pool.reader() as connection:
+            self.assertEqual(connection.execute("PRAGMA temp_store").fetchone()[0], 2)
+            self.assertEqual(
+                connection.execute("PRAGMA cache_size").fetchone()[0], -128 * 1024
+            )
+
+    def test_reader_pragmas_applied(self):
+        """Tests that readers can be given a read-only profile separate from the writer."""
+        pool = SqliteConnectionPool(
+            lambda: sqlite3.connect(
+                self.database, timeout=5.0, check_same_thread=False
+            ),
+            reader_count=1,
+            reader_pragmas=READER_PRAGMAS,
+        )
+        try:
+            with pool.reader() as connection:
+                self.assertEqual(
+                    connection.execute("PRAGMA cache_size").fetchone()[0], -32 * 1024
+                )
+                with self.assertRaises(sqlite3.OperationalError):
+                    connection.execute("INSERT INTO Test VALUES (1)")
+
+            with pool.writer() as connection:
+                self.assertEqual(
+                    connection.execute("PRAGMA cache_size").fetchone()[0], -128 * 1024
+                )
+                connection.execute("INSERT INTO Test VALUES (1)")
+                connection.commit()
+        finally:
+            pool.close()
+
+    def test_connections_reused(self):
+        """Tests that connections are kept open and reused between checkouts."""
+        with self.pool.reader() as connection:
+            first = connection
+        with self.pool.reader() as connection:
+            self.assertIs(connection, first)
+
+        with self.pool.writer() as connection:
+            first_writer = connection
+        with self.pool.writer() as connection:
+            self.assertIs(connection, first_writer)
+
+        stats = self.pool.get_stats()
+        self.assertEqual(stats.reader_hits, 2)
+        self.assertEqual(stats.reader_waits, 0)
+        # One writer checkout happened in setUp.
+        self.assertEqual(stats.writer_hits, 3)
+
+    def test_reader_waits_when_exhausted(self):
+        """Tests that a reader checkout waits when all readers are in use."""
+        acquired = threading.Semaphore(0)
+        release = threading.Event()
+
+        def hold_reader():
+            with self.pool.reader():
+                acquired.release()
+                release.wait()
+
+        threads = [threading.Thread(target=hold_reader) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for _ in threads:
+            acquired.acquire()
+
+        # Release the held readers shortly after we start waiting.
+        threading.Timer(0.2, release.set).start()
+        with self.pool.reader() as connection:
+            connection.execute("SELECT COUNT(*) FROM Test").fetchone()
+
+        for thread in threads:
+            thread.join()
+
+        stats = self.pool.get_stats()
+        self.assertEqual(stats.reader_waits, 1)
+        self.assertGreater(stats.reader_wait_seconds, 0)
+
+    def test_writer_rolls_back_on_error(self):
+        """Tests that an uncommitted write is rolled back if the caller raises."""
+        with self.assertRaises(ValueError):
+            with self.pool.writer() as connection:
+                connection.execute("INSERT INTO Test VALUES (1)")
+                raise ValueError()
+
+        with self.pool.reader() as connection:
+            self.assertEqual(
+                connection.execute("SELECT COUNT(*) FROM Test").fetchone()[0], 0
+            )
+
+    def test_closed_pool_raises(self):
+        """Tests that a closed pool can not hand out new connections."""
+        self.pool.close()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            with self.pool.writer():
+                pass
+
+
+if __name__ == "__main__":
+    unittest.main()
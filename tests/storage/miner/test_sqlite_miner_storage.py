@@ -1,7 +1,9 @@
 import contextlib
+import sqlite3
 import time
 import unittest
 import os
+from unittest.mock import patch
 
 from common import constants
 from common.data import (
@@ -14,12 +16,29 @@ from common.data import (
     DataSource,
     TimeBucket,
 )
+from common.protocol import GetDataEntityBucket
 import datetime as dt
 import pytz
+import zstandard
 
 from tests import utils
 
-from storage.miner.sqlite_miner_storage import SqliteMinerStorage
+from storage.miner.content_compression import is_compressed
+from storage.miner.miner_storage import LabelStats
+from storage.miner.sqlite_miner_storage import (
+    DiskUsage,
+    SqliteMinerStorage,
+    allocate_fair_shares,
+    get_content_bytes_to_clear,
+)
+from storage.miner.storage_metadata import (
+    DATETIME_FORMAT_EPOCH_MICROS,
+    DATETIME_FORMAT_KEY,
+    DATETIME_MIGRATION_COMPLETE_KEY,
+    get_storage_metadata,
+    is_datetime_migration_complete,
+    set_storage_metadata,
+)
 
 
 class TestSqliteMinerStorage(unittest.TestCase):
@@ -30,8 +49,11 @@ class TestSqliteMinerStorage(unittest.TestCase):
         )
 
     def tearDown(self):
-        # Clean up the test database.
+        # Close the pooled connections and clean up the test database.
+        self.test_storage.close()
         os.remove(self.test_storage.database)
+        if os.path.exists(self.test_storage.index_snapshot_path):
+            os.remove(self.test_storage.index_snapshot_path)
 
     def test_instantiate_sqlite_miner_storage(self):
         # Just ensure the setUp/tearDown methods work.
@@ -167,6 +189,585 @@ class TestSqliteMinerStorage(unittest.TestCase):
 
             self.assertEqual(uris, ["test_entity_2", "test_entity_3"])
 
+    def test_clear_content_from_oldest(self):
+        """Tests that clearing content deletes whole time buckets, oldest first, in bounded batches."""
+        now = dt.datetime.now()
+        entities = []
+        # Three time buckets with 3 entities of 10 bytes each.
+        for hour in range(3):
+            for i in range(3):
+                entities.append(
+                    DataEntity(
+                        uri=f"test_entity_{hour}_{i}",
+                        datetime=now + dt.timedelta(hours=hour),
+                        source=DataSource.REDDIT,
+                        content=bytes(10),
+                        content_size_bytes=10,
+                    )
+                )
+        self.test_storage.store_data_entities(entities)
+
+        # Use a tiny batch size to exercise deleting a bucket across multiple batches.
+        with patch.object(SqliteMinerStorage, "EVICTION_BATCH_SIZE", 2):
+            result = self.test_storage.clear_content_from_oldest(40)
+
+        # Two buckets are needed to reach 40 bytes.
+        self.assertEqual(result.bytes_cleared, 60)
+        self.assertEqual(result.rows_cleared, 6)
+        self.assertEqual(
+            result.time_bucket_ids_cleared,
+            [
+                TimeBucket.from_datetime(now).id,
+                TimeBucket.from_datetime(now + dt.timedelta(hours=1)).id,
+            ],
+        )
+        self.assertGreaterEqual(result.duration_seconds, 0)
+
+        with contextlib.closing(self.test_storage._create_connection()) as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT uri FROM DataEntity ORDER BY uri")
+            uris = [row["uri"] for row in cursor]
+        self.assertEqual(uris, ["test_entity_2_0", "test_entity_2_1", "test_entity_2_2"])
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 30)
+
+    def _store_hourly_entities(self, hours: int, size: int):
+        now = dt.datetime.now()
+        self.test_storage.store_data_entities(
+            [
+                DataEntity(
+                    uri=f"test_entity_{hour}_{i}",
+                    datetime=now + dt.timedelta(hours=hour),
+                    source=DataSource.REDDIT,
+                    content=os.urandom(size),
+                    content_size_bytes=size,
+                )
+                for hour in range(hours)
+                for i in range(10)
+            ]
+        )
+
+    def test_readers_are_read_only(self):
+        """Tests that the connections serving reads can not write, while the writer can."""
+        self._store_hourly_entities(hours=1, size=10)
+
+        with self.test_storage.connection_pool.reader() as connection:
+            with self.assertRaises(sqlite3.OperationalError):
+                connection.execute("DELETE FROM DataEntity")
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 100)
+
+    def test_free_pages_released_after_clearing(self):
+        """Tests that pages freed by clearing content are handed back to the filesystem."""
+        self._store_hourly_entities(hours=4, size=10_000)
+        before = self.test_storage.get_disk_usage()
+
+        self.test_storage.clear_content_from_oldest(300_000)
+
+        after = self.test_storage.get_disk_usage()
+        self.assertEqual(after.free_bytes, 0)
+        self.assertLess(after.database_size_bytes, before.database_size_bytes - 200_000)
+        self.assertEqual(after.content_size_bytes, 100_000)
+        self.assertGreater(after.overhead_ratio, 1)
+
+    def test_store_clears_space_over_disk_limit(self):
+        """Tests that content is cleared once the space used on disk, not just the content, exceeds the limit."""
+        self._store_hourly_entities(hours=4, size=10_000)
+        usage = self.test_storage.get_disk_usage()
+        # Well above the stored content, but below what the database uses on disk.
+        self.test_storage.database_max_size_bytes = usage.used_bytes
+        self.assertLess(usage.content_size_bytes, usage.used_bytes)
+
+        self.test_storage.store_data_entities(
+            [
+                DataEntity(
+                    uri="test_entity_new",
+                    datetime=dt.datetime.now() + dt.timedelta(hours=5),
+                    source=DataSource.REDDIT,
+                    content=bytes(10_000),
+                    content_size_bytes=10_000,
+                )
+            ]
+        )
+
+        self.assertLess(
+            self.test_storage.get_disk_usage().database_size_bytes,
+            usage.database_size_bytes,
+        )
+        self.assertLess(
+            self.test_storage.get_content_size_bytes(), usage.content_size_bytes
+        )
+
+    def test_get_content_bytes_to_clear(self):
+        """Tests that space is cleared for whichever of the content and on-disk limits is exceeded."""
+        usage = DiskUsage(
+            database_size_bytes=2_100,
+            free_bytes=100,
+            wal_size_bytes=0,
+            content_size_bytes=1_000,
+        )
+        # Within both limits.
+        self.assertEqual(get_content_bytes_to_clear(10_000, 10_000, usage, 100), 0)
+        # Over the content limit only, clearing a tenth of it.
+        self.assertEqual(get_content_bytes_to_clear(1_000, 10_000, usage, 100), 100)
+        # Over the disk limit by 700 bytes once the added content takes 200 bytes on disk, at 2 bytes per content byte.
+        self.assertEqual(get_content_bytes_to_clear(10_000, 1_500, usage, 100), 350)
+        # Slightly over the disk limit, clearing a tenth of it.
+        self.assertEqual(get_content_bytes_to_clear(10_000, 2_100, usage, 100), 105)
+
+    def test_content_size_running_total(self):
+        """Tests that the running total of content size tracks inserts, replaces and deletes."""
+        now = dt.datetime.now()
+        entity1 = DataEntity(
+            uri="test_entity_1",
+            datetime=now,
+            source=DataSource.REDDIT,
+            content=bytes(10),
+            content_size_bytes=10,
+        )
+        entity2 = DataEntity(
+            uri="test_entity_2",
+            datetime=now,
+            source=DataSource.X,
+            content=bytes(20),
+            content_size_bytes=20,
+        )
+
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 0)
+
+        self.test_storage.store_data_entities([entity1, entity2])
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 30)
+
+        # Replacing an existing entity should only count the new size.
+        updated_entity1 = DataEntity(
+            uri="test_entity_1",
+            datetime=now,
+            source=DataSource.REDDIT,
+            content=bytes(50),
+            content_size_bytes=50,
+        )
+        self.test_storage.store_data_entities([updated_entity1])
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 70)
+
+        with contextlib.closing(self.test_storage._create_connection()) as connection:
+            connection.execute("DELETE FROM DataEntity WHERE uri = 'test_entity_2'")
+            connection.commit()
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 50)
+
+        # Nothing to correct since the total was kept in sync.
+        self.assertEqual(self.test_storage.reconcile_content_size(), 0)
+
+    def test_reconcile_content_size(self):
+        """Tests that reconciling corrects drift in the running total of content size."""
+        entity = DataEntity(
+            uri="test_entity_1",
+            datetime=dt.datetime.now(),
+            source=DataSource.REDDIT,
+            content=bytes(10),
+            content_size_bytes=10,
+        )
+        self.test_storage.store_data_entities([entity])
+
+        with contextlib.closing(self.test_storage._create_connection()) as connection:
+            connection.execute("UPDATE ContentSizeTotal SET contentSizeBytes = 1000")
+            connection.commit()
+
+        self.assertEqual(self.test_storage.reconcile_content_size(), 990)
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 10)
+
+    def test_content_size_total_initialized_for_existing_database(self):
+        """Tests that the running total is initialized from the data for databases created by previous versions."""
+        entity = DataEntity(
+            uri="test_entity_1",
+            datetime=dt.datetime.now(),
+            source=DataSource.REDDIT,
+            content=bytes(10),
+            content_size_bytes=10,
+        )
+        self.test_storage.store_data_entities([entity])
+        self.test_storage.close()
+
+        with contextlib.closing(self.test_storage._create_connection()) as connection:
+            connection.execute("DROP TABLE ContentSizeTotal")
+            connection.commit()
+
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1
+        )
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 10)
+
+    def _assert_bucket_stats_match_data_entities(self):
+        with contextlib.closing(self.test_storage._create_connection()) as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                """SELECT timeBucketId, source, labelId, SUM(contentSizeBytes), COUNT(*) FROM DataEntity
+                        GROUP BY timeBucketId, source, labelId ORDER BY timeBucketId, source, labelId"""
+            )
+            expected = [tuple(row) for row in cursor.fetchall()]
+            cursor.execute(
+                """SELECT timeBucketId, source, labelId, totalBytes, rowCount FROM BucketStats
+                        ORDER BY timeBucketId, source, labelId"""
+            )
+            actual = [tuple(row) for row in cursor.fetchall()]
+        self.assertEqual(actual, expected)
+
+    def test_bucket_stats_maintained(self):
+        """Tests that the per bucket aggregates track inserts, replaces, moves between buckets and deletes."""
+        now = dt.datetime.now()
+        entities = [
+            DataEntity(
+                uri=f"test_entity_{i}",
+                datetime=now + dt.timedelta(hours=i % 2),
+                source=DataSource.REDDIT if i % 3 else DataSource.X,
+                label=DataLabel(value=f"label_{i % 2}") if i % 4 else None,
+                content=bytes(i + 1),
+                content_size_bytes=i + 1,
+            )
+            for i in range(12)
+        ]
+        self.test_storage.store_data_entities(entities)
+        self._assert_bucket_stats_match_data_entities()
+
+        # Replace an entity with a new size, moving it to a new time bucket and label.
+        replacement = DataEntity(
+            uri="test_entity_1",
+            datetime=now + dt.timedelta(hours=5),
+            source=DataSource.REDDIT,
+            label=DataLabel(value="label_moved"),
+            content=bytes(100),
+            content_size_bytes=100,
+        )
+        self.test_storage.store_data_entities([replacement])
+        self._assert_bucket_stats_match_data_entities()
+
+        # Delete every entity from one bucket to check the empty bucket is removed.
+        with contextlib.closing(self.test_storage._create_connection()) as connection:
+            connection.execute(
+                "DELETE FROM DataEntity WHERE labelId = (SELECT labelId FROM Label WHERE label = 'label_moved')"
+            )
+            connection.commit()
+        self._assert_bucket_stats_match_data_entities()
+
+        with contextlib.closing(self.test_storage._create_connection()) as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT COUNT(*) FROM BucketStats JOIN Label USING (labelId) WHERE label = 'label_moved'"
+            )
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_bucket_stats_initialized_for_existing_database(self):
+        """Tests that the per bucket aggregates are initialized for databases created by previous versions."""
+        now = dt.datetime.now()
+        entities = [
+            DataEntity(
+                uri=f"test_entity_{i}",
+                datetime=now + dt.timedelta(hours=i),
+                source=DataSource.REDDIT,
+                label=DataLabel(value="label_1"),
+                content=bytes(10),
+                content_size_bytes=10,
+            )
+            for i in range(3)
+        ]
+        self.test_storage.store_data_entities(entities)
+        self.test_storage.close()
+
+        with contextlib.closing(self.test_storage._create_connection()) as connection:
+            connection.execute("DROP TABLE BucketStats")
+            connection.commit()
+
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1
+        )
+        self._assert_bucket_stats_match_data_entities()
+
+    def _create_label_stats_entities(self):
+        start = dt.datetime(2024, 3, 1, 12, 30, tzinfo=dt.timezone.utc)
+        return [
+            DataEntity(
+                uri=f"test_entity_{i}",
+                datetime=start + dt.timedelta(hours=i),
+                source=DataSource.REDDIT if i < 4 else DataSource.X,
+                label=DataLabel(value="label_1") if i % 2 else None,
+                content=bytes(i + 1),
+                content_size_bytes=i + 1,
+            )
+            for i in range(6)
+        ]
+
+    def test_label_stats_maintained(self):
+        """Tests that the per label aggregates track inserts, replaces and eviction."""
+        entities = self._create_label_stats_entities()
+        self.test_storage.store_data_entities(entities)
+        # Replacing an entity with a larger one only changes its size.
+        self.test_storage.store_data_entities(
+            [entities[3].model_copy(update={"content": bytes(10), "content_size_bytes": 10})]
+        )
+
+        self.assertEqual(
+            self.test_storage.list_label_stats(),
+            [
+                LabelStats(
+                    DataSource.REDDIT, "label_1", 2, 12, entities[1].datetime, entities[3].datetime
+                ),
+                LabelStats(DataSource.REDDIT, None, 2, 4, entities[0].datetime, entities[2].datetime),
+                LabelStats(DataSource.X, "label_1", 1, 6, entities[5].datetime, entities[5].datetime),
+                LabelStats(DataSource.X, None, 1, 5, entities[4].datetime, entities[4].datetime),
+            ],
+        )
+        self.assertEqual(
+            self.test_storage.get_earliest_data_datetime(DataSource.REDDIT),
+            entities[0].datetime,
+        )
+
+        # Evicting the two oldest time buckets narrows the datetime range of both REDDIT labels.
+        self.test_storage.clear_content_from_oldest(3)
+        self.assertEqual(
+            self.test_storage.list_label_stats()[:2],
+            [
+                LabelStats(
+                    DataSource.REDDIT, "label_1", 1, 10, entities[3].datetime, entities[3].datetime
+                ),
+                LabelStats(DataSource.REDDIT, None, 1, 3, entities[2].datetime, entities[2].datetime),
+            ],
+        )
+        self.assertEqual(
+            self.test_storage.get_earliest_data_datetime(DataSource.REDDIT),
+            entities[2].datetime,
+        )
+
+    def test_label_stats_initialized_for_existing_database(self):
+        """Tests that the per label aggregates are initialized for databases created by previous versions."""
+        entities = self._create_label_stats_entities()
+        self.test_storage.store_data_entities(entities)
+        expected = self.test_storage.list_label_stats()
+        self.test_storage.close()
+
+        with contextlib.closing(self.test_storage._create_connection()) as connection:
+            connection.execute("DROP TABLE LabelStats")
+            connection.commit()
+
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1
+        )
+        self.assertEqual(self.test_storage.list_label_stats(), expected)
+
+    def test_list_data_entities_matches_validated_entities(self):
+        """Tests that the unvalidated bucket read path returns entities identical to validated ones."""
+        now = dt.datetime.now(tz=dt.timezone.utc)
+        entities = [
+            DataEntity(
+                uri=f"test_entity_{i}",
+                datetime=now,
+                source=DataSource.X,
+                label=DataLabel(value="#Label_1") if i % 2 == 0 else None,
+                content=bytes([i]) * 10,
+                content_size_bytes=10,
+            )
+            for i in range(4)
+        ]
+        self.test_storage.store_data_entities(entities)
+
+        for label in [DataLabel(value="#label_1"), None]:
+            bucket_id = DataEntityBucketId(
+                time_bucket=TimeBucket.from_datetime(now),
+                source=DataSource.X,
+                label=label,
+            )
+            expected = sorted(
+                [entity for entity in entities if entity.label == label],
+                key=lambda entity: entity.uri,
+            )
+            actual = sorted(
+                self.test_storage.list_data_entities_in_data_entity_bucket(bucket_id),
+                key=lambda entity: entity.uri,
+            )
+
+            self.assertEqual(actual, expected)
+            # The response serializes exactly as it would with validated entities.
+            self.assertEqual(
+                GetDataEntityBucket(
+                    data_entity_bucket_id=bucket_id, data_entities=actual
+                ).model_dump_json(),
+                GetDataEntityBucket(
+                    data_entity_bucket_id=bucket_id, data_entities=expected
+                ).model_dump_json(),
+            )
+
+    def _create_json_entities(self, count: int):
+        now = dt.datetime.now()
+        return [
+            DataEntity(
+                uri=f"https://example.com/r/label_1/comments/{i}",
+                datetime=now,
+                source=DataSource.REDDIT,
+                label=DataLabel(value="label_1"),
+                content=f'{{"id": "t3_{i}", "body": "comment {i * 7}"}}'.encode(),
+                content_size_bytes=len(f'{{"id": "t3_{i}", "body": "comment {i * 7}"}}'),
+            )
+            for i in range(count)
+        ]
+
+    def test_compressed_content_read_transparently(self):
+        """Tests that compressed content is read back raw and contentSizeBytes keeps the logical size."""
+        self.test_storage.close()
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1, compress_content=True
+        )
+        entities = self._create_json_entities(5)
+        self.test_storage.store_data_entities(entities)
+
+        with contextlib.closing(self.test_storage._create_connection()) as connection:
+            for row in connection.execute("SELECT content FROM DataEntity"):
+                self.assertTrue(is_compressed(row["content"]))
+
+        self.assertEqual(
+            self.test_storage.get_content_size_bytes(),
+            sum(entity.content_size_bytes for entity in entities),
+        )
+
+        bucket_id = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(entities[0].datetime),
+            source=DataSource.REDDIT,
+            label=DataLabel(value="label_1"),
+        )
+        self.assertEqual(
+            {
+                entity.content
+                for entity in self.test_storage.list_data_entities_in_data_entity_bucket(
+                    bucket_id
+                )
+            },
+            {entity.content for entity in entities},
+        )
+        self.assertEqual(
+            set(
+                self.test_storage.list_contents_in_data_entity_buckets([bucket_id])[
+                    bucket_id
+                ]
+            ),
+            {entity.content for entity in entities},
+        )
+
+    def test_migrate_content_compression(self):
+        """Tests training dictionaries, compressing existing content and migrating back."""
+        entities = self._create_json_entities(500)
+        self.test_storage.store_data_entities(entities)
+
+        dict_ids = self.test_storage.train_content_dictionaries(
+            dictionary_size_bytes=4096
+        )
+        self.assertEqual(list(dict_ids), [DataSource.REDDIT])
+
+        self.assertEqual(
+            self.test_storage.migrate_content_compression(batch_size=100), 500
+        )
+        # Already migrated content is skipped.
+        self.assertEqual(self.test_storage.migrate_content_compression(), 0)
+
+        # Dictionaries are persisted so a restarted storage can read the content.
+        self.test_storage.close()
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1
+        )
+        with contextlib.closing(self.test_storage._create_connection()) as connection:
+            for row in connection.execute("SELECT content FROM DataEntity"):
+                self.assertEqual(
+                    zstandard.get_frame_parameters(row["content"]).dict_id,
+                    dict_ids[DataSource.REDDIT],
+                )
+
+        bucket_id = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(entities[0].datetime),
+            source=DataSource.REDDIT,
+            label=DataLabel(value="label_1"),
+        )
+        self.assertEqual(
+            {
+                entity.content
+                for entity in self.test_storage.list_data_entities_in_data_entity_bucket(
+                    bucket_id
+                )
+            },
+            {entity.content for entity in entities},
+        )
+
+        self.assertEqual(
+            self.test_storage.migrate_content_compression(compress=False), 500
+        )
+        with contextlib.closing(self.test_storage._create_connection()) as connection:
+            for row in connection.execute("SELECT content FROM DataEntity"):
+                self.assertFalse(is_compressed(row["content"]))
+
+    def test_migrate_content_compression_while_running(self):
+        """Tests that a running storage reads content migrated by another storage on the same database."""
+        entities = self._create_json_entities(500)
+        self.test_storage.store_data_entities(entities)
+
+        # The migration script opens its own storage on the database the miner is using.
+        migration_storage = SqliteMinerStorage("TestDb.sqlite", max_database_size_gb_hint=1)
+        try:
+            migration_storage.train_content_dictionaries(dictionary_size_bytes=4096)
+            self.assertEqual(migration_storage.migrate_content_compression(), 500)
+        finally:
+            migration_storage.close()
+
+        bucket_id = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(entities[0].datetime),
+            source=DataSource.REDDIT,
+            label=DataLabel(value="label_1"),
+        )
+        self.assertEqual(
+            {
+                entity.content
+                for entity in self.test_storage.list_data_entities_in_data_entity_bucket(
+                    bucket_id
+                )
+            },
+            {entity.content for entity in entities},
+        )
+        self.assertEqual(
+            set(
+                self.test_storage.list_contents_in_data_entity_buckets([bucket_id])[
+                    bucket_id
+                ]
+            ),
+            {entity.content for entity in entities},
+        )
+
+    def test_get_serialized_compressed_index(self):
+        """Tests that the index is serialized once per refresh along with its stats."""
+        now = dt.datetime.now()
+        self.test_storage.store_data_entities(
+            [
+                DataEntity(
+                    uri=f"test_entity_{i}",
+                    datetime=now - dt.timedelta(hours=i),
+                    source=DataSource.REDDIT,
+                    label=DataLabel(value="label_1"),
+                    content=bytes(10),
+                    content_size_bytes=10 * (i + 1),
+                )
+                for i in range(3)
+            ]
+        )
+
+        self.test_storage.refresh_compressed_index(dt.timedelta(minutes=-1))
+        serialized_index = self.test_storage.get_serialized_compressed_index()
+        compressed_index = self.test_storage.get_compressed_index()
+
+        self.assertEqual(
+            serialized_index.compressed_index_serialized,
+            compressed_index.model_dump_json(),
+        )
+        self.assertEqual(serialized_index.size_bytes, 60)
+        self.assertEqual(serialized_index.bucket_count, 3)
+        # Until the next refresh every request is served the same payload.
+        self.assertIs(self.test_storage.get_serialized_compressed_index(), serialized_index)
+
+        self.test_storage.refresh_compressed_index(dt.timedelta(minutes=-1))
+        self.assertIsNot(
+            self.test_storage.get_serialized_compressed_index(), serialized_index
+        )
+
     def test_get_compressed_index(self):
         """Tests that we can get the compressed miner index from storage."""
         now = dt.datetime.now()
@@ -477,6 +1078,10 @@ class TestSqliteMinerStorage(unittest.TestCase):
 
         # Confirm we get back the expected data entities.
         self.assertEqual(data_entities, [bucket2_entity1, bucket2_entity2])
+        # Sources are read back as the enum, just as when validated.
+        self.assertEqual(
+            [data_entity.source.name for data_entity in data_entities], ["X", "X"]
+        )
 
     def test_list_entities_in_data_entity_bucket_over_max_size(self):
         """Tests that we can get enough entities in an over max size data entity bucket"""
@@ -826,6 +1431,492 @@ class TestSqliteMinerStorage(unittest.TestCase):
             utils.are_compressed_indexes_equal(cached_index, expected_index)
         )
 
+    def _store_index_entities(self):
+        now = dt.datetime.now()
+        self.test_storage.store_data_entities(
+            [
+                DataEntity(
+                    uri=f"test_entity_{i}",
+                    datetime=now,
+                    source=DataSource.REDDIT,
+                    label=DataLabel(value="label_1"),
+                    content=bytes(10),
+                    content_size_bytes=10,
+                )
+                for i in range(3)
+            ]
+        )
+
+    def test_index_snapshot_loaded_after_restart(self):
+        """Tests that the last built index is served immediately after a restart."""
+        self._store_index_entities()
+        index = self.test_storage.get_compressed_index()
+        serialized_index = self.test_storage.get_serialized_compressed_index()
+
+        self.test_storage.close()
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1
+        )
+
+        self.assertTrue(
+            utils.are_compressed_indexes_equal(self.test_storage.cached_index_4, index)
+        )
+        self.assertEqual(self.test_storage.cached_index_serialized, serialized_index)
+        # The snapshot is fresh, so the index is served without being rebuilt.
+        with patch.object(
+            self.test_storage, "list_bucket_sizes_and_content_size"
+        ) as list_bucket_sizes_and_content_size:
+            self.assertEqual(
+                self.test_storage.get_serialized_compressed_index(), serialized_index
+            )
+            list_bucket_sizes_and_content_size.assert_not_called()
+
+    def test_index_snapshot_ignored_for_other_database(self):
+        """Tests that a snapshot is not served for a database other than the one it was built from."""
+        self._store_index_entities()
+        self.test_storage.get_compressed_index()
+
+        self.test_storage.close()
+        os.remove(self.test_storage.database)
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1
+        )
+
+        self.assertIsNone(self.test_storage.cached_index_4)
+
+    def test_index_snapshot_ignored_after_write(self):
+        """Tests that a snapshot is not served once the content changed after it was built."""
+        self._store_index_entities()
+        self.test_storage.get_compressed_index()
+
+        self.test_storage.store_data_entities(
+            [
+                DataEntity(
+                    uri="test_entity_after_snapshot",
+                    datetime=dt.datetime.now(tz=dt.timezone.utc),
+                    source=DataSource.REDDIT,
+                    content=bytes(10),
+                    content_size_bytes=10,
+                )
+            ]
+        )
+        self.test_storage.close()
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1
+        )
+
+        self.assertIsNone(self.test_storage.cached_index_4)
+
+    def test_index_snapshot_ignored_after_eviction(self):
+        """Tests that a snapshot is not served once content was evicted after it was built."""
+        self._store_index_entities()
+        self.test_storage.get_compressed_index()
+
+        self.test_storage.clear_content_from_oldest(1)
+        self.test_storage.close()
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1
+        )
+
+        self.assertIsNone(self.test_storage.cached_index_4)
+
+    def test_index_snapshot_ignored_when_too_old(self):
+        """Tests that a snapshot older than the max age is not served."""
+        self._store_index_entities()
+        self.test_storage.get_compressed_index()
+
+        self.test_storage.close()
+        with patch.object(
+            constants, "MINER_INDEX_SNAPSHOT_MAX_AGE", dt.timedelta(seconds=0)
+        ):
+            self.test_storage = SqliteMinerStorage(
+                "TestDb.sqlite", max_database_size_gb_hint=1
+            )
+
+        self.assertIsNone(self.test_storage.cached_index_4)
+
+    def test_cached_index_served_during_refresh(self):
+        """Tests that a stale cached index is served without waiting on an in progress refresh."""
+        self._store_index_entities()
+        index = self.test_storage.get_compressed_index()
+        self.test_storage.cached_index_updated = dt.datetime.min
+
+        with self.test_storage.cached_index_refresh_lock:
+            self.assertIs(self.test_storage.get_compressed_index(), index)
+
+    def _create_timestamp_entities(self):
+        now = dt.datetime(2024, 3, 1, 12, 30, 15, 123456, tzinfo=dt.timezone.utc)
+        return [
+            DataEntity(
+                uri=f"test_entity_{i}",
+                datetime=now + dt.timedelta(minutes=i),
+                source=DataSource.REDDIT,
+                label=DataLabel(value="label_1"),
+                content=bytes(10),
+                content_size_bytes=10,
+            )
+            for i in range(3)
+        ]
+
+    def _list_timestamp_bucket(self, entities):
+        return self.test_storage.list_data_entities_in_data_entity_bucket(
+            DataEntityBucketId(
+                time_bucket=TimeBucket.from_datetime(entities[0].datetime),
+                source=DataSource.REDDIT,
+                label=DataLabel(value="label_1"),
+            )
+        )
+
+    def test_integer_timestamps(self):
+        """Tests that datetimes stored as epoch microseconds are read back unchanged."""
+        self.test_storage.close()
+        os.remove(self.test_storage.database)
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1, integer_timestamps=True
+        )
+        entities = self._create_timestamp_entities()
+        self.test_storage.store_data_entities(entities)
+
+        self.assertEqual(self.test_storage.get_datetime_format(), "epochMicros")
+        with self.test_storage.connection_pool.reader() as connection:
+            self.assertEqual(
+                connection.execute(
+                    "SELECT DISTINCT typeof(datetime) FROM DataEntity"
+                ).fetchall()[0][0],
+                "integer",
+            )
+        self.assertEqual(self._list_timestamp_bucket(entities), entities)
+        self.assertEqual(
+            self.test_storage.get_earliest_data_datetime(DataSource.REDDIT),
+            entities[0].datetime,
+        )
+
+    def test_integer_timestamps_existing_database(self):
+        """Tests that an existing text database is not switched to integer timestamps without a migration."""
+        self.test_storage.store_data_entities(self._create_timestamp_entities())
+        self.test_storage.close()
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1, integer_timestamps=True
+        )
+
+        self.assertEqual(self.test_storage.get_datetime_format(), "text")
+
+    def test_migrate_integer_timestamps(self):
+        """Tests that migrating a text database converts every row and that new rows are stored as integers."""
+        entities = self._create_timestamp_entities()
+        self.test_storage.store_data_entities(entities[:2])
+
+        rows_converted = self.test_storage.migrate_integer_timestamps(batch_size=1)
+        self.test_storage.store_data_entities(entities[2:])
+
+        self.assertEqual(rows_converted, 2)
+        self.assertEqual(self.test_storage.get_datetime_format(), "epochMicros")
+        with self.test_storage.connection_pool.reader() as connection:
+            self.assertEqual(
+                connection.execute(
+                    "SELECT COUNT(*) FROM DataEntity WHERE typeof(datetime) = 'integer'"
+                ).fetchone()[0],
+                3,
+            )
+        self.assertEqual(self._list_timestamp_bucket(entities), entities)
+        # A second migration has nothing left to convert.
+        self.assertEqual(self.test_storage.migrate_integer_timestamps(), 0)
+
+    def test_datetime_migration_complete(self):
+        """Tests that a database is only reported as fully migrated once no text datetimes remain."""
+        self.test_storage.store_data_entities(self._create_timestamp_entities())
+        with self.test_storage.connection_pool.writer() as connection:
+            self.assertTrue(is_datetime_migration_complete(connection))
+
+            # A migration that switched the format but has not converted the existing rows yet.
+            set_storage_metadata(
+                connection, DATETIME_FORMAT_KEY, DATETIME_FORMAT_EPOCH_MICROS
+            )
+            connection.commit()
+            self.assertFalse(is_datetime_migration_complete(connection))
+
+        self.test_storage.migrate_integer_timestamps()
+        with self.test_storage.connection_pool.reader() as connection:
+            self.assertTrue(is_datetime_migration_complete(connection))
+            self.assertEqual(
+                get_storage_metadata(connection, DATETIME_MIGRATION_COMPLETE_KEY), "1"
+            )
+
+    def test_datetime_format_cached(self):
+        """Tests that the datetime format is only re-read once another connection has committed."""
+        entities = self._create_timestamp_entities()
+        self.test_storage.store_data_entities(entities[:1])
+        with patch(
+            "storage.miner.sqlite_miner_storage.get_datetime_format"
+        ) as get_datetime_format:
+            get_datetime_format.return_value = "text"
+            self.test_storage.store_data_entities(entities[1:2])
+            get_datetime_format.assert_not_called()
+
+        # A migration started from another process switches new rows to integers.
+        with contextlib.closing(sqlite3.connect("TestDb.sqlite")) as connection:
+            set_storage_metadata(
+                connection, DATETIME_FORMAT_KEY, DATETIME_FORMAT_EPOCH_MICROS
+            )
+            connection.commit()
+        self.test_storage.store_data_entities(entities[2:])
+
+        with self.test_storage.connection_pool.reader() as connection:
+            self.assertEqual(
+                connection.execute(
+                    "SELECT uri FROM DataEntity WHERE typeof(datetime) = 'integer'"
+                ).fetchall()[0][0],
+                entities[2].uri,
+            )
+
+    def test_labels_interned(self):
+        """Tests that each label is stored once in the Label table, including the NULL label."""
+        now = dt.datetime.now()
+        self.test_storage.store_data_entities(
+            [
+                DataEntity(
+                    uri=f"test_entity_{i}",
+                    datetime=now,
+                    source=DataSource.REDDIT,
+                    label=DataLabel(value=f"label_{i % 2}") if i % 3 else None,
+                    content=bytes(10),
+                    content_size_bytes=10,
+                )
+                for i in range(6)
+            ]
+        )
+
+        with self.test_storage.connection_pool.reader() as connection:
+            labels = [
+                row[0]
+                for row in connection.execute("SELECT label FROM Label ORDER BY label")
+            ]
+        self.assertEqual(labels, ["NULL", "label_0", "label_1"])
+        self.assertEqual(
+            set(self.test_storage.label_cache.label_ids), {"NULL", "label_0", "label_1"}
+        )
+
+    def test_list_entities_in_data_entity_bucket_unknown_label(self):
+        """Tests that reading a bucket with a label that was never stored returns nothing and interns nothing."""
+        bucket_id = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(dt.datetime.now()),
+            source=DataSource.REDDIT,
+            label=DataLabel(value="never_stored"),
+        )
+
+        self.assertEqual(
+            self.test_storage.list_data_entities_in_data_entity_bucket(bucket_id), []
+        )
+        self.assertEqual(
+            self.test_storage.list_contents_in_data_entity_buckets([bucket_id]), {}
+        )
+        with self.test_storage.connection_pool.reader() as connection:
+            self.assertEqual(
+                connection.execute("SELECT COUNT(*) FROM Label").fetchone()[0], 0
+            )
+
+    def _create_inline_label_database(self, now: dt.datetime):
+        """Replaces the test database with one storing labels inline, as written by previous versions."""
+        self.test_storage.close()
+        os.remove(self.test_storage.database)
+        with contextlib.closing(sqlite3.connect("TestDb.sqlite")) as connection:
+            connection.execute(
+                """CREATE TABLE DataEntity (
+                        uri                 TEXT            PRIMARY KEY,
+                        datetime            TIMESTAMP(6)    NOT NULL,
+                        timeBucketId        INTEGER         NOT NULL,
+                        source              INTEGER         NOT NULL,
+                        label               CHAR(32)                ,
+                        content             BLOB            NOT NULL,
+                        contentSizeBytes    INTEGER         NOT NULL
+                        ) WITHOUT ROWID"""
+            )
+            connection.execute(
+                """CREATE INDEX data_entity_bucket_index2
+                        ON DataEntity (timeBucketId, source, label, contentSizeBytes)"""
+            )
+            connection.executemany(
+                "INSERT INTO DataEntity VALUES (?,?,?,?,?,?,?)",
+                [
+                    [
+                        f"test_entity_{i}",
+                        now,
+                        TimeBucket.from_datetime(now).id,
+                        DataSource.REDDIT,
+                        "label_1" if i % 2 else "NULL",
+                        bytes(10),
+                        10,
+                    ]
+                    for i in range(4)
+                ],
+            )
+            connection.commit()
+
+    def test_label_ids_migrated_on_startup(self):
+        """Tests that the storage migrates databases storing labels inline when it is opened."""
+        now = dt.datetime.now(tz=dt.timezone.utc)
+        self._create_inline_label_database(now)
+
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1
+        )
+
+        self._assert_bucket_stats_match_data_entities()
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 40)
+        self.assertEqual(
+            {bucket.id.label for bucket in self.test_storage.list_data_entity_buckets()},
+            {None, DataLabel(value="label_1")},
+        )
+
+    def test_label_ids_migrated_for_existing_database(self):
+        """Tests that databases storing labels inline, as in previous versions, are migrated to interned labels."""
+        now = dt.datetime.now(tz=dt.timezone.utc)
+        self._create_inline_label_database(now)
+
+        # Migrate in several batches. A second run has nothing left to migrate.
+        self.assertEqual(
+            SqliteMinerStorage.migrate_label_ids("TestDb.sqlite", batch_size=3), 4
+        )
+        self.assertEqual(SqliteMinerStorage.migrate_label_ids("TestDb.sqlite"), 0)
+
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1
+        )
+
+        self._assert_bucket_stats_match_data_entities()
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 40)
+        entities = self.test_storage.list_data_entities_in_data_entity_bucket(
+            DataEntityBucketId(
+                time_bucket=TimeBucket.from_datetime(now),
+                source=DataSource.REDDIT,
+                label=DataLabel(value="label_1"),
+            )
+        )
+        self.assertEqual(
+            [entity.uri for entity in entities], ["test_entity_1", "test_entity_3"]
+        )
+        self.assertEqual(
+            {bucket.id.label for bucket in self.test_storage.list_data_entity_buckets()},
+            {None, DataLabel(value="label_1")},
+        )
+
+    def _count_content_rows(self) -> int:
+        with self.test_storage.connection_pool.reader() as connection:
+            return connection.execute(
+                "SELECT COUNT(*) FROM DataEntityContent"
+            ).fetchone()[0]
+
+    def test_split_content(self):
+        """Tests that content stored apart from DataEntity is read back, replaced and cleared along with its row."""
+        self.test_storage.close()
+        os.remove(self.test_storage.database)
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1, split_content=True
+        )
+        entities = self._create_timestamp_entities()
+        self.test_storage.store_data_entities(entities)
+        # Replacing an entity replaces its content rather than leaving the old content behind.
+        entities[0] = entities[0].model_copy(update={"content": b"new content"})
+        self.test_storage.store_data_entities(entities[:1])
+
+        self.assertTrue(self.test_storage.split_content)
+        self.assertEqual(self._count_content_rows(), 3)
+        self.assertEqual(self._list_timestamp_bucket(entities), entities)
+        bucket_id = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(entities[0].datetime),
+            source=DataSource.REDDIT,
+            label=DataLabel(value="label_1"),
+        )
+        self.assertEqual(
+            sorted(
+                self.test_storage.list_contents_in_data_entity_buckets([bucket_id])[
+                    bucket_id
+                ]
+            ),
+            sorted(entity.content for entity in entities),
+        )
+
+        self.test_storage.train_content_dictionaries()
+        self.assertEqual(self.test_storage.migrate_content_compression(), 3)
+        self.assertEqual(self._list_timestamp_bucket(entities), entities)
+
+        self.test_storage.clear_content_from_oldest(1)
+        self.assertEqual(self._count_content_rows(), 0)
+        self.assertEqual(self.test_storage.get_content_size_bytes(), 0)
+
+    def test_filter_unchanged_data_entities(self):
+        """Tests that only new or changed entities are returned, including after a restart and after eviction."""
+        entities = self._create_timestamp_entities()
+        self.assertEqual(
+            self.test_storage.filter_unchanged_data_entities(entities), entities
+        )
+        self.test_storage.store_data_entities(entities)
+
+        changed = [
+            entities[0].model_copy(update={"content": b"new content"}),
+            entities[1].model_copy(update={"label": DataLabel(value="label_2")}),
+            entities[2],
+        ]
+        self.assertEqual(
+            self.test_storage.filter_unchanged_data_entities(changed), changed[:2]
+        )
+
+        # A restarted storage seeds the filter from the stored entities on the index refresh, not when storing.
+        self.test_storage.close()
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1, compress_content=True
+        )
+        self.assertEqual(
+            self.test_storage.filter_unchanged_data_entities(entities), entities
+        )
+        self.test_storage.refresh_compressed_index(dt.timedelta(minutes=20))
+        self.assertEqual(self.test_storage.filter_unchanged_data_entities(entities), [])
+
+        self.test_storage.clear_content_from_oldest(1)
+        self.assertEqual(
+            self.test_storage.filter_unchanged_data_entities(entities), entities
+        )
+
+    def test_clear_content_from_oldest_keeps_known_uris_of_other_buckets(self):
+        """Tests that clearing space only forgets the known URIs of the cleared time buckets."""
+        entities = self._create_timestamp_entities()
+        newer_entities = [
+            entity.model_copy(
+                update={
+                    "uri": entity.uri + "_newer",
+                    "datetime": entity.datetime + dt.timedelta(hours=1),
+                }
+            )
+            for entity in entities
+        ]
+        self.test_storage.store_data_entities(entities + newer_entities)
+
+        self.test_storage.clear_content_from_oldest(1)
+
+        self.assertEqual(
+            self.test_storage.filter_unchanged_data_entities(entities + newer_entities),
+            entities,
+        )
+        # The filter stays seeded, so it is not refilled with the deleted entities.
+        self.test_storage.refresh_compressed_index(dt.timedelta(minutes=20))
+        self.assertEqual(
+            self.test_storage.filter_unchanged_data_entities(entities + newer_entities),
+            entities,
+        )
+
+    def test_split_content_existing_database(self):
+        """Tests that an existing database keeps storing content inline."""
+        self.test_storage.store_data_entities(self._create_timestamp_entities())
+        self.test_storage.close()
+        self.test_storage = SqliteMinerStorage(
+            "TestDb.sqlite", max_database_size_gb_hint=1, split_content=True
+        )
+
+        self.assertFalse(self.test_storage.split_content)
+        entities = self._create_timestamp_entities()
+        self.test_storage.store_data_entities(entities)
+        self.assertEqual(self._list_timestamp_bucket(entities), entities)
+
     def test_list_contents_in_data_entity_buckets_empty_bucket(self):
         """Tests getting back no contents from an empty bucket."""
         # Create the DataEntityBucketId to query by.
@@ -1228,7 +2319,7 @@ class TestSqliteMinerStorage(unittest.TestCase):
             source=DataSource.REDDIT,
             label=DataLabel(value="label_1"),
             content=content1,
-            content_size_bytes=constants.BULK_CONTENTS_SIZE_LIMIT_BYTES / 1.5,
+            content_size_bytes=int(constants.BULK_CONTENTS_SIZE_LIMIT_BYTES / 1.5),
         )
         content2 = bytes(10)
         bucket1_entity2 = DataEntity(
@@ -1237,7 +2328,7 @@ class TestSqliteMinerStorage(unittest.TestCase):
             source=DataSource.REDDIT,
             label=DataLabel(value="label_1"),
             content=content2,
-            content_size_bytes=constants.BULK_CONTENTS_SIZE_LIMIT_BYTES / 1.5,
+            content_size_bytes=int(constants.BULK_CONTENTS_SIZE_LIMIT_BYTES / 1.5),
         )
         content3 = bytes(10)
         bucket1_entity3 = DataEntity(
@@ -1246,7 +2337,7 @@ class TestSqliteMinerStorage(unittest.TestCase):
             source=DataSource.REDDIT,
             label=DataLabel(value="label_1"),
             content=content3,
-            content_size_bytes=constants.BULK_CONTENTS_SIZE_LIMIT_BYTES / 1.5,
+            content_size_bytes=int(constants.BULK_CONTENTS_SIZE_LIMIT_BYTES / 1.5),
         )
 
         # Store the entities.
@@ -1266,10 +2357,10 @@ class TestSqliteMinerStorage(unittest.TestCase):
             [bucket1_id]
         )
 
-        # Confirm we get back only the two contents.
+        # Confirm we get back only the one content that fits within the limit.
         self.assertEqual(
             len(buckets_to_entities[bucket1_id]),
-            2,
+            1,
         )
 
     def test_list_contents_in_data_entity_buckets_exactly_max_size(self):
@@ -1316,6 +2407,133 @@ class TestSqliteMinerStorage(unittest.TestCase):
             1,
         )
 
+    def test_allocate_fair_shares(self):
+        """Tests that unused shares of small demands are redistributed to larger ones."""
+        self.assertEqual(allocate_fair_shares([10, 100, 1000], 300), [10, 100, 190])
+        self.assertEqual(allocate_fair_shares([500, 1000, 1000], 300), [100, 100, 100])
+        self.assertEqual(allocate_fair_shares([10, 20], 300), [10, 20])
+        self.assertEqual(allocate_fair_shares([0, 50, 50], 60), [0, 30, 30])
+        self.assertEqual(allocate_fair_shares([], 60), [])
+
+    def test_list_contents_in_data_entity_buckets_fair_limits(self):
+        """Tests that one large bucket can not consume the whole size limit."""
+        bucket_datetime = dt.datetime(2023, 12, 12, 1, 30, 0, tzinfo=dt.timezone.utc)
+        large_label = DataLabel(value="large")
+        small_label = DataLabel(value="small")
+        entities = [
+            DataEntity(
+                uri=f"large_{i}",
+                datetime=bucket_datetime,
+                source=DataSource.REDDIT,
+                label=large_label,
+                content=bytes([i]) * 10,
+                content_size_bytes=10,
+            )
+            for i in range(20)
+        ] + [
+            DataEntity(
+                uri=f"small_{i}",
+                datetime=bucket_datetime,
+                source=DataSource.REDDIT,
+                label=small_label,
+                content=bytes([i]) * 10,
+                content_size_bytes=10,
+            )
+            for i in range(3)
+        ]
+        self.test_storage.store_data_entities(entities)
+
+        large_id = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(bucket_datetime),
+            source=DataSource.REDDIT,
+            label=large_label,
+        )
+        small_id = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(bucket_datetime),
+            source=DataSource.REDDIT,
+            label=small_label,
+        )
+
+        # The large bucket is requested first but the small bucket is still fully served.
+        buckets_to_contents = self.test_storage.list_contents_in_data_entity_buckets(
+            [large_id, small_id, large_id], size_limit_bytes=100
+        )
+        self.assertEqual(len(buckets_to_contents[small_id]), 3)
+        self.assertEqual(len(buckets_to_contents[large_id]), 7)
+
+        buckets_to_contents = self.test_storage.list_contents_in_data_entity_buckets(
+            [large_id, small_id], count_limit=4
+        )
+        self.assertEqual(len(buckets_to_contents[small_id]), 2)
+        self.assertEqual(len(buckets_to_contents[large_id]), 2)
+
+    def test_list_contents_in_data_entity_buckets_never_exceeds_limit(self):
+        """Tests that the contents returned across several buckets never exceed the size limit."""
+        bucket_datetime = dt.datetime(2023, 12, 12, 1, 30, 0, tzinfo=dt.timezone.utc)
+        labels = [DataLabel(value=f"label_{i}") for i in range(3)]
+        self.test_storage.store_data_entities(
+            [
+                DataEntity(
+                    uri=f"{label.value}_{i}",
+                    datetime=bucket_datetime,
+                    source=DataSource.REDDIT,
+                    label=label,
+                    content=bytes([i]) * 10,
+                    content_size_bytes=size,
+                )
+                for label in labels
+                for i, size in enumerate([15, 25, 40])
+            ]
+        )
+        bucket_ids = [
+            DataEntityBucketId(
+                time_bucket=TimeBucket.from_datetime(bucket_datetime),
+                source=DataSource.REDDIT,
+                label=label,
+            )
+            for label in labels
+        ]
+
+        # Each bucket gets a share of 50 bytes, which fits its 15 and 25 byte entities but not also the 40.
+        buckets_to_contents = self.test_storage.list_contents_in_data_entity_buckets(
+            bucket_ids, size_limit_bytes=150
+        )
+        for bucket_id in bucket_ids:
+            self.assertEqual(
+                buckets_to_contents[bucket_id], [bytes([0]) * 10, bytes([1]) * 10]
+            )
+
+    def test_list_contents_in_data_entity_buckets_respects_source(self):
+        """Tests that buckets with the same time bucket and label but different sources are not mixed up."""
+        bucket_datetime = dt.datetime(2023, 12, 12, 1, 30, 0, tzinfo=dt.timezone.utc)
+        label = DataLabel(value="label_1")
+        self.test_storage.store_data_entities(
+            [
+                DataEntity(
+                    uri=f"test_entity_{source}",
+                    datetime=bucket_datetime,
+                    source=source,
+                    label=label,
+                    content=bytes([source]) * 10,
+                    content_size_bytes=10,
+                )
+                for source in [DataSource.REDDIT, DataSource.X]
+            ]
+        )
+
+        reddit_id = DataEntityBucketId(
+            time_bucket=TimeBucket.from_datetime(bucket_datetime),
+            source=DataSource.REDDIT,
+            label=label,
+        )
+        buckets_to_contents = self.test_storage.list_contents_in_data_entity_buckets(
+            [reddit_id]
+        )
+
+        self.assertEqual(
+            dict(buckets_to_contents), {reddit_id: [bytes([DataSource.REDDIT]) * 10]}
+        )
+
     @unittest.skip("Skip the max list contents test by default.")
     def test_list_contents_in_data_entity_buckets_max_size(self):
         """Tests getting back a maximum size list of contents."""
@@ -0,0 +1,389 @@
+import datetime as dt
+import os
+import random
+import tempfile
+import unittest
+
+from common import constants
+from common.data import (
+    CompressedEntityBucket,
+    CompressedMinerIndex,
+    DataSource,
+    HuggingFaceMetadata,
+    TimeBucket,
+)
+from common.data_v2 import ScorableDataEntityBucket
+from storage.validator.numpy_validator_storage import NumpyValidatorStorage
+from storage.validator.sqlite_memory_validator_storage import (
+    SqliteMemoryValidatorStorage,
+)
+
+
+class TestNumpyValidatorStorage(unittest.TestCase):
+    def setUp(self):
+        self.test_storage = NumpyValidatorStorage()
+        self.time_bucket = TimeBucket.from_datetime(dt.datetime.utcnow())
+
+    def _index(self, label: str, sizes_bytes: list) -> CompressedMinerIndex:
+        return CompressedMinerIndex(
+            sources={
+                DataSource.REDDIT.value: [
+                    CompressedEntityBucket(
+                        label=label,
+                        time_bucket_ids=[
+                            self.time_bucket.id + i for i in range(len(sizes_bytes))
+                        ],
+                        sizes_bytes=sizes_bytes,
+                    )
+                ]
+            }
+        )
+
+    def test_upsert_compressed_miner_index_insert_index_with_duplicates(self):
+        """Tests that duplicate buckets in an index are only stored once."""
+        bucket = CompressedEntityBucket(
+            label="label_1", time_bucket_ids=[self.time_bucket.id], sizes_bytes=[10]
+        )
+        index = CompressedMinerIndex(
+            sources={DataSource.REDDIT.value: [bucket, bucket]}
+        )
+
+        self.test_storage.upsert_compressed_miner_index(index, "hotkey1", credibility=1.0)
+
+        self.assertEqual(
+            self.test_storage.read_miner_index("hotkey1").scorable_data_entity_buckets,
+            [
+                ScorableDataEntityBucket(
+                    time_bucket_id=self.time_bucket.id,
+                    source=DataSource.REDDIT,
+                    label="label_1",
+                    size_bytes=10,
+                    scorable_bytes=10,
+                )
+            ],
+        )
+
+    def test_upsert_compressed_miner_index_update_index(self):
+        """Tests that upserting an index replaces the previous one, including its share of the bucket totals."""
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [100, 100]), "hotkey1", credibility=1.0
+        )
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [100]), "hotkey2", credibility=1.0
+        )
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_2", [100]), "hotkey1", credibility=1.0
+        )
+
+        buckets = self.test_storage.read_miner_index("hotkey2").scorable_data_entity_buckets
+        self.assertEqual([bucket.scorable_bytes for bucket in buckets], [100])
+        buckets = self.test_storage.read_miner_index("hotkey1").scorable_data_entity_buckets
+        self.assertEqual([bucket.label for bucket in buckets], ["label_2"])
+        self.assertEqual(len(self.test_storage.bucket_keys), 2)
+
+    def test_read_miner_index_shared_bucket(self):
+        """Tests that a bucket claimed by several miners is split by credibility weighted size."""
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [100]), "hotkey1", credibility=1.0
+        )
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [300]), "hotkey2", credibility=0.5
+        )
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [50]), "hotkey3", credibility=0.0
+        )
+
+        # 100 * 100 / (100 + 150) and 300 * 150 / (100 + 150).
+        self.assertEqual(
+            self.test_storage.read_miner_index("hotkey1")
+            .scorable_data_entity_buckets[0]
+            .scorable_bytes,
+            40,
+        )
+        self.assertEqual(
+            self.test_storage.read_miner_index("hotkey2")
+            .scorable_data_entity_buckets[0]
+            .scorable_bytes,
+            180,
+        )
+        self.assertEqual(
+            self.test_storage.read_miner_index("hotkey3")
+            .scorable_data_entity_buckets[0]
+            .scorable_bytes,
+            0,
+        )
+
+    def test_delete_miner(self):
+        """Tests that deleting a miner removes its index and its share of the bucket totals."""
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [100, 100]), "hotkey1", credibility=1.0
+        )
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [100]), "hotkey2", credibility=1.0
+        )
+
+        self.test_storage.delete_miner("hotkey1")
+
+        self.assertIsNone(self.test_storage.read_miner_index("hotkey1"))
+        self.assertIsNone(self.test_storage.read_miner_last_updated("hotkey1"))
+        buckets = self.test_storage.read_miner_index("hotkey2").scorable_data_entity_buckets
+        self.assertEqual([bucket.scorable_bytes for bucket in buckets], [100])
+        self.assertEqual(len(self.test_storage.bucket_keys), 1)
+
+    def test_upsert_compressed_miner_index_mismatched_lengths(self):
+        """Tests that each time bucket keeps its own size when a bucket has more ids than sizes or vice versa."""
+        index = CompressedMinerIndex(
+            sources={
+                DataSource.REDDIT.value: [
+                    CompressedEntityBucket(
+                        label="label_1",
+                        time_bucket_ids=[self.time_bucket.id, self.time_bucket.id + 1],
+                        sizes_bytes=[10],
+                    ),
+                    CompressedEntityBucket(
+                        label="label_2",
+                        time_bucket_ids=[self.time_bucket.id],
+                        sizes_bytes=[20, 30],
+                    ),
+                ]
+            }
+        )
+
+        self.test_storage.upsert_compressed_miner_index(index, "hotkey1", credibility=1.0)
+
+        buckets = self.test_storage.read_miner_index("hotkey1").scorable_data_entity_buckets
+        self.assertEqual(
+            sorted((bucket.label, bucket.time_bucket_id, bucket.size_bytes) for bucket in buckets),
+            [
+                ("label_1", self.time_bucket.id, 10),
+                ("label_2", self.time_bucket.id, 20),
+            ],
+        )
+
+    def test_upsert_compressed_miner_index_out_of_range_ids(self):
+        """Tests that time bucket ids which do not fit in the packed key are dropped without affecting other buckets."""
+        index = CompressedMinerIndex(
+            sources={
+                DataSource.REDDIT.value: [
+                    CompressedEntityBucket(
+                        label="label_1",
+                        time_bucket_ids=[-1, self.time_bucket.id, 1 << 24, 1 << 40],
+                        sizes_bytes=[10, 20, 30, 40],
+                    ),
+                    CompressedEntityBucket(
+                        label="label_2",
+                        time_bucket_ids=[1 << 64],
+                        sizes_bytes=[50],
+                    ),
+                ]
+            }
+        )
+
+        self.test_storage.upsert_compressed_miner_index(index, "hotkey1", credibility=1.0)
+
+        self.assertEqual(
+            self.test_storage.read_miner_index("hotkey1").scorable_data_entity_buckets,
+            [
+                ScorableDataEntityBucket(
+                    time_bucket_id=self.time_bucket.id,
+                    source=DataSource.REDDIT,
+                    label="label_1",
+                    size_bytes=20,
+                    scorable_bytes=20,
+                )
+            ],
+        )
+
+    def test_upsert_compressed_miner_index_huge_sizes(self):
+        """Tests that sizes are clamped to the bucket size limit, so they cannot overflow the shared bucket totals."""
+        limit = constants.DATA_ENTITY_BUCKET_SIZE_LIMIT_BYTES
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [2**62, -5]), "hotkey1", credibility=1.0
+        )
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [limit, 100]), "hotkey2", credibility=1.0
+        )
+
+        self.assertEqual(
+            [
+                (bucket.size_bytes, bucket.scorable_bytes)
+                for bucket in self.test_storage.read_miner_index(
+                    "hotkey1"
+                ).scorable_data_entity_buckets
+            ],
+            [(limit, limit // 2), (0, 0)],
+        )
+        self.assertEqual(
+            [
+                (bucket.size_bytes, bucket.scorable_bytes)
+                for bucket in self.test_storage.read_miner_index(
+                    "hotkey2"
+                ).scorable_data_entity_buckets
+            ],
+            [(limit, limit // 2), (100, 100)],
+        )
+
+    def test_hf_metadata(self):
+        """Tests that HuggingFace metadata is stored per repo and removed with its miner."""
+        now = dt.datetime.now(tz=dt.timezone.utc)
+        self.test_storage.upsert_hf_metadata(
+            "hotkey1",
+            [HuggingFaceMetadata(repo_name="repo", source=DataSource.X, updated_at=now)],
+        )
+        self.assertFalse(self.test_storage.has_hf_metadata("hotkey1"))
+
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [100]), "hotkey1", credibility=1.0
+        )
+        self.test_storage.upsert_hf_metadata(
+            "hotkey1",
+            [
+                HuggingFaceMetadata(
+                    repo_name="repo", source=DataSource.X, updated_at=now - dt.timedelta(hours=1)
+                ),
+                HuggingFaceMetadata(repo_name="other_repo", source=DataSource.REDDIT, updated_at=now),
+            ],
+        )
+        self.test_storage.upsert_hf_metadata(
+            "hotkey1",
+            [HuggingFaceMetadata(repo_name="repo", source=DataSource.X, updated_at=now)],
+        )
+
+        self.assertTrue(self.test_storage.has_hf_metadata("hotkey1"))
+        self.assertEqual(len(self.test_storage.read_hf_metadata("hotkey1")), 2)
+        self.assertEqual(self.test_storage.read_hf_metadata_last_updated("hotkey1"), now)
+
+        self.test_storage.delete_miner("hotkey1")
+        self.assertFalse(self.test_storage.has_hf_metadata("hotkey1"))
+        self.assertIsNone(self.test_storage.read_hf_metadata_last_updated("hotkey1"))
+
+    def test_snapshot_roundtrip(self):
+        """Tests that a snapshot restores every miner index, its metadata and the bucket totals."""
+        now = dt.datetime.now(tz=dt.timezone.utc)
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [100, 200]), "hotkey1", credibility=0.5
+        )
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_2", [300]), "hotkey2", credibility=1.0
+        )
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [50]), "hotkey2", credibility=1.0
+        )
+        self.test_storage.upsert_hf_metadata(
+            "hotkey1",
+            [HuggingFaceMetadata(repo_name="repo", source=DataSource.X, updated_at=now)],
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "snapshot.npz")
+            self.test_storage.save_snapshot(path)
+            restored_storage = NumpyValidatorStorage()
+            self.assertEqual(
+                restored_storage.load_snapshot(path, dt.timedelta(hours=1)), 2
+            )
+
+        for hotkey in ["hotkey1", "hotkey2"]:
+            self.assertEqual(
+                restored_storage.read_miner_index(hotkey),
+                self.test_storage.read_miner_index(hotkey),
+            )
+            self.assertEqual(
+                restored_storage.read_miner_last_updated(hotkey),
+                self.test_storage.read_miner_last_updated(hotkey),
+            )
+        self.assertEqual(restored_storage.read_hf_metadata("hotkey1"), self.test_storage.read_hf_metadata("hotkey1"))
+
+        # The restored totals are kept up to date by new upserts.
+        restored_storage.delete_miner("hotkey1")
+        buckets = restored_storage.read_miner_index("hotkey2").scorable_data_entity_buckets
+        self.assertEqual([bucket.scorable_bytes for bucket in buckets], [50])
+
+    def test_load_snapshot_drops_stale_and_unknown_miners(self):
+        """Tests that only recently updated miners in the provided hotkeys are restored."""
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [100]), "hotkey1", credibility=1.0
+        )
+        self.test_storage.upsert_compressed_miner_index(
+            self._index("label_1", [100]), "hotkey2", credibility=1.0
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "snapshot.npz")
+            self.assertEqual(self.test_storage.load_snapshot(path, dt.timedelta(hours=1)), 0)
+
+            self.test_storage.save_snapshot(path)
+            restored_storage = NumpyValidatorStorage()
+            self.assertEqual(
+                restored_storage.load_snapshot(path, dt.timedelta(hours=1), {"hotkey2"}), 1
+            )
+            self.assertIsNone(restored_storage.read_miner_index("hotkey1"))
+            buckets = restored_storage.read_miner_index("hotkey2").scorable_data_entity_buckets
+            self.assertEqual([bucket.scorable_bytes for bucket in buckets], [100])
+
+            self.assertEqual(
+                NumpyValidatorStorage().load_snapshot(path, dt.timedelta(0)), 0
+            )
+
+            # Snapshots of the SQLite storage are ignored rather than raising.
+            SqliteMemoryValidatorStorage().save_snapshot(path)
+            self.assertEqual(
+                NumpyValidatorStorage().load_snapshot(path, dt.timedelta(hours=1)), 0
+            )
+
+    def test_matches_sqlite_storage(self):
+        """Tests that scored indexes match the SQLite storage for many overlapping miners."""
+        rng = random.Random(0)
+        sqlite_storage = SqliteMemoryValidatorStorage()
+        for round in range(2):
+            for miner in range(20):
+                index = CompressedMinerIndex(
+                    sources={
+                        source: [
+                            CompressedEntityBucket(
+                                label=rng.choice([None, "label_1", "label_2", "#🌌"]),
+                                time_bucket_ids=rng.sample(
+                                    range(self.time_bucket.id, self.time_bucket.id + 30),
+                                    10,
+                                ),
+                                sizes_bytes=[rng.randint(1, 10_000) for _ in range(10)],
+                            )
+                            for _ in range(3)
+                        ]
+                        for source in [DataSource.REDDIT.value, DataSource.X.value]
+                    }
+                )
+                # Include credibilities below the fixed point precision of the bucket totals.
+                credibility = rng.random() * rng.choice([1, 0.001, 1e-7])
+                self.test_storage.upsert_compressed_miner_index(
+                    index, f"hotkey{miner}", credibility
+                )
+                sqlite_storage.upsert_compressed_miner_index(
+                    index, f"hotkey{miner}", credibility
+                )
+        self.test_storage.delete_miner("hotkey0")
+        sqlite_storage.delete_miner("hotkey0")
+
+        for miner in range(1, 20):
+            expected = sqlite_storage.read_miner_index(f"hotkey{miner}")
+            actual = self.test_storage.read_miner_index(f"hotkey{miner}")
+            self.assertEqual(
+                len(actual.scorable_data_entity_buckets),
+                len(expected.scorable_data_entity_buckets),
+            )
+            for actual_bucket, expected_bucket in zip(
+                actual.scorable_data_entity_buckets,
+                expected.scorable_data_entity_buckets,
+            ):
+                for field in ["time_bucket_id", "source", "label", "size_bytes"]:
+                    self.assertEqual(
+                        getattr(actual_bucket, field), getattr(expected_bucket, field)
+                    )
+                # Both backends compute the same sums, but add and remove the float remainders in a different order.
+                # That may only move a result lying exactly on a whole byte to the byte below.
+                self.assertAlmostEqual(
+                    actual_bucket.scorable_bytes, expected_bucket.scorable_bytes, delta=1
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
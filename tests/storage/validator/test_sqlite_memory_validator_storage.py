@@ -1,9 +1,13 @@
 from collections import defaultdict
 import contextlib
+import os
 import random
+import tempfile
+import threading
 import time
 from typing import Dict, List
 import unittest
+from unittest.mock import patch
 import concurrent
 
 from common import constants, utils
@@ -364,6 +368,176 @@ class TestSqliteMemoryValidatorStorage(unittest.TestCase):
             scored_index.scorable_data_entity_buckets[0], expected_bucket_1
         )
 
+    # The query read_miner_index used before bucket totals were maintained, re-aggregating every bucket on each read.
+    # Credibilities are read from InputCredibility, holding exactly what each miner was upserted with.
+    RECOMPUTED_SCORABLE_BYTES_QUERY = """WITH
+        TempBuckets AS (
+            SELECT source, labelId, timeBucketId
+            FROM MinerIndex
+            WHERE MinerId = ?
+        ),
+        TempAgg AS (
+            SELECT source, labelId, timeBucketId,
+            SUM(contentSizeBytes * credibility) as totalAdjContentSizeBytes
+            FROM MinerIndex
+            INNER JOIN TempBuckets USING (source, labelId, timeBucketId)
+            JOIN InputCredibility USING (minerId)
+            GROUP BY source, labelId, timeBucketId
+        )
+        SELECT source, labelId, timeBucketId, contentSizeBytes,
+            (contentSizeBytes * (contentSizeBytes * ?) / TempAgg.totalAdjContentSizeBytes) as scorableBytes
+        FROM MinerIndex
+        LEFT JOIN TempAgg USING (source, labelId, timeBucketId)
+        WHERE minerId = ?"""
+
+    def _assert_scorable_bytes_match_recomputed(self, credibilities: Dict[str, float]):
+        connection = self.test_storage.connection
+        connection.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS InputCredibility (minerId INTEGER PRIMARY KEY, credibility REAL)"
+        )
+        connection.execute("DELETE FROM InputCredibility")
+        connection.executemany(
+            "INSERT INTO InputCredibility VALUES (?, ?)",
+            [
+                (self.test_storage.miner_ids[hotkey], credibility)
+                for hotkey, credibility in credibilities.items()
+            ],
+        )
+
+        for hotkey, credibility in credibilities.items():
+            miner_id = self.test_storage.miner_ids[hotkey]
+            expected = [
+                int(row[4] if row[4] else 0)
+                for row in connection.execute(
+                    self.RECOMPUTED_SCORABLE_BYTES_QUERY,
+                    [miner_id, credibility, miner_id],
+                )
+            ]
+            index = self.test_storage.read_miner_index(hotkey)
+            self.assertEqual(
+                [bucket.scorable_bytes for bucket in index.scorable_data_entity_buckets],
+                expected,
+            )
+
+    def test_scorable_bytes_match_recomputed_totals(self):
+        """Tests that scorable bytes from the maintained bucket totals are identical to re-aggregating every bucket."""
+        rng = random.Random(0)
+        time_bucket_id = TimeBucket.from_datetime(dt.datetime.utcnow()).id
+        hotkeys = [f"hotkey{i}" for i in range(20)]
+
+        def random_index() -> CompressedMinerIndex:
+            return CompressedMinerIndex(
+                sources={
+                    source: [
+                        CompressedEntityBucket(
+                            label=rng.choice([None, "label_1", "label_2", "label_3"]),
+                            time_bucket_ids=rng.sample(
+                                range(time_bucket_id, time_bucket_id + 20), 10
+                            ),
+                            sizes_bytes=[rng.randint(1, 1_000_000) for _ in range(10)],
+                        )
+                        for _ in range(3)
+                    ]
+                    for source in [DataSource.REDDIT.value, DataSource.X.value]
+                }
+            )
+
+        # Include low credibilities, which lose the most precision when rounded to the fixed point scale.
+        credibilities = {hotkey: rng.random() * rng.choice([1, 0.3, 0.001]) for hotkey in hotkeys}
+        for hotkey, credibility in credibilities.items():
+            self.test_storage.upsert_compressed_miner_index(
+                random_index(), hotkey, credibility
+            )
+        self._assert_scorable_bytes_match_recomputed(credibilities)
+
+        # Replace some indexes, change credibilities and delete miners.
+        for hotkey in hotkeys[:10]:
+            credibilities[hotkey] = rng.random() * 0.3
+            self.test_storage.upsert_compressed_miner_index(
+                random_index(), hotkey, credibilities[hotkey]
+            )
+        for hotkey in hotkeys[10:15]:
+            credibilities[hotkey] = rng.random() * 0.001
+            self.test_storage._upsert_miner(hotkey, dt.datetime.utcnow(), credibilities[hotkey])
+        credibilities[hotkeys[15]] = 0
+        self.test_storage._upsert_miner(hotkeys[15], dt.datetime.utcnow(), 0)
+        for hotkey in hotkeys[16:]:
+            del credibilities[hotkey]
+            self.test_storage.delete_miner(hotkey)
+        self._assert_scorable_bytes_match_recomputed(credibilities)
+
+        # Totals are only kept for buckets that some miner still claims.
+        claimed_buckets = self.test_storage.connection.execute(
+            "SELECT COUNT(*) FROM (SELECT DISTINCT source, labelId, timeBucketId FROM MinerIndex)"
+        ).fetchone()[0]
+        self.assertEqual(
+            self.test_storage.connection.execute(
+                "SELECT COUNT(*) FROM BucketTotal"
+            ).fetchone()[0],
+            claimed_buckets,
+        )
+
+    def test_upsert_compressed_miner_index_applies_diff(self):
+        """Tests that upserting an index only writes the buckets that changed, and skips unchanged indexes."""
+        time_bucket_id = TimeBucket.from_datetime(dt.datetime.utcnow()).id
+
+        def index(sizes_bytes: List[int]) -> CompressedMinerIndex:
+            return CompressedMinerIndex(
+                sources={
+                    DataSource.REDDIT.value: [
+                        CompressedEntityBucket(
+                            label="label_1",
+                            time_bucket_ids=[
+                                time_bucket_id + i for i in range(len(sizes_bytes))
+                            ],
+                            sizes_bytes=sizes_bytes,
+                        )
+                    ]
+                }
+            )
+
+        self.test_storage.upsert_compressed_miner_index(
+            index([10, 20, 30]), "hotkey1", credibility=1.0
+        )
+        self.test_storage.upsert_compressed_miner_index(
+            index([10, 20]), "hotkey2", credibility=0.5
+        )
+        # Grow one bucket and drop another.
+        self.test_storage.upsert_compressed_miner_index(
+            index([10, 25]), "hotkey1", credibility=1.0
+        )
+        self.test_storage.upsert_compressed_miner_index(
+            index([10, 25]), "hotkey1", credibility=0.5
+        )
+
+        stats = self.test_storage.get_upsert_stats()
+        self.assertEqual(stats.upserts, 4)
+        self.assertEqual(stats.unchanged_upserts, 1)
+        self.assertEqual(stats.rows_inserted, 5)
+        self.assertEqual(stats.rows_updated, 1)
+        self.assertEqual(stats.rows_deleted, 1)
+
+        self.assertEqual(
+            [
+                bucket.size_bytes
+                for bucket in self.test_storage.read_miner_index(
+                    "hotkey1"
+                ).scorable_data_entity_buckets
+            ],
+            [10, 25],
+        )
+        # The credibility change of the skipped upsert still applies to the bucket totals.
+        self._assert_scorable_bytes_match_recomputed({"hotkey1": 0.5, "hotkey2": 0.5})
+        self.assertEqual(
+            [
+                bucket.scorable_bytes
+                for bucket in self.test_storage.read_miner_index(
+                    "hotkey1"
+                ).scorable_data_entity_buckets
+            ],
+            [5, 13],
+        )
+
     def test_read_non_existing_miner_index(self):
         """Tests that we correctly return none for a non existing miner index."""
         # Read the index.
@@ -412,8 +586,7 @@ class TestSqliteMemoryValidatorStorage(unittest.TestCase):
         """Tests getting the last time a miner was updated."""
         # Insert a miner
         now = dt.datetime.utcnow()
-        now_str = now.strftime("%Y-%m-%d %H:%M:%S.%f")
-        self.test_storage._upsert_miner("test_hotkey", now_str, 1)
+        self.test_storage._upsert_miner("test_hotkey", now, 1)
 
         # Get the last updated
         last_updated = self.test_storage.read_miner_last_updated("test_hotkey")
@@ -425,8 +598,7 @@ class TestSqliteMemoryValidatorStorage(unittest.TestCase):
         """Tests getting the last time a miner was updated when it has never been updated."""
         # Insert a miner
         now = dt.datetime.utcnow()
-        now_str = now.strftime("%Y-%m-%d %H:%M:%S.%f")
-        self.test_storage._upsert_miner("test_hotkey", now_str, 1)
+        self.test_storage._upsert_miner("test_hotkey", now, 1)
 
         # Get the last updated
         last_updated = self.test_storage.read_miner_last_updated("test_hotkey2")
@@ -434,6 +606,190 @@ class TestSqliteMemoryValidatorStorage(unittest.TestCase):
         # Confirm the last updated is None.
         self.assertEqual(None, last_updated)
 
+    def test_reinserted_miner_after_delete(self):
+        """Tests that a deleted miner is forgotten and can be stored again."""
+        now = dt.datetime.utcnow()
+        self.test_storage._upsert_miner("test_hotkey", now, 1)
+        self.test_storage.delete_miner("test_hotkey")
+
+        self.assertIsNone(self.test_storage.read_miner_last_updated("test_hotkey"))
+        self.assertIsNone(self.test_storage.read_miner_index("test_hotkey"))
+        self.test_storage._upsert_miner("test_hotkey", now, 1)
+        self.assertEqual(self.test_storage.read_miner_last_updated("test_hotkey"), now)
+
+    def test_storages_are_isolated(self):
+        """Tests that each storage has its own database."""
+        now = dt.datetime.utcnow()
+        self.test_storage._upsert_miner("test_hotkey", now, 1)
+
+        other_storage = SqliteMemoryValidatorStorage()
+        self.assertIsNone(other_storage.read_miner_last_updated("test_hotkey"))
+        self.assertEqual(other_storage._upsert_miner("other_hotkey", now, 1), 1)
+
+    def _snapshot_index(self, label: str, sizes_bytes: List[int]) -> CompressedMinerIndex:
+        time_bucket_id = TimeBucket.from_datetime(dt.datetime.utcnow()).id
+        return CompressedMinerIndex(
+            sources={
+                DataSource.REDDIT.value: [
+                    CompressedEntityBucket(
+                        label=label,
+                        time_bucket_ids=[
+                            time_bucket_id + i for i in range(len(sizes_bytes))
+                        ],
+                        sizes_bytes=sizes_bytes,
+                    )
+                ]
+            }
+        )
+
+    def test_snapshot_roundtrip(self):
+        """Tests that a snapshot restores every miner index, and that the restored storage keeps working."""
+        self.test_storage.upsert_compressed_miner_index(
+            self._snapshot_index("label_1", [100, 200]), "hotkey1", credibility=0.5
+        )
+        self.test_storage.upsert_compressed_miner_index(
+            self._snapshot_index("label_2", [300]), "hotkey2", credibility=1.0
+        )
+        self.test_storage.upsert_compressed_miner_index(
+            self._snapshot_index("label_1", [50]), "hotkey2", credibility=1.0
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "snapshot.sqlite")
+            self.test_storage.save_snapshot(path)
+            restored_storage = SqliteMemoryValidatorStorage()
+            self.assertEqual(
+                restored_storage.load_snapshot(path, dt.timedelta(hours=1)), 2
+            )
+
+        for hotkey in ["hotkey1", "hotkey2"]:
+            self.assertEqual(
+                restored_storage.read_miner_index(hotkey),
+                self.test_storage.read_miner_index(hotkey),
+            )
+
+        # Labels stored before the snapshot keep their ids for new upserts.
+        restored_storage.upsert_compressed_miner_index(
+            self._snapshot_index("label_1", [100]), "hotkey3", credibility=1.0
+        )
+        restored_storage.upsert_compressed_miner_index(
+            self._snapshot_index("label_3", [100]), "hotkey2", credibility=1.0
+        )
+        self.assertEqual(
+            [
+                bucket.label
+                for bucket in restored_storage.read_miner_index(
+                    "hotkey3"
+                ).scorable_data_entity_buckets
+            ],
+            ["label_1"],
+        )
+        self.test_storage = restored_storage
+        self._assert_scorable_bytes_match_recomputed(
+            {"hotkey1": 0.5, "hotkey2": 1.0, "hotkey3": 1.0}
+        )
+
+    def test_upsert_during_snapshot(self):
+        """Tests that upserts complete while a snapshot is being copied, and are included in it."""
+        self.test_storage.upsert_compressed_miner_index(
+            self._snapshot_index("label_1", [100, 200]), "hotkey1", credibility=0.5
+        )
+
+        backup_paused = threading.Event()
+        upserted = threading.Event()
+        release_lock = self.test_storage._release_lock_between_backup_steps
+
+        def pause_first_backup_step(status: int, remaining: int, total: int):
+            if backup_paused.is_set():
+                release_lock(status, remaining, total)
+                return
+            self.test_storage.lock.release()
+            try:
+                backup_paused.set()
+                upserted.wait(timeout=10)
+            finally:
+                self.test_storage.lock.acquire()
+
+        with tempfile.TemporaryDirectory() as directory, patch.object(
+            SqliteMemoryValidatorStorage, "SNAPSHOT_BACKUP_STEP_PAGES", 1
+        ), patch.object(
+            self.test_storage,
+            "_release_lock_between_backup_steps",
+            pause_first_backup_step,
+        ):
+            path = os.path.join(directory, "snapshot.sqlite")
+            snapshot = threading.Thread(target=self.test_storage.save_snapshot, args=(path,))
+            snapshot.start()
+            self.assertTrue(backup_paused.wait(timeout=10))
+
+            self.test_storage.upsert_compressed_miner_index(
+                self._snapshot_index("label_2", [300]), "hotkey2", credibility=1.0
+            )
+            upserted.set()
+            snapshot.join(timeout=10)
+            self.assertFalse(snapshot.is_alive())
+
+            restored_storage = SqliteMemoryValidatorStorage()
+            self.assertEqual(
+                restored_storage.load_snapshot(path, dt.timedelta(hours=1)), 2
+            )
+
+        for hotkey in ["hotkey1", "hotkey2"]:
+            self.assertEqual(
+                restored_storage.read_miner_index(hotkey),
+                self.test_storage.read_miner_index(hotkey),
+            )
+
+    def test_load_snapshot_drops_stale_miners(self):
+        """Tests that miners updated too long ago, or no longer registered, are not restored."""
+        now = dt.datetime.utcnow()
+        for hotkey in ["hotkey1", "hotkey2", "hotkey3"]:
+            self.test_storage.upsert_compressed_miner_index(
+                self._snapshot_index("label_1", [100]), hotkey, credibility=1.0
+            )
+        self.test_storage._upsert_miner("hotkey1", now - dt.timedelta(hours=2), 1.0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "snapshot.sqlite")
+            self.test_storage.save_snapshot(path)
+            restored_storage = SqliteMemoryValidatorStorage()
+            self.assertEqual(
+                restored_storage.load_snapshot(
+                    path, dt.timedelta(hours=1), {"hotkey1", "hotkey2"}
+                ),
+                1,
+            )
+
+        self.assertIsNone(restored_storage.read_miner_index("hotkey1"))
+        self.assertIsNone(restored_storage.read_miner_index("hotkey3"))
+        # The last updated time is kept, so the miner is only re-queried once due.
+        self.assertEqual(
+            restored_storage.read_miner_last_updated("hotkey2"),
+            self.test_storage.read_miner_last_updated("hotkey2"),
+        )
+        # hotkey2 no longer shares the bucket with the dropped miners.
+        self.assertEqual(
+            restored_storage.read_miner_index("hotkey2")
+            .scorable_data_entity_buckets[0]
+            .scorable_bytes,
+            100,
+        )
+
+    def test_load_snapshot_missing_or_invalid(self):
+        """Tests that a missing or unreadable snapshot leaves the storage empty."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "snapshot.sqlite")
+            self.assertEqual(self.test_storage.load_snapshot(path, dt.timedelta(hours=1)), 0)
+
+            with open(path, "w") as f:
+                f.write("not a database")
+            self.assertEqual(self.test_storage.load_snapshot(path, dt.timedelta(hours=1)), 0)
+
+        self.test_storage.upsert_compressed_miner_index(
+            self._snapshot_index("label_1", [100]), "hotkey1", credibility=1.0
+        )
+        self.assertIsNotNone(self.test_storage.read_miner_index("hotkey1"))
+
     @unittest.skip("Skip the multi threaded test by default.")
     def test_multithreaded_inserts(self):
         """In a multi-threaded environment, insert 5 indexes for 5 miners, then read them back and verify they're correct."""
@@ -21,6 +21,7 @@ from common.protocol import GetDataEntityBucket, GetMinerIndex, GetHuggingFaceMe
 from rewards.data_value_calculator import DataValueCalculator
 from scraping.provider import ScraperProvider
 from scraping.scraper import ScraperId, ValidationResult
+from storage.validator.numpy_validator_storage import NumpyValidatorStorage
 from storage.validator.sqlite_memory_validator_storage import (
     SqliteMemoryValidatorStorage,
 )
@@ -47,6 +48,8 @@ class MinerEvaluator:
     """MinerEvaluator is responsible for evaluating miners and updating their scores."""
 
     SCORER_FILENAME = "scorer.pickle"
+    INDEX_SNAPSHOT_FILENAME = "validator_index_snapshot.sqlite"
+    NUMPY_INDEX_SNAPSHOT_FILENAME = "validator_index_snapshot.npz"
 
     # Mapping of scrapers to use based on the data source to validate.
     PREFERRED_SCRAPERS = {
@@ -73,8 +76,15 @@ class MinerEvaluator:
             utils.get_miner_uids(self.metagraph, self.uid)
         )
         self.scraper_provider = ScraperProvider()
-        self.storage = SqliteMemoryValidatorStorage()
+        self.storage = (
+            NumpyValidatorStorage()
+            if self.config.neuron.numpy_validator_storage
+            else SqliteMemoryValidatorStorage()
+        )
         self.hf_storage = HFValidationStorage(self.config.hf_results_path)
+        # Miner indexes are snapshotted in the background, so a restart does not need to re-query every miner.
+        self.index_snapshot_thread: Optional[threading.Thread] = None
+        self.last_index_snapshot = dt.datetime.now(tz=dt.timezone.utc)
         # Instantiate runners
         self.should_exit: bool = False
         self.is_running: bool = False
@@ -350,6 +360,8 @@ class MinerEvaluator:
             timeout = max(0, (end - datetime.datetime.now()).total_seconds())
             t.join(timeout=timeout)
         bt.logging.trace(f"Finished waiting for {len(threads)} miner eval.")
+        if isinstance(self.storage, SqliteMemoryValidatorStorage):
+            bt.logging.debug(f"Miner index upserts: {self.storage.get_upsert_stats()}")
 
         # Run the next evaluation batch immediately.
         return 0
@@ -365,12 +377,51 @@ class MinerEvaluator:
         self.scorer.save_state(
             os.path.join(self.config.neuron.full_path, MinerEvaluator.SCORER_FILENAME)
         )
+        self._maybe_snapshot_index()
+
+    def _index_snapshot_path(self) -> str:
+        # Each storage backend has its own snapshot format, so switching backends starts from an empty index.
+        filename = (
+            MinerEvaluator.NUMPY_INDEX_SNAPSHOT_FILENAME
+            if isinstance(self.storage, NumpyValidatorStorage)
+            else MinerEvaluator.INDEX_SNAPSHOT_FILENAME
+        )
+        return os.path.join(self.config.neuron.full_path, filename)
+
+    def _maybe_snapshot_index(self):
+        """Starts a background snapshot of the miner indexes if one is due and none is running."""
+        if self.index_snapshot_thread is not None and self.index_snapshot_thread.is_alive():
+            return
+        now = dt.datetime.now(tz=dt.timezone.utc)
+        if now - self.last_index_snapshot < constants.VALIDATOR_INDEX_SNAPSHOT_PERIOD:
+            return
+
+        self.last_index_snapshot = now
+        self.index_snapshot_thread = threading.Thread(
+            target=self._snapshot_index, daemon=True
+        )
+        self.index_snapshot_thread.start()
+
+    def _snapshot_index(self):
+        try:
+            self.storage.save_snapshot(self._index_snapshot_path())
+        except Exception:
+            bt.logging.warning(
+                f"Failed to snapshot the miner indexes: {traceback.format_exc()}"
+            )
 
     def load_state(self):
         """Loads the state of the validator from a file."""
         bt.logging.info("Loading evaluator state.")
 
         with self.lock:
+            # Restore the miner indexes, so only miners that are due get re-queried.
+            self.storage.load_snapshot(
+                self._index_snapshot_path(),
+                constants.VALIDATOR_INDEX_SNAPSHOT_MAX_MINER_AGE,
+                set(self.metagraph.hotkeys),
+            )
+
             # Load the state of the validator from file.
             filepath = os.path.join(
                 self.config.neuron.full_path, MinerEvaluator.SCORER_FILENAME